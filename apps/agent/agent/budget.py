@@ -0,0 +1,134 @@
+"""Per-visitor spend budgets charged by tokens and tool calls.
+
+The request limiter (agent.rate_limit) counts messages; one message can still
+run MAX_STEPS LLM calls, several web searches, and a long completion. Budgets
+charge what a request actually consumed (runner usage: total tokens plus
+BUDGET_TOOL_CALL_TOKENS per tool invocation) against four token buckets:
+per client IP and per profile, each hourly and daily.
+
+Budgets never reject a request. As the tightest bucket drains, service
+degrades instead:
+- full: normal model and tools.
+- reduced (<= BUDGET_DEGRADE_FRACTION left): fast mode, no web_search.
+- minimal (exhausted): fast mode, no web_search or schedule_meeting.
+
+Private context (Bill) is exempt. Buckets reuse RateLimiter, so they are shared
+across workers by the same RATE_LIMIT_BACKEND sync.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Any
+
+from agent.rate_limit import RateLimiter
+
+# Token budgets (0 = no budget for that bucket).
+BUDGET_IP_TOKENS_PER_HOUR = int(os.environ.get("BUDGET_IP_TOKENS_PER_HOUR", "150000"))
+BUDGET_IP_TOKENS_PER_DAY = int(os.environ.get("BUDGET_IP_TOKENS_PER_DAY", "600000"))
+BUDGET_PROFILE_TOKENS_PER_HOUR = int(os.environ.get("BUDGET_PROFILE_TOKENS_PER_HOUR", "100000"))
+BUDGET_PROFILE_TOKENS_PER_DAY = int(os.environ.get("BUDGET_PROFILE_TOKENS_PER_DAY", "400000"))
+BUDGET_TOOL_CALL_TOKENS = int(os.environ.get("BUDGET_TOOL_CALL_TOKENS", "1000"))
+BUDGET_DEGRADE_FRACTION = float(os.environ.get("BUDGET_DEGRADE_FRACTION", "0.25"))
+
+TIER_FULL = "full"
+TIER_REDUCED = "reduced"
+TIER_MINIMAL = "minimal"
+
+_REDUCED_DISABLED_TOOLS = frozenset({"web_search"})
+_MINIMAL_DISABLED_TOOLS = frozenset({"web_search", "schedule_meeting"})
+
+_HOUR = 3600
+_DAY = 86400
+
+
+@dataclass(frozen=True)
+class BudgetDecision:
+    """How to serve a request given the caller's remaining budget."""
+
+    tier: str = TIER_FULL
+    remaining_fraction: float = 1.0
+    fast_mode: bool = False
+    disabled_tools: frozenset[str] = frozenset()
+
+
+_FULL = BudgetDecision()
+
+
+class SpendBudgets:
+    """Hourly and daily token budgets per client IP and per profile."""
+
+    def __init__(
+        self,
+        ip_per_hour: int = BUDGET_IP_TOKENS_PER_HOUR,
+        ip_per_day: int = BUDGET_IP_TOKENS_PER_DAY,
+        profile_per_hour: int = BUDGET_PROFILE_TOKENS_PER_HOUR,
+        profile_per_day: int = BUDGET_PROFILE_TOKENS_PER_DAY,
+        degrade_fraction: float = BUDGET_DEGRADE_FRACTION,
+    ) -> None:
+        # (key prefix, limiter); only the "public" context is budgeted.
+        self._buckets: list[tuple[str, str, RateLimiter]] = [
+            ("ip", "budget:ip:hour:", RateLimiter(_HOUR, ip_per_hour, 0)),
+            ("ip", "budget:ip:day:", RateLimiter(_DAY, ip_per_day, 0)),
+            ("profile", "budget:profile:hour:", RateLimiter(_HOUR, profile_per_hour, 0)),
+            ("profile", "budget:profile:day:", RateLimiter(_DAY, profile_per_day, 0)),
+        ]
+        self._degrade_fraction = degrade_fraction
+
+    @property
+    def limiters(self) -> list[RateLimiter]:
+        """Underlying buckets (for shared-backend sync)."""
+        return [limiter for _, _, limiter in self._buckets]
+
+    def _keys(self, client_id: str, profile_id: Any) -> list[tuple[RateLimiter, str]]:
+        ids = {"ip": client_id, "profile": str(profile_id) if profile_id else None}
+        return [
+            (limiter, prefix + ids[kind])
+            for kind, prefix, limiter in self._buckets
+            if ids[kind]
+        ]
+
+    def check(self, client_id: str, profile_id: Any, context: str) -> BudgetDecision:
+        """Return the service tier for the caller's tightest remaining budget."""
+        if context == "private":
+            return _FULL
+        fraction = 1.0
+        for limiter, key in self._keys(client_id, profile_id):
+            capacity = limiter.limit("public")
+            remaining = limiter.remaining(key, "public")
+            if capacity > 0 and remaining is not None:
+                fraction = min(fraction, remaining / capacity)
+        if fraction <= 0:
+            return BudgetDecision(TIER_MINIMAL, 0.0, True, _MINIMAL_DISABLED_TOOLS)
+        if fraction <= self._degrade_fraction:
+            return BudgetDecision(TIER_REDUCED, fraction, True, _REDUCED_DISABLED_TOOLS)
+        return BudgetDecision(TIER_FULL, fraction)
+
+    def charge(
+        self,
+        client_id: str,
+        profile_id: Any,
+        context: str,
+        usage: dict[str, Any],
+    ) -> int:
+        """Charge a finished request's usage (runner usage dict). Returns tokens charged."""
+        if context == "private":
+            return 0
+        cost = int(usage.get("total_tokens", 0)) + BUDGET_TOOL_CALL_TOKENS * int(usage.get("tool_calls", 0))
+        if cost <= 0:
+            return 0
+        for limiter, key in self._keys(client_id, profile_id):
+            limiter.charge(key, "public", cost)
+        return cost
+
+
+_budgets: SpendBudgets | None = None
+
+
+def get_budgets() -> SpendBudgets:
+    """Return the global spend budgets instance."""
+    global _budgets
+    if _budgets is None:
+        _budgets = SpendBudgets()
+    return _budgets
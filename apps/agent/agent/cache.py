@@ -1,20 +1,39 @@
-"""Optional in-memory TTL cache for profile and web search results.
+"""Optional in-memory TTL cache for profile and web search results, and the
+memory retrieval cache.
 
-Used when PROFILE_CACHE_TTL_SECONDS or SEARCH_CACHE_TTL_SECONDS are set.
+Used when PROFILE_CACHE_TTL_SECONDS or SEARCH_CACHE_TTL_SECONDS are set; memory
+results are cached unless MEMORY_CACHE_TTL_SECONDS=0.
 Thread-safe; per-process (not shared across workers).
 """
 
 from __future__ import annotations
 
+import math
+import os
+import re
 import threading
 import time
+from collections import OrderedDict, deque
 from typing import Any
 
+from agent.metrics import MEMORY_CACHE_SAVED_SECONDS, record_cache_lookup
+
+MEMORY_CACHE_TTL_SECONDS = float(os.environ.get("MEMORY_CACHE_TTL_SECONDS", "600"))
+MEMORY_CACHE_MAX_ENTRIES = int(os.environ.get("MEMORY_CACHE_MAX_ENTRIES", "5000"))
+# Reuse results for a query whose embedding is at least this similar (0 = exact match only).
+MEMORY_CACHE_SIMILARITY = float(os.environ.get("MEMORY_CACHE_SIMILARITY", "0"))
+# Recent query embeddings kept per scope for similarity lookups.
+MEMORY_CACHE_SEMANTIC_PER_SCOPE = 16
+
 
 class TTLCache:
-    """In-memory cache with per-entry TTL. Thread-safe."""
+    """In-memory cache with per-entry TTL. Thread-safe.
+
+    Lookups are counted per cache name in /metrics (agent_cache_requests_total).
+    """
 
-    def __init__(self) -> None:
+    def __init__(self, name: str = "default") -> None:
+        self.name = name
         self._data: dict[str, tuple[Any, float]] = {}
         self._lock = threading.Lock()
 
@@ -22,13 +41,11 @@ class TTLCache:
         """Return cached value if present and not expired; else None."""
         with self._lock:
             entry = self._data.get(key)
-            if entry is None:
-                return None
-            value, expiry = entry
-            if time.monotonic() >= expiry:
+            if entry is not None and time.monotonic() >= entry[1]:
                 del self._data[key]
-                return None
-            return value
+                entry = None
+        record_cache_lookup(self.name, entry is not None)
+        return entry[0] if entry is not None else None
 
     def set(self, key: str, value: Any, ttl_seconds: float) -> None:
         """Store value with given TTL in seconds."""
@@ -46,7 +63,7 @@ def get_profile_cache() -> TTLCache:
     """Return shared profile cache singleton."""
     global _profile_cache
     if _profile_cache is None:
-        _profile_cache = TTLCache()
+        _profile_cache = TTLCache("profile")
     return _profile_cache
 
 
@@ -57,5 +74,186 @@ def get_search_cache() -> TTLCache:
     """Return shared search cache singleton."""
     global _search_cache
     if _search_cache is None:
-        _search_cache = TTLCache()
+        _search_cache = TTLCache("search")
     return _search_cache
+
+
+def normalize_query(query: str) -> str:
+    """Case-, whitespace- and edge-punctuation-insensitive cache key for a query."""
+    return re.sub(r"\s+", " ", query).strip().strip("?!.,;:").strip().casefold()
+
+
+def cosine_similarity(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class MemoryResultCache:
+    """Memory search results keyed by (scope, memory version, normalized query).
+
+    add_memory bumps a scope's version when its memories change, so cached
+    results are never served across a write in this process. Versions come
+    from one counter shared by all scopes, so a version number is never
+    reused. Other workers' writes are only picked up when entries expire
+    (MEMORY_CACHE_TTL_SECONDS). With a similarity threshold, a query whose
+    embedding is close enough to a recently cached query in the same scope
+    and version, with the same top_k, reuses its results.
+    Thread-safe.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = MEMORY_CACHE_TTL_SECONDS,
+        max_entries: int = MEMORY_CACHE_MAX_ENTRIES,
+        similarity: float = MEMORY_CACHE_SIMILARITY,
+        semantic_per_scope: int = MEMORY_CACHE_SEMANTIC_PER_SCOPE,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self._max_entries = max_entries
+        self._semantic_per_scope = semantic_per_scope
+        self._lock = threading.Lock()
+        # (scope, version, key) -> (results, expiry, search_ms)
+        self._entries: OrderedDict[tuple[str, int, str], tuple[list[str], float, float]] = OrderedDict()
+        # scope -> recent (version, top_k, embedding, results, expiry, search_ms)
+        self._semantic: OrderedDict[str, deque] = OrderedDict()
+        # scope -> (version, bumped_at); versions are drawn from _last_version
+        self._versions: dict[str, tuple[int, float]] = {}
+        self._last_version = 0
+        self._hits = {"exact": 0, "semantic": 0}
+        self._misses = 0
+        self._saved_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.enabled and self.similarity > 0
+
+    def _version(self, scope: str) -> int:
+        entry = self._versions.get(scope)
+        return entry[0] if entry else 0
+
+    def version(self, scope: str) -> int:
+        """Current memory version of scope (0 until its first write)."""
+        with self._lock:
+            return self._version(scope)
+
+    def bump(self, scope: str) -> None:
+        """Invalidate scope's cached results (its memories changed)."""
+        now = time.monotonic()
+        with self._lock:
+            self._last_version += 1
+            self._versions[scope] = (self._last_version, now)
+            self._semantic.pop(scope, None)
+            if len(self._versions) > self._max_entries:
+                # Safe to forget versions bumped over a TTL ago: the scope falls
+                # back to 0, whose entries predate its first bump and have
+                # expired, and its next bump takes a number never used before.
+                horizon = now - self.ttl_seconds
+                for stale in [s for s, (_, at) in self._versions.items() if at < horizon]:
+                    del self._versions[stale]
+
+    def _hit(self, kind: str, search_ms: float) -> None:
+        self._hits[kind] += 1
+        self._saved_ms += search_ms
+        MEMORY_CACHE_SAVED_SECONDS.inc(amount=search_ms / 1000)
+
+    def get(self, scope: str, version: int, key: str) -> list[str] | None:
+        """Exact lookup; key is normalize_query(query) plus anything else that shapes results."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((scope, version, key))
+            if entry is not None and now >= entry[1]:
+                del self._entries[(scope, version, key)]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end((scope, version, key))
+                self._hit("exact", entry[2])
+        record_cache_lookup("memory", entry is not None)
+        return entry[0] if entry is not None else None
+
+    def get_similar(self, scope: str, version: int, embedding: list[float], top_k: int | None = None) -> list[str] | None:
+        """Results of the most similar recent query in scope at this version and top_k, if above the threshold."""
+        if not self.semantic_enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            candidates = list(self._semantic.get(scope, ()))
+        best, best_score = None, self.similarity
+        for cached_version, cached_top_k, cached_embedding, results, expiry, search_ms in candidates:
+            if cached_version != version or cached_top_k != top_k or now >= expiry:
+                continue
+            score = cosine_similarity(embedding, cached_embedding)
+            if score >= best_score:
+                best, best_score = (results, search_ms), score
+        if best is not None:
+            with self._lock:
+                self._hit("semantic", best[1])
+        record_cache_lookup("memory_semantic", best is not None)
+        return best[0] if best is not None else None
+
+    def put(
+        self,
+        scope: str,
+        version: int,
+        key: str,
+        results: list[str],
+        search_ms: float,
+        embedding: list[float] | None = None,
+        top_k: int | None = None,
+    ) -> None:
+        """Cache results of a search that took search_ms (counted as saved on later hits).
+
+        top_k is stored with the embedding, so get_similar only reuses results
+        of a search with the same limit (the exact key already includes it).
+        """
+        if not self.enabled:
+            return
+        expiry = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._misses += 1
+            if self._version(scope) != version:
+                return  # a write landed while searching; these results may be stale
+            self._entries[(scope, version, key)] = (results, expiry, search_ms)
+            self._entries.move_to_end((scope, version, key))
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+            if embedding is not None and self.semantic_enabled:
+                recent = self._semantic.get(scope)
+                if recent is None:
+                    recent = self._semantic[scope] = deque(maxlen=self._semantic_per_scope)
+                self._semantic.move_to_end(scope)
+                recent.append((version, top_k, embedding, results, expiry, search_ms))
+                while len(self._semantic) > self._max_entries // self._semantic_per_scope + 1:
+                    self._semantic.popitem(last=False)
+
+    def stats(self) -> dict[str, Any]:
+        """Hit rates and latency saved by serving cached results."""
+        with self._lock:
+            hits = self._hits["exact"] + self._hits["semantic"]
+            lookups = hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits_exact": self._hits["exact"],
+                "hits_semantic": self._hits["semantic"],
+                "misses": self._misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "saved_ms": round(self._saved_ms, 1),
+            }
+
+
+_memory_cache: MemoryResultCache | None = None
+
+
+def get_memory_cache() -> MemoryResultCache:
+    """Return shared memory result cache singleton."""
+    global _memory_cache
+    if _memory_cache is None:
+        _memory_cache = MemoryResultCache()
+    return _memory_cache
@@ -54,3 +54,23 @@ def get_model() -> str:
 def enable_fast_mode() -> bool:
     """Return true if FAST_MODE=true (uses gpt-4o-mini with lower max_tokens)."""
     return os.environ.get("FAST_MODE", "false").strip().lower() in ("true", "1", "yes")
+
+
+def get_fast_model() -> str:
+    """Return FAST_MODEL from env (default: gpt-4o-mini); used when fast mode is on."""
+    return os.environ.get("FAST_MODEL", "gpt-4o-mini")
+
+
+def get_embedding_model() -> str:
+    """Return EMBEDDING_MODEL from env (default: text-embedding-3-small)."""
+    return os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+
+
+def get_fast_max_tokens() -> int:
+    """Return FAST_MODE_MAX_TOKENS from env (default: 300); completion cap in fast mode."""
+    return int(os.environ.get("FAST_MODE_MAX_TOKENS", "300"))
+
+
+def get_admin_api_token() -> str | None:
+    """Return ADMIN_API_TOKEN from env (None = admin endpoints disabled)."""
+    return os.environ.get("ADMIN_API_TOKEN", "").strip() or None
@@ -0,0 +1,82 @@
+"""End-to-end time budget for one chat request.
+
+main.py creates one Deadline per request and hands it to every stage: profile
+lookup, memory search, each LLM step (a streamed step is bounded from create()
+through the last chunk) and each tool. A stage waits at most
+min(its own timeout, time left), so one request can't run for
+MAX_STEPS x OPENAI_TIMEOUT_SECONDS.
+
+When the budget runs low the request degrades instead of overrunning:
+- profile lookup and memory search that don't finish in their slice are
+  dropped (the agent answers without visitor context)
+- web_search is skipped once less than DEADLINE_WEB_SEARCH_SECONDS remain;
+  a read-only tool still running at the deadline is abandoned, and the
+  step's later read-only tools are skipped
+- below DEADLINE_FINAL_ANSWER_SECONDS the next LLM step can't call tools
+  (tool_choice="none"), which forces a final answer
+
+Side-effecting tools (send_email, schedule_meeting) are never skipped or cut
+short once the model asked for them. Degradations are recorded on the
+Deadline, so main.py doesn't cache a degraded answer.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Callable
+
+# 0 = no request deadline (stages keep their own timeouts)
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "45"))
+# Longest profile lookup or memory search before answering without it
+DEADLINE_CONTEXT_SECONDS = float(os.environ.get("DEADLINE_CONTEXT_SECONDS", "5"))
+DEADLINE_WEB_SEARCH_SECONDS = float(os.environ.get("DEADLINE_WEB_SEARCH_SECONDS", "12"))
+DEADLINE_FINAL_ANSWER_SECONDS = float(os.environ.get("DEADLINE_FINAL_ANSWER_SECONDS", "8"))
+
+
+class Deadline:
+    """Time left for one request, shared by all its stages."""
+
+    def __init__(
+        self,
+        seconds: float = REQUEST_DEADLINE_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.seconds = seconds
+        self._clock = clock
+        self._expires_at = clock() + seconds if seconds > 0 else float("inf")
+        self.degraded: list[str] = []
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self._expires_at - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining <= 0
+
+    def allows(self, seconds: float) -> bool:
+        """True if at least seconds are left."""
+        return self.remaining >= seconds
+
+    def timeout(self, cap: float | None = None) -> float | None:
+        """Seconds a stage may wait: time left, at most cap (None: unbounded)."""
+        remaining = self.remaining
+        if cap is not None:
+            remaining = min(remaining, cap)
+        return None if remaining == float("inf") else remaining
+
+    def at(self, cap: float | None = None) -> float | None:
+        """Event-loop time a stage must end by, for asyncio.timeout_at (None: unbounded)."""
+        timeout = self.timeout(cap)
+        return None if timeout is None else asyncio.get_running_loop().time() + timeout
+
+    def scope(self, cap: float | None = None) -> asyncio.Timeout:
+        """asyncio.timeout for a stage (raises TimeoutError when its slice runs out)."""
+        return asyncio.timeout(self.timeout(cap))
+
+    def degrade(self, reason: str) -> None:
+        """Record that a stage was skipped or cut short to stay within the deadline."""
+        if reason not in self.degraded:
+            self.degraded.append(reason)
@@ -0,0 +1,344 @@
+"""Content-addressed embedding cache shared by the memory layer and semantic caches.
+
+Texts are keyed by sha256(model, text). Lookups go to an in-process LRU, then
+to an optional on-disk store (EMBEDDING_CACHE_DIR) shared by all workers on the
+host, and only then to the embeddings API: the misses of one call go out as
+batched requests (EMBEDDING_BATCH_SIZE inputs each).
+
+On-disk layout, one pair of files per model:
+- <model>.idx: 16-byte header (magic, format version, dimensions), then one
+  16-byte digest per row, in row order
+- <model>.f32: float32 vectors (native byte order), row-major, read through mmap
+Writers append under an exclusive flock, writing the vector before its digest,
+so every indexed row is complete. Readers load rows appended by other workers
+on a miss. The store only grows (up to EMBEDDING_CACHE_MAX_ROWS); delete the
+directory to reset it.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from agent.config import get_embedding_model
+from agent.metrics import record_cache_lookup
+from agent.usage import SOURCE_MEMORY, get_usage_tracker, usage_from_response
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096"))
+# Directory for the on-disk store shared by workers ("" = in-process LRU only).
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", "").strip()
+EMBEDDING_CACHE_MAX_ROWS = int(os.environ.get("EMBEDDING_CACHE_MAX_ROWS", "500000"))
+# Max inputs per embeddings request (the OpenAI API accepts up to 2048).
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "256"))
+
+_MAGIC = b"EMBC"
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sII4x")
+_DIGEST_SIZE = 16
+_FLOAT_SIZE = 4
+
+
+def content_key(model: str, text: str) -> bytes:
+    """Cache key for text embedded with model."""
+    return hashlib.sha256(f"{model}\0{text}".encode()).digest()[:_DIGEST_SIZE]
+
+
+class EmbeddingStore:
+    """Append-only on-disk vectors for one model, memory-mapped for reads. Thread-safe."""
+
+    def __init__(self, directory: str | Path, model: str, max_rows: int = EMBEDDING_CACHE_MAX_ROWS) -> None:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9._-]", "_", model)
+        self._index_path = directory / f"{name}.idx"
+        self._vectors_path = directory / f"{name}.f32"
+        self._max_rows = max_rows
+        self._lock = threading.Lock()
+        self.dimensions: int | None = None
+        self._rows: dict[bytes, int] = {}
+        self._indexed = 0
+        self._mmap: mmap.mmap | None = None
+        self._view: memoryview | None = None
+        with self._lock:
+            self._refresh()
+
+    def __len__(self) -> int:
+        return self._indexed
+
+    def _read_header(self, header: bytes) -> bool:
+        if len(header) < _HEADER.size:
+            return False
+        magic, version, dimensions = _HEADER.unpack(header[:_HEADER.size])
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError(f"{self._index_path} is not an embedding index (format {_FORMAT_VERSION})")
+        self.dimensions = dimensions
+        return True
+
+    def _refresh(self) -> None:
+        """Load index rows appended since the last read (by any worker)."""
+        try:
+            with open(self._index_path, "rb") as f:
+                if self.dimensions is None and not self._read_header(f.read(_HEADER.size)):
+                    return
+                f.seek(_HEADER.size + self._indexed * _DIGEST_SIZE)
+                tail = f.read()
+        except FileNotFoundError:
+            return
+        # A trailing partial digest is a crashed append; it is overwritten by the next one
+        for offset in range(0, len(tail) - _DIGEST_SIZE + 1, _DIGEST_SIZE):
+            self._rows.setdefault(tail[offset:offset + _DIGEST_SIZE], self._indexed)
+            self._indexed += 1
+
+    def _vector(self, row: int) -> list[float]:
+        dimensions = self.dimensions or 0
+        end = (row + 1) * dimensions
+        if self._view is None or len(self._view) < end:
+            self._remap()
+        return self._view[row * dimensions:end].tolist()
+
+    def _remap(self) -> None:
+        self._unmap()
+        with open(self._vectors_path, "rb") as f:
+            length = self._indexed * (self.dimensions or 0) * _FLOAT_SIZE
+            self._mmap = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap).cast("f")
+
+    def _unmap(self) -> None:
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def get_many(self, keys: list[bytes]) -> list[list[float] | None]:
+        """Vectors for keys (None where not stored)."""
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                self._refresh()
+            rows = [self._rows.get(key) for key in keys]
+            return [self._vector(row) if row is not None else None for row in rows]
+
+    def put_many(self, items: list[tuple[bytes, list[float]]]) -> int:
+        """Append vectors not stored yet; returns how many rows were written."""
+        if not items:
+            return 0
+        dimensions = len(items[0][1])
+        with self._lock:
+            index_fd = os.open(self._index_path, os.O_RDWR | os.O_CREAT, 0o644)
+            vectors_fd = os.open(self._vectors_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(index_fd, fcntl.LOCK_EX)
+                if self.dimensions is None and not self._read_header(os.pread(index_fd, _HEADER.size, 0)):
+                    os.pwrite(index_fd, _HEADER.pack(_MAGIC, _FORMAT_VERSION, dimensions), 0)
+                    self.dimensions = dimensions
+                if dimensions != self.dimensions:
+                    logger.warning("Embedding store %s holds %d-d vectors, got %d-d; not stored",
+                                   self._index_path, self.dimensions, dimensions)
+                    return 0
+                self._refresh()
+                new: dict[bytes, list[float]] = {}
+                for key, vector in items:
+                    if key not in self._rows and len(vector) == dimensions:
+                        new.setdefault(key, vector)
+                new_items = list(new.items())[:max(0, self._max_rows - self._indexed)]
+                if not new_items:
+                    return 0
+                row = self._indexed
+                vectors = array("f", (x for _, vector in new_items for x in vector))
+                os.pwrite(vectors_fd, vectors.tobytes(), row * dimensions * _FLOAT_SIZE)
+                os.pwrite(index_fd, b"".join(key for key, _ in new_items), _HEADER.size + row * _DIGEST_SIZE)
+                for key, _ in new_items:
+                    self._rows[key] = row
+                    row += 1
+                self._indexed = row
+                return len(new_items)
+            finally:
+                fcntl.flock(index_fd, fcntl.LOCK_UN)
+                os.close(vectors_fd)
+                os.close(index_fd)
+
+    def close(self) -> None:
+        with self._lock:
+            self._unmap()
+
+
+class EmbeddingCache:
+    """Embeddings through LRU -> on-disk store -> API, for one OpenAI-compatible client.
+
+    Thread-safe for lookup/store (Mem0 embeds from worker threads); embed is async.
+    """
+
+    def __init__(
+        self,
+        client: Any = None,
+        directory: str = EMBEDDING_CACHE_DIR,
+        max_entries: int = EMBEDDING_CACHE_SIZE,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+    ) -> None:
+        self.client = client
+        self._directory = directory
+        self._max_entries = max_entries
+        self._batch_size = max(1, batch_size)
+        self._lock = threading.Lock()
+        self._lru: OrderedDict[bytes, list[float]] = OrderedDict()
+        self._stores: dict[str, EmbeddingStore | None] = {}
+        self._stats = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "api_calls": 0}
+
+    def _store(self, model: str) -> EmbeddingStore | None:
+        if not self._directory:
+            return None
+        with self._lock:
+            if model not in self._stores:
+                try:
+                    self._stores[model] = EmbeddingStore(self._directory, model)
+                except (OSError, ValueError) as e:
+                    logger.warning("Embedding disk cache unavailable for %s: %s", model, e)
+                    self._stores[model] = None
+            return self._stores[model]
+
+    def lookup(self, model: str, texts: list[str]) -> list[list[float] | None]:
+        """Cached vectors for texts (None where missing); doesn't call the API."""
+        keys = [content_key(model, text) for text in texts]
+        found: list[list[float] | None] = []
+        with self._lock:
+            for key in keys:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                found.append(vector)
+            self._stats["hits_memory"] += sum(v is not None for v in found)
+        for vector in found:
+            record_cache_lookup("embedding", vector is not None)
+
+        missing = [i for i, vector in enumerate(found) if vector is None]
+        store = self._store(model) if missing else None
+        if store is not None:
+            try:
+                stored = store.get_many([keys[i] for i in missing])
+            except (OSError, ValueError) as e:
+                logger.warning("Embedding disk cache read failed: %s", e)
+                stored = [None] * len(missing)
+            for i, vector in zip(missing, stored):
+                record_cache_lookup("embedding_disk", vector is not None)
+                if vector is not None:
+                    found[i] = vector
+            disk_hits = [(keys[i], found[i]) for i in missing if found[i] is not None]
+            self._remember(disk_hits)
+            with self._lock:
+                self._stats["hits_disk"] += len(disk_hits)
+        with self._lock:
+            self._stats["misses"] += sum(v is None for v in found)
+        return found
+
+    def _remember(self, items: list[tuple[bytes, list[float]]]) -> None:
+        with self._lock:
+            for key, vector in items:
+                self._lru[key] = vector
+                self._lru.move_to_end(key)
+            while len(self._lru) > self._max_entries:
+                self._lru.popitem(last=False)
+
+    def store(self, model: str, texts: list[str], vectors: list[list[float]]) -> None:
+        """Cache vectors computed elsewhere (e.g. by Mem0's embedder)."""
+        items = [(content_key(model, text), vector) for text, vector in zip(texts, vectors)]
+        self._remember(items)
+        store = self._store(model)
+        if store is not None:
+            try:
+                store.put_many(items)
+            except OSError as e:
+                logger.warning("Embedding disk cache write failed: %s", e)
+
+    async def embed(
+        self,
+        texts: list[str],
+        model: str | None = None,
+        source: str = SOURCE_MEMORY,
+        profile_id: str | None = None,
+    ) -> list[list[float]]:
+        """Vectors for texts, in order; only uncached texts are sent, in batched requests."""
+        model = model or get_embedding_model()
+        found = self.lookup(model, texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, found) if vector is None))
+        if not missing:
+            return found  # type: ignore[return-value]
+        if self.client is None:
+            raise RuntimeError("Embedding cache has no client for uncached texts")
+        computed: dict[str, list[float]] = {}
+        for start in range(0, len(missing), self._batch_size):
+            batch = missing[start:start + self._batch_size]
+            response = await self.client.embeddings.create(model=model, input=batch)
+            with self._lock:
+                self._stats["api_calls"] += 1
+            recorded = usage_from_response(response.usage, model)
+            if recorded is not None:
+                get_usage_tracker().record(recorded, model=model, source=source, profile_id=profile_id)
+            for text, item in zip(batch, sorted(response.data, key=lambda item: item.index)):
+                computed[text] = item.embedding
+        self.store(model, list(computed), list(computed.values()))
+        return [vector if vector is not None else computed[text] for text, vector in zip(texts, found)]
+
+    def stats(self) -> dict[str, Any]:
+        """Hit counts per tier, for /health."""
+        with self._lock:
+            stores = {model: len(store) for model, store in self._stores.items() if store is not None}
+            return {**self._stats, "memory_entries": len(self._lru), "disk_rows": stores}
+
+    def close(self) -> None:
+        with self._lock:
+            for store in self._stores.values():
+                if store is not None:
+                    store.close()
+
+
+class CachedEmbedder:
+    """Mem0 embedder wrapper: embed(text, memory_action) served from the shared cache.
+
+    Only for embedders that ignore memory_action (OpenAI), since it isn't part of the key.
+    """
+
+    def __init__(self, inner: Any, cache: EmbeddingCache, model: str) -> None:
+        self._inner = inner
+        self._cache = cache
+        self._model = model
+
+    def embed(self, text: str, memory_action: str | None = None) -> list[float]:
+        vector = self._cache.lookup(self._model, [text])[0]
+        if vector is None:
+            vector = self._inner.embed(text, memory_action)
+            self._cache.store(self._model, [text], [vector])
+        return vector
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+
+_embedding_cache: EmbeddingCache | None = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return shared embedding cache singleton (set its client with init_embedding_cache)."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+
+def init_embedding_cache(client: Any) -> EmbeddingCache:
+    """Point the shared cache at the app's OpenAI client (call once at startup)."""
+    cache = get_embedding_cache()
+    cache.client = client
+    return cache
@@ -1,23 +1,62 @@
-"""Memory layer using Mem0 OSS: add and search by session_id.
+"""Memory layer: remember facts from past turns and recall them per query.
 
-Mem0 extracts facts from conversation turns (add) and returns relevant
-memories for a query (search). Scoped by session_id so each chat session
-has its own memory. Disabled when MEMORY_ENABLED=false or mem0ai not installed.
-See docs.mem0.ai (open-source Python quickstart).
+Pluggable backends, selected with MEMORY_BACKEND:
+- mem0 (default): Mem0 OSS. Its own LLM extraction and embedding calls on each
+  add and its own vector store on each search. Mem0's client is synchronous, so
+  calls run in a worker thread.
+- postgres: facts in our own Postgres (apps/web/scripts/create-facts-table.sql).
+  add runs the extraction pre-filter (extractors/prefilter.py), one fast-model
+  call only when the turn says something about the visitor, and embeds new facts
+  in batches; search is one facts query scoped by profile_id
+  (PostgresDB.search_facts): GIN-indexed full text, fused with cosine
+  similarity over the text hits and the profile's most recent embedded facts,
+  scored with numpy in a worker thread.
+
+Memory is scoped per visitor (main.py passes profile_id). Disabled when
+MEMORY_ENABLED=false or the backend can't start (e.g. mem0ai not installed).
+add_memory never blocks the request; pending adds are drained on shutdown.
+
+Embeddings go through the content-addressed cache in agent/embeddings.py (both
+backends), so repeated texts such as the "recent context" fallback query are
+embedded once per host.
+
+search_memory results are cached per visitor (agent/cache.MemoryResultCache),
+keyed by the visitor's memory version, which writes bump, so a turn never
+misses a fact stored in this process. MEMORY_CACHE_SIMILARITY also reuses
+results for near-duplicate queries, compared by the backend's query embedding.
+See docs.mem0.ai (open-source Python quickstart) for Mem0.
 """
 
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
 import os
 import time
+from abc import ABC, abstractmethod
 from typing import Any
 
+from agent.cache import get_memory_cache, normalize_query
+from agent.config import get_embedding_model, get_fast_model
+from agent.embeddings import CachedEmbedder, EmbeddingCache, get_embedding_cache, init_embedding_cache
+from agent.tracing import get_tracer
+from agent.usage import SOURCE_MEMORY, get_usage_tracker, usage_from_response
+from extractors.prefilter import prefilter_message
+
 logger = logging.getLogger(__name__)
-perf_logger = logging.getLogger("agent.performance")
+
+MEMORY_BACKEND = os.environ.get("MEMORY_BACKEND", "mem0").strip().lower()
+# Postgres backend: embed new facts once this many are pending, or after N seconds.
+MEMORY_EMBED_BATCH_SIZE = int(os.environ.get("MEMORY_EMBED_BATCH_SIZE", "64"))
+MEMORY_EMBED_BATCH_SECONDS = float(os.environ.get("MEMORY_EMBED_BATCH_SECONDS", "2"))
+# Postgres backend: embed the query for hybrid ranking (false = full text only, no API call).
+MEMORY_QUERY_EMBEDDINGS = os.environ.get("MEMORY_QUERY_EMBEDDINGS", "true").strip().lower() in ("1", "true", "yes")
 
 _MEMORY: Any = None
 _MEMORY_INIT_FAILED: bool = False
+_BACKEND: MemoryBackend | None = None
+_pending_adds: set[asyncio.Task] = set()
 
 
 def _is_enabled() -> bool:
@@ -49,60 +88,56 @@ def _get_memory() -> Any | None:
         return None
 
 
-def add_memory(messages: list[dict[str, Any]], session_id: str) -> None:
-    """Store a conversation turn in Mem0. Uses session_id as user_id for scoping.
+def _text(content: Any) -> str:
+    """Message content as plain text (first text part of multimodal content)."""
+    if isinstance(content, list):
+        return next((p.get("text", "") for p in content if isinstance(p, dict) and p.get("type") == "text"), "")
+    return str(content) if content is not None else ""
 
-    Args:
-        messages: List of {"role": "user"|"assistant", "content": str}.
-        session_id: Scope key (e.g. client-generated session UUID).
-    """
-    mem = _get_memory()
-    if not mem or not messages:
-        return
-    try:
-        start = time.time()
-        # Mem0 expects role/content; we may have content as list (multimodal). Normalize to str.
-        normalized = []
-        for m in messages:
-            content = m.get("content")
-            if isinstance(content, list):
-                text = next((p.get("text", "") for p in content if isinstance(p, dict) and p.get("type") == "text"), "")
-            else:
-                text = str(content) if content is not None else ""
-            normalized.append({"role": m.get("role", "user"), "content": text})
-        if not normalized:
-            return
-        mem.add(normalized, user_id=session_id)
-        elapsed = time.time() - start
-        perf_logger.info(f"Mem0 add: {elapsed:.3f}s (session={session_id}, messages={len(normalized)})")
-        logger.debug("Mem0 add: session_id=%s messages=%d", session_id, len(normalized))
-    except Exception as e:
-        logger.warning("Mem0 add failed: %s", e)
 
+class MemoryBackend(ABC):
+    """Stores conversation turns and returns remembered facts for a query."""
 
-def search_memory(query: str, session_id: str, top_k: int = 5) -> str:
-    """Search Mem0 for relevant memories; return formatted string for system prompt.
+    name = "none"
 
-    Args:
-        query: Natural-language question or context (e.g. last user message).
-        session_id: Scope key (same as add_memory).
-        top_k: Max number of memories to return.
+    @abstractmethod
+    async def add(self, messages: list[dict[str, str]], scope: str) -> None:
+        """Remember a turn. messages are normalized {"role", "content": str}."""
 
-    Returns:
-        Formatted string (e.g. "- Memory 1\\n- Memory 2") or empty if none.
-    """
-    mem = _get_memory()
-    if not mem or not query.strip():
-        return ""
-    try:
-        start = time.time()
-        result = mem.search(query, user_id=session_id, limit=top_k)
-        elapsed = time.time() - start
-        
+    @abstractmethod
+    async def search(self, query: str, scope: str, top_k: int, embedding: list[float] | None = None) -> list[str]:
+        """Return up to top_k remembered facts relevant to query, best first.
+
+        embedding is the query's embedding from embed_query, when already computed.
+        """
+
+    async def embed_query(self, query: str, scope: str) -> list[float] | None:
+        """Embedding of a search query (for similarity cache lookups), or None if unavailable."""
+        return None
+
+    def status(self) -> dict[str, str]:
+        """Health summary for /health."""
+        return {"status": "operational", "message": f"{self.name} memory backend is ready"}
+
+    async def close(self) -> None:
+        pass
+
+
+class Mem0Backend(MemoryBackend):
+    """Mem0 OSS (extraction, embeddings and vector store inside Mem0)."""
+
+    name = "mem0"
+
+    def __init__(self, memory: Any) -> None:
+        self._memory = memory
+
+    async def add(self, messages: list[dict[str, str]], scope: str) -> None:
+        await asyncio.to_thread(self._memory.add, messages, user_id=scope)
+
+    async def search(self, query: str, scope: str, top_k: int, embedding: list[float] | None = None) -> list[str]:
+        result = await asyncio.to_thread(self._memory.search, query, user_id=scope, limit=top_k)
         if not result:
-            perf_logger.info(f"Mem0 search: {elapsed:.3f}s (no results)")
-            return ""
-        
+            return []
         # OSS may return dict with "results" or list of items with "memory" text.
         if isinstance(result, dict):
             items = result.get("results", result.get("memories", []))
@@ -116,12 +151,287 @@ def search_memory(query: str, session_id: str, top_k: int = 5) -> str:
                     texts.append(text.strip())
             elif isinstance(item, str):
                 texts.append(item.strip())
-        
-        perf_logger.info(f"Mem0 search: {elapsed:.3f}s (found {len(texts)} memories)")
-        
-        if not texts:
-            return ""
-        return "Remembered from past conversation:\n" + "\n".join(f"- {t}" for t in texts)
+        return texts
+
+    async def embed_query(self, query: str, scope: str) -> list[float] | None:
+        embedder = getattr(self._memory, "embedding_model", None)
+        if embedder is None:
+            return None
+        return await asyncio.to_thread(embedder.embed, query, "search")
+
+    def status(self) -> dict[str, str]:
+        return {"status": "operational", "message": "Mem0 memory layer is initialized and ready"}
+
+
+class PostgresMemoryBackend(MemoryBackend):
+    """Facts in the facts table; embeddings batched across turns."""
+
+    name = "postgres"
+
+    FACT_EXTRACTION_PROMPT = """Extract durable facts about the visitor from this chat turn.
+
+{turn}
+
+Return JSON: {{"facts": ["..."]}}
+- Short third-person statements ("Works at Stripe as a backend engineer", "Lives in Melbourne")
+- Only what the visitor said about themselves, their work, plans or preferences
+- No facts about Bill, no questions, nothing speculative
+- {{"facts": []}} if there is nothing worth remembering"""
+
+    def __init__(
+        self,
+        db: Any,
+        client: Any,
+        model: str | None = None,
+        embedding_model: str | None = None,
+        batch_size: int = MEMORY_EMBED_BATCH_SIZE,
+        batch_seconds: float = MEMORY_EMBED_BATCH_SECONDS,
+        query_embeddings: bool = MEMORY_QUERY_EMBEDDINGS,
+        embeddings: EmbeddingCache | None = None,
+    ) -> None:
+        self._db = db
+        self._client = client
+        self._model = model or get_fast_model()
+        self._embedding_model = embedding_model or get_embedding_model()
+        self._embeddings = embeddings or EmbeddingCache(client)
+        self._batch_size = batch_size
+        self._batch_seconds = batch_seconds
+        self._query_embeddings = query_embeddings
+        # (profile_id, fact) awaiting one batched embeddings call
+        self._pending: list[tuple[str, str]] = []
+        self._flush_timer: asyncio.TimerHandle | None = None
+        self._flushing: set[asyncio.Task] = set()
+
+    async def _extract_facts(self, messages: list[dict[str, str]], scope: str) -> list[str]:
+        user_text = "\n".join(m["content"] for m in messages if m["role"] == "user")
+        if not prefilter_message(user_text).needs_llm:
+            return []
+        turn = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        response = await self._client.chat.completions.create(
+            model=self._model,
+            messages=[{"role": "user", "content": self.FACT_EXTRACTION_PROMPT.format(turn=turn)}],
+            temperature=0.1,
+            response_format={"type": "json_object"},
+        )
+        self._record_usage(response.usage, self._model, scope)
+        facts = json.loads(response.choices[0].message.content or "{}").get("facts", [])
+        return [f.strip() for f in facts if isinstance(f, str) and f.strip()]
+
+    def _record_usage(self, usage: Any, model: str, scope: str | None) -> None:
+        recorded = usage_from_response(usage, model)
+        if recorded is not None:
+            get_usage_tracker().record(recorded, model=model, source=SOURCE_MEMORY, profile_id=scope)
+
+    async def _embed(self, texts: list[str], scope: str | None = None) -> list[list[float]]:
+        return await self._embeddings.embed(texts, self._embedding_model, profile_id=scope)
+
+    async def add(self, messages: list[dict[str, str]], scope: str) -> None:
+        facts = await self._extract_facts(messages, scope)
+        if not facts:
+            return
+        self._pending.extend((scope, fact) for fact in facts)
+        if len(self._pending) >= self._batch_size:
+            self._start_flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(self._batch_seconds, self._start_flush)
+
+    def _start_flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._flush(batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _flush(self, batch: list[tuple[str, str]]) -> None:
+        """Embed a batch of facts with one API call and insert them with one query."""
+        contents = [fact for _, fact in batch]
+        try:
+            with get_tracer().span("memory.embed_batch", facts=len(batch)):
+                embeddings = await self._embed(contents)
+        except Exception as e:
+            # Facts are still searchable by full text without embeddings
+            logger.warning("Memory embedding batch failed; storing %d facts without vectors: %s", len(batch), e)
+            embeddings = None
+        try:
+            await self._db.store_facts(
+                [profile_id for profile_id, _ in batch],
+                contents,
+                embeddings,
+                data={"source": "memory"},
+            )
+        except Exception as e:
+            logger.warning("Storing %d memory facts failed: %s", len(batch), e)
+            return
+        cache = get_memory_cache()
+        for profile_id in {profile_id for profile_id, _ in batch}:
+            cache.bump(profile_id)
+
+    async def embed_query(self, query: str, scope: str) -> list[float] | None:
+        if not self._query_embeddings:
+            return None
+        try:
+            return (await self._embed([query], scope))[0]
+        except Exception as e:
+            logger.warning("Memory query embedding failed; full-text only: %s", e)
+            return None
+
+    async def search(self, query: str, scope: str, top_k: int, embedding: list[float] | None = None) -> list[str]:
+        if embedding is None:
+            embedding = await self.embed_query(query, scope)
+        rows = await self._db.search_facts(
+            query, profile_id=scope, limit=top_k, query_embedding=embedding, match_any=True
+        )
+        return [row["content"] for row in rows]
+
+    async def close(self) -> None:
+        self._start_flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+
+def _share_embedding_cache(memory: Any) -> None:
+    """Serve Mem0's OpenAI embeddings from the shared cache (agent/embeddings.py)."""
+    embedder = getattr(memory, "embedding_model", None)
+    config = getattr(getattr(memory, "config", None), "embedder", None)
+    if embedder is None or isinstance(embedder, CachedEmbedder) or getattr(config, "provider", None) != "openai":
+        return
+    model = getattr(getattr(embedder, "config", None), "model", None) or get_embedding_model()
+    memory.embedding_model = CachedEmbedder(embedder, get_embedding_cache(), model)
+
+
+def init_memory(db: Any = None, client: Any = None, name: str = MEMORY_BACKEND) -> MemoryBackend | None:
+    """Create the configured backend (call once at startup). None if memory is off."""
+    global _BACKEND
+    _BACKEND = None
+    if not _is_enabled():
+        return None
+    if name == "postgres":
+        if db is None or client is None:
+            logger.warning("MEMORY_BACKEND=postgres needs the db and OpenAI client; memory disabled")
+            return None
+        _BACKEND = PostgresMemoryBackend(db, client, embeddings=init_embedding_cache(client))
+    elif name == "mem0":
+        memory = _get_memory()
+        if memory is not None:
+            _share_embedding_cache(memory)
+        _BACKEND = Mem0Backend(memory) if memory is not None else None
+    else:
+        logger.warning("Unknown MEMORY_BACKEND=%s; memory disabled", name)
+    if _BACKEND is not None:
+        logger.info("Memory backend: %s", _BACKEND.name)
+    return _BACKEND
+
+
+def get_memory_backend() -> MemoryBackend | None:
+    """Return the active backend (initialized lazily for Mem0 when init_memory wasn't called)."""
+    if _BACKEND is None and MEMORY_BACKEND == "mem0" and not _MEMORY_INIT_FAILED:
+        init_memory()
+    return _BACKEND
+
+
+def memory_cache_stats() -> dict[str, Any]:
+    """Memory retrieval cache hit rates and saved latency for /health."""
+    cache = get_memory_cache()
+    if not cache.enabled:
+        return {"status": "disabled"}
+    return {"status": "enabled", "similarity": cache.similarity, **cache.stats()}
+
+
+def memory_status() -> dict[str, str]:
+    """Memory health for /health."""
+    if not _is_enabled():
+        return {"status": "disabled", "message": "Memory is disabled via MEMORY_ENABLED=false"}
+    backend = get_memory_backend()
+    if backend is None:
+        return {"status": "failed", "message": f"{MEMORY_BACKEND} memory backend failed to start (check logs)"}
+    return backend.status()
+
+
+async def _add(backend: MemoryBackend, messages: list[dict[str, str]], scope: str) -> None:
+    try:
+        with get_tracer().span("memory.add", backend=backend.name, messages=len(messages)):
+            await backend.add(messages, scope)
+        logger.debug("Memory add: scope=%s messages=%d", scope, len(messages))
+    except Exception as e:
+        logger.warning("Memory add failed (%s): %s", backend.name, e)
+    finally:
+        # Backends that write inline (Mem0) have now stored the turn
+        get_memory_cache().bump(scope)
+
+
+def add_memory(messages: list[dict[str, Any]], session_id: str) -> None:
+    """Remember a conversation turn in the background (returns immediately).
+
+    Args:
+        messages: List of {"role": "user"|"assistant", "content": str}.
+        session_id: Scope key (main.py passes the visitor's profile_id).
+    """
+    backend = get_memory_backend()
+    if not backend or not messages:
+        return
+    # Backends expect role/content; we may have content as list (multimodal). Normalize to str.
+    normalized = [{"role": m.get("role", "user"), "content": _text(m.get("content"))} for m in messages]
+    get_memory_cache().bump(str(session_id))
+    task = asyncio.get_running_loop().create_task(_add(backend, normalized, str(session_id)))
+    _pending_adds.add(task)
+    task.add_done_callback(_pending_adds.discard)
+
+
+async def search_memory(query: str, session_id: str, top_k: int = 5) -> str:
+    """Search memory for relevant facts; return formatted string for system prompt.
+
+    Args:
+        query: Natural-language question or context (e.g. last user message).
+        session_id: Scope key (same as add_memory).
+        top_k: Max number of memories to return.
+
+    Returns:
+        Formatted string (e.g. "- Memory 1\\n- Memory 2") or empty if none.
+    """
+    backend = get_memory_backend()
+    if not backend or not query.strip():
+        return ""
+    scope = str(session_id)
+    cache = get_memory_cache()
+    # Read the version before searching: a write that lands mid-search bumps it
+    # and the (possibly stale) results are not cached.
+    version = cache.version(scope)
+    key = f"{top_k}:{normalize_query(query)}"
+    try:
+        with get_tracer().span("memory.search", backend=backend.name, top_k=top_k) as span:
+            texts = cache.get(scope, version, key)
+            embedding = None
+            if texts is None and cache.semantic_enabled:
+                embedding = await backend.embed_query(query, scope)
+                if embedding is not None:
+                    texts = cache.get_similar(scope, version, embedding, top_k)
+            if texts is not None:
+                span.set_attribute("cache", "hit")
+            else:
+                start = time.perf_counter()
+                texts = await backend.search(query, scope, top_k, embedding=embedding)
+                cache.put(scope, version, key, texts, (time.perf_counter() - start) * 1000, embedding, top_k)
+                span.set_attribute("cache", "miss")
+            span.set_attribute("results", len(texts))
     except Exception as e:
-        logger.warning("Mem0 search failed: %s", e)
+        logger.warning("Memory search failed (%s): %s", backend.name, e)
         return ""
+    if not texts:
+        return ""
+    return "Remembered from past conversation:\n" + "\n".join(f"- {t}" for t in texts)
+
+
+async def close_memory(timeout: float = 10.0) -> None:
+    """Finish pending adds and flush batched writes (call on shutdown)."""
+    if _pending_adds:
+        await asyncio.wait(set(_pending_adds), timeout=timeout)
+    if _BACKEND is not None:
+        try:
+            await asyncio.wait_for(_BACKEND.close(), timeout)
+        except Exception as e:
+            logger.warning("Memory backend close failed: %s", e)
+    get_embedding_cache().close()
@@ -0,0 +1,413 @@
+"""In-process Prometheus-style metrics (counters, gauges, histograms) for /metrics.
+
+Recording is lock-free: every thread writes to its own shard and shards are only
+summed when rendering. State is per worker process. For multi-worker uvicorn set
+PROMETHEUS_MULTIPROC_DIR to a shared, empty directory: each worker then writes
+a JSON snapshot there periodically (and on every scrape), and /metrics on any
+worker renders the aggregate of all snapshots.
+
+Latency histograms are fed from finished tracing spans (see SpanMetricsExporter).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR", "").strip()
+MULTIPROC_WRITE_SECONDS = float(os.environ.get("METRICS_MULTIPROC_WRITE_SECONDS", "5"))
+
+
+class _Shards:
+    """One dict per thread; only the owning thread writes to it."""
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._all: list[dict[tuple[str, ...], Any]] = []
+        self._register_lock = threading.Lock()
+
+    def mine(self) -> dict[tuple[str, ...], Any]:
+        d = getattr(self._local, "d", None)
+        if d is None:
+            d = self._local.d = {}
+            with self._register_lock:
+                self._all.append(d)
+        return d
+
+    def all(self) -> list[dict[tuple[str, ...], Any]]:
+        with self._register_lock:
+            return [d.copy() for d in self._all]
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        d = self._shards.mine()
+        d[labels] = d.get(labels, 0.0) + amount
+
+    def collect(self) -> dict[tuple[str, ...], float]:
+        out: dict[tuple[str, ...], float] = {}
+        for shard in self._shards.all():
+            for labels, value in shard.items():
+                out[labels] = out.get(labels, 0.0) + value
+        return out
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._shards = _Shards()
+
+    def observe(self, value: float, *labels: str) -> None:
+        d = self._shards.mine()
+        entry = d.get(labels)
+        if entry is None:
+            # [per-bucket counts (non-cumulative, last = +Inf), sum, count]
+            entry = d[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        i = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            i += 1
+        entry[0][i] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def collect(self) -> dict[tuple[str, ...], list[Any]]:
+        out: dict[tuple[str, ...], list[Any]] = {}
+        for shard in self._shards.all():
+            for labels, (counts, total, count) in shard.items():
+                agg = out.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                agg[0] = [a + b for a, b in zip(agg[0], counts)]
+                agg[1] += total
+                agg[2] += count
+        return out
+
+
+class CallbackGauge:
+    """Gauge whose value is read from a callback at collection time."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames: tuple[str, ...] = ()
+        self.fn = fn
+
+    def collect(self) -> dict[tuple[str, ...], float]:
+        try:
+            return {(): float(self.fn())}
+        except Exception as e:
+            logger.debug("Gauge %s callback failed: %s", self.name, e)
+            return {}
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._writer: threading.Thread | None = None
+
+    def _register(self, metric: Any) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and not isinstance(metric, CallbackGauge):
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge_fn(self, name: str, help: str, fn: Callable[[], float]) -> CallbackGauge:
+        """Register (or replace) a gauge read from fn() at scrape time."""
+        return self._register(CallbackGauge(name, help, fn))
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return a JSON-serializable snapshot of every metric in this process."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        out: dict[str, Any] = {}
+        for m in metrics:
+            entry: dict[str, Any] = {
+                "type": m.type,
+                "help": m.help,
+                "labelnames": list(m.labelnames),
+                "samples": [[list(k), v] for k, v in m.collect().items()],
+            }
+            if isinstance(m, Histogram):
+                entry["buckets"] = list(m.buckets)
+            out[m.name] = entry
+        return out
+
+    def render(self) -> str:
+        """Render this process's metrics, or all workers' when multiprocess mode is on."""
+        if MULTIPROC_DIR:
+            self.write_multiprocess_snapshot()
+            return render_snapshot(read_multiprocess_snapshots(MULTIPROC_DIR))
+        return render_snapshot(self.snapshot())
+
+    def write_multiprocess_snapshot(self) -> None:
+        """Atomically write this worker's snapshot into PROMETHEUS_MULTIPROC_DIR."""
+        if not MULTIPROC_DIR:
+            return
+        path = Path(MULTIPROC_DIR) / f"metrics_{os.getpid()}.json"
+        tmp = path.with_suffix(".tmp")
+        try:
+            tmp.write_text(json.dumps({"pid": os.getpid(), "metrics": self.snapshot()}))
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Metrics snapshot write failed: %s", e)
+
+    def start_multiprocess_writer(self) -> None:
+        """Start a daemon thread that refreshes this worker's snapshot file."""
+        if not MULTIPROC_DIR or self._writer is not None:
+            return
+
+        def _loop() -> None:
+            while True:
+                self.write_multiprocess_snapshot()
+                time.sleep(MULTIPROC_WRITE_SECONDS)
+
+        self._writer = threading.Thread(target=_loop, name="metrics-writer", daemon=True)
+        self._writer.start()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_multiprocess_snapshots(directory: str) -> dict[str, Any]:
+    """Merge worker snapshot files: counters and histograms are summed over all
+    files; gauges are summed over live workers only."""
+    merged: dict[str, Any] = {}
+    for path in sorted(Path(directory).glob("metrics_*.json")):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        alive = _pid_alive(int(data.get("pid", 0)))
+        for name, entry in data.get("metrics", {}).items():
+            if entry["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**entry, "samples": []})
+            index = {tuple(labels): i for i, (labels, _) in enumerate(target["samples"])}
+            for labels, value in entry["samples"]:
+                i = index.get(tuple(labels))
+                if i is None:
+                    target["samples"].append([labels, value])
+                    index[tuple(labels)] = len(target["samples"]) - 1
+                elif entry["type"] == "histogram":
+                    cur = target["samples"][i][1]
+                    target["samples"][i][1] = [
+                        [a + b for a, b in zip(cur[0], value[0])],
+                        cur[1] + value[1],
+                        cur[2] + value[2],
+                    ]
+                else:
+                    target["samples"][i][1] += value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: list[str], values: list[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render_snapshot(snapshot: dict[str, Any]) -> str:
+    """Render a snapshot (see MetricsRegistry.snapshot) as Prometheus text."""
+    lines: list[str] = []
+    for name, entry in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {entry['help']}")
+        lines.append(f"# TYPE {name} {entry['type']}")
+        names = entry["labelnames"]
+        for labels, value in entry["samples"]:
+            if entry["type"] == "histogram":
+                counts, total, count = value
+                cumulative = 0
+                for bound, c in zip(list(entry["buckets"]) + [float("inf")], counts):
+                    cumulative += c
+                    le = 'le="' + _fmt(bound) + '"'
+                    lines.append(f"{name}_bucket{_labels(names, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(names, labels)} {_fmt(total)}")
+                lines.append(f"{name}_count{_labels(names, labels)} {count}")
+            else:
+                lines.append(f"{name}{_labels(names, labels)} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "agent_request_duration_seconds", "Total chat request latency.", ("endpoint",)
+)
+TTFT_SECONDS = REGISTRY.histogram(
+    "agent_ttft_seconds", "Time from request start to first streamed token."
+)
+LLM_STEP_SECONDS = REGISTRY.histogram(
+    "agent_llm_step_duration_seconds", "Latency of one agent LLM step.", ("stream",)
+)
+TOOL_SECONDS = REGISTRY.histogram(
+    "agent_tool_duration_seconds", "Tool execution latency.", ("tool", "cache_hit")
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "agent_cache_requests_total", "Cache lookups by cache and result (hit/miss).", ("cache", "result")
+)
+RATE_LIMIT_REJECTIONS = REGISTRY.counter(
+    "agent_rate_limit_rejections_total", "Requests rejected by the rate limiter.", ("context",)
+)
+BUDGET_TIER_REQUESTS = REGISTRY.counter(
+    "agent_budget_tier_requests_total", "Requests by spend-budget service tier.", ("tier",)
+)
+BUDGET_TOKENS_CHARGED = REGISTRY.counter(
+    "agent_budget_tokens_charged_total", "Token-equivalents charged to visitor budgets."
+)
+EXTRACTION_QUEUE_SECONDS = REGISTRY.histogram(
+    "agent_extraction_queue_seconds", "Time from first queued message to profile extraction start."
+)
+EXTRACTION_SECONDS = REGISTRY.histogram(
+    "agent_extraction_duration_seconds", "Profile extraction and update latency (one batch)."
+)
+EXTRACTION_MESSAGES = REGISTRY.counter(
+    "agent_extraction_messages_total",
+    "User messages submitted for profile extraction by outcome (queued/coalesced/dropped).",
+    ("outcome",),
+)
+EXTRACTION_PREFILTER = REGISTRY.counter(
+    "agent_extraction_prefilter_total",
+    "Profile extraction pre-filter decisions (llm = sent to the LLM, skipped = local only).",
+    ("result",),
+)
+PROFILE_DATA_WRITES = REGISTRY.counter(
+    "agent_profile_data_writes_total", "Profile data merges by result (written/unchanged).", ("result",)
+)
+MAINTENANCE_ROWS = REGISTRY.counter(
+    "agent_maintenance_rows_total",
+    "Rows handled by database maintenance by action (merged_profiles/pruned_profiles/pruned_sessions).",
+    ("action",),
+)
+MAINTENANCE_SECONDS = REGISTRY.histogram(
+    "agent_maintenance_duration_seconds", "Duration of one database maintenance run."
+)
+MEMORY_CACHE_SAVED_SECONDS = REGISTRY.counter(
+    "agent_memory_cache_saved_seconds_total",
+    "Memory search latency avoided by serving cached results (measured on the original search).",
+)
+STREAM_DISCONNECTS = REGISTRY.counter(
+    "agent_stream_disconnects_total",
+    "Streams abandoned by the client, by the last phase reached (thinking/tool_start/answer).",
+    ("phase",),
+)
+STREAM_DISCONNECT_DELTAS = REGISTRY.histogram(
+    "agent_stream_disconnect_deltas",
+    "Answer deltas sent before the client disconnected.",
+    buckets=(0, 1, 10, 50, 100, 250, 500, 1000, 2500),
+)
+MODEL_ROUTES = REGISTRY.counter(
+    "agent_model_routes_total", "LLM steps by routed model and routing reason.", ("model", "reason")
+)
+DB_POOL_WAIT_SECONDS = REGISTRY.histogram(
+    "agent_db_pool_wait_seconds", "Time spent waiting to acquire a Postgres pool connection."
+)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    """Count one cache lookup (exposed as hit/miss counters)."""
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+class SpanMetricsExporter:
+    """Tracing exporter that feeds latency histograms from finished spans."""
+
+    def export(self, span: Any) -> None:
+        name = span.name
+        if name in ("chat.request", "chat.stream"):
+            REQUEST_SECONDS.observe(span.duration_s, name)
+            ttft = span.attributes.get("ttft_s")
+            if ttft is not None:
+                TTFT_SECONDS.observe(ttft)
+            phase = span.attributes.get("disconnected")
+            if phase:
+                STREAM_DISCONNECTS.inc(phase)
+                STREAM_DISCONNECT_DELTAS.observe(span.attributes.get("deltas", 0))
+        elif name == "llm.step":
+            LLM_STEP_SECONDS.observe(span.duration_s, str(bool(span.attributes.get("stream"))).lower())
+        elif name == "tool.execute":
+            TOOL_SECONDS.observe(
+                span.duration_s,
+                span.attributes.get("tool", ""),
+                str(bool(span.attributes.get("cache_hit"))).lower(),
+            )
+
+    def shutdown(self) -> None:
+        pass
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the process-wide metrics registry."""
+    return REGISTRY
@@ -3,7 +3,7 @@
 See docs/AGENT_ARCHITECTURE.md §6 (Reasoning & tool selection), §7 (Skills), §15a.
 """
 
-from agent.skills import get_prompt_fragment
+from agent.skills import DEFAULT_SKILL, SKILLS, get_prompt_fragment
 
 PUBLIC_SYSTEM_PROMPT = """# IDENTITY & MEMORY
 
@@ -869,6 +869,39 @@ NOT ALLOWED: Anything with "?"
 """
 
 
+# Base prompt per conversation mode; unknown modes fall back to "default".
+_MODE_PROMPTS: dict[str, str] = {
+    "default": PUBLIC_SYSTEM_PROMPT,
+    "funny": FUNNY_SYSTEM_PROMPT,
+    "wise": WISE_SYSTEM_PROMPT,
+    "annoyed": ANNOYED_SYSTEM_PROMPT,
+}
+
+_CONTEXT_SUFFIXES: dict[str, str] = {
+    "public": "",
+    "private": "\n\nPRIVATE MODE\nThe user is Bill. You can also help with personal tasks using the tools available to you.",
+}
+
+
+def _build_prompt_table() -> dict[tuple[str, str, str], tuple[str, str]]:
+    """Precompute (static prefix, static suffix) for every (mode, skill, context).
+
+    The prefix is the mode prompt plus the skill fragment; the suffix holds the
+    context instructions that follow the per-request visitor context and memory.
+    """
+    table: dict[tuple[str, str, str], tuple[str, str]] = {}
+    for mode, base in _MODE_PROMPTS.items():
+        for skill_id in SKILLS:
+            prefix = base + get_prompt_fragment(skill_id)
+            for context, suffix in _CONTEXT_SUFFIXES.items():
+                table[(mode, skill_id, context)] = (prefix, suffix)
+    return table
+
+
+# Built once at import; get_system_prompt only appends per-request sections.
+_PROMPT_TABLE = _build_prompt_table()
+
+
 def get_system_prompt(
     context: str = "public",
     skill: str = "answer_about_bill",
@@ -889,27 +922,18 @@ def get_system_prompt(
     Returns:
         System prompt string.
     """
-    # Select base prompt based on mode
-    if mode == "funny":
-        base = FUNNY_SYSTEM_PROMPT
-    elif mode == "wise":
-        base = WISE_SYSTEM_PROMPT
-    elif mode == "annoyed":
-        base = ANNOYED_SYSTEM_PROMPT
-    else:
-        base = PUBLIC_SYSTEM_PROMPT
-    
-    # Add skill-specific fragment
-    base += get_prompt_fragment(skill)
-    
+    if mode not in _MODE_PROMPTS:
+        mode = "default"
+    if skill not in SKILLS:
+        skill = DEFAULT_SKILL
+    prefix, suffix = _PROMPT_TABLE[(mode, skill, "private" if context == "private" else "public")]
+
     # Add visitor context and memory
+    parts = [prefix]
     if visitor_context and visitor_context.strip():
-        base += "\n\n--- VISITOR CONTEXT ---\n" + visitor_context.strip()
+        parts.append("\n\n--- VISITOR CONTEXT ---\n" + visitor_context.strip())
     if memory and memory.strip():
-        base += "\n\n--- CONVERSATION MEMORY ---\n" + memory.strip()
-    
-    # Add private mode instructions if needed
-    if context == "private":
-        base += "\n\nPRIVATE MODE\nThe user is Bill. You can also help with personal tasks using the tools available to you."
-    
-    return base
+        parts.append("\n\n--- CONVERSATION MEMORY ---\n" + memory.strip())
+    if suffix:
+        parts.append(suffix)
+    return "".join(parts)
@@ -2,6 +2,21 @@
 
 Public: stricter limit (e.g. N messages per IP per hour) to control cost and abuse.
 Private (Bill): higher or no limit. See docs/AGENT_ARCHITECTURE.md §2 and Phase 2.
+
+Token bucket per (client_id, context): capacity = hourly limit, refilled
+continuously at limit/hour, so there is no 2x burst at window boundaries.
+State is two floats per active key; buckets that have refilled to capacity
+carry no information and are dropped by an amortized sweep.
+
+Requests cost ROUTE_COSTS[route] up front; each distinct tool the agent used is
+charged afterwards (TOOL_CALL_COST) with charge(), which can push a bucket into
+debt that later requests repay.
+
+With several workers or replicas, this limiter is the local tier in front of a
+shared backend (agent.rate_limit_backends): decisions stay in-process, consumed
+tokens are recorded per key, and a periodic sync pushes them to the backend and
+pulls back the global bucket level. Overshoot is bounded by what other workers
+spend within one sync interval.
 """
 
 from __future__ import annotations
@@ -18,57 +33,170 @@ RATE_LIMIT_PRIVATE_PER_HOUR = int(
 )
 WINDOW_SECONDS = 3600
 
+# Request costs in bucket tokens (1.0 = one message under the hourly limit).
+ROUTE_COSTS: dict[str, float] = {
+    "chat": float(os.environ.get("RATE_LIMIT_COST_CHAT", "1")),
+    "chat_stream": float(os.environ.get("RATE_LIMIT_COST_CHAT_STREAM", "1")),
+}
+TOOL_CALL_COST = float(os.environ.get("RATE_LIMIT_COST_TOOL_CALL", "0.5"))
+
+# How often (seconds) bucket updates sweep out idle, fully refilled buckets.
+SWEEP_INTERVAL_SECONDS = 60.0
+
 
 class RateLimiter:
-    """Fixed-window rate limiter per (client_id, context)."""
+    """Token-bucket rate limiter per (client_id, context)."""
 
-    __slots__ = ("_window_sec", "_limits", "_counts", "_windows", "_lock")
+    __slots__ = (
+        "_window_sec", "_limits", "_buckets", "_lock", "_next_sweep", "_sweep_interval", "_pending",
+    )
 
     def __init__(
         self,
         window_sec: int = WINDOW_SECONDS,
         public_limit: int = RATE_LIMIT_PUBLIC_PER_HOUR,
         private_limit: int = RATE_LIMIT_PRIVATE_PER_HOUR,
+        sweep_interval: float = SWEEP_INTERVAL_SECONDS,
     ) -> None:
         self._window_sec = window_sec
         self._limits = {"public": public_limit, "private": private_limit}
-        self._counts: dict[tuple[str, str], int] = {}
-        self._windows: dict[tuple[str, str], int] = {}
+        # key -> [tokens, last_refill_monotonic]
+        self._buckets: dict[tuple[str, str], list[float]] = {}
         self._lock = threading.Lock()
+        self._sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        # key -> tokens consumed since the last shared-backend sync (None = local only)
+        self._pending: dict[tuple[str, str], float] | None = None
+
+    @property
+    def window_sec(self) -> float:
+        return self._window_sec
 
-    def _window_id(self) -> int:
-        return int(time.time() // self._window_sec)
+    def limit(self, context: str) -> int:
+        """Bucket capacity (requests per window) for context; 0 = no limit."""
+        return self._limit(context)
 
-    def is_allowed(self, client_id: str, context: str) -> bool:
-        """Return True if the request is within limit, False if rate limited."""
-        limit = self._limits.get(context, self._limits["public"])
+    def _limit(self, context: str) -> int:
+        return self._limits.get(context, self._limits["public"])
+
+    def _refill(self, key: tuple[str, str], limit: int, now: float) -> list[float]:
+        """Return the bucket for key, refilled up to now (caller holds the lock)."""
+        if now >= self._next_sweep:
+            self._sweep(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(limit), now]
+            self._buckets[key] = bucket
+            return bucket
+        tokens = bucket[0] + (now - bucket[1]) * limit / self._window_sec
+        bucket[0] = tokens if tokens < limit else float(limit)
+        bucket[1] = now
+        return bucket
+
+    def _sweep(self, now: float) -> None:
+        """Drop buckets that would be full by now (caller holds the lock)."""
+        self._next_sweep = now + self._sweep_interval
+        window = self._window_sec
+        idle = [
+            key
+            for key, (tokens, last) in self._buckets.items()
+            if tokens + (now - last) * self._limit(key[1]) / window >= self._limit(key[1])
+        ]
+        for key in idle:
+            del self._buckets[key]
+
+    def is_allowed(self, client_id: str, context: str, cost: float = 1.0) -> bool:
+        """Take cost tokens and return True, or return False if rate limited."""
+        limit = self._limit(context)
         if limit <= 0:
             return True
-        key = (client_id, context)
-        now_id = self._window_id()
+        now = time.monotonic()
         with self._lock:
-            window_id = self._windows.get(key)
-            if window_id is None or window_id != now_id:
-                self._counts[key] = 0
-                self._windows[key] = now_id
-            count = self._counts[key]
-            if count >= limit:
+            bucket = self._refill((client_id, context), limit, now)
+            if bucket[0] < cost:
                 return False
-            self._counts[key] = count + 1
+            bucket[0] -= cost
+            if self._pending is not None:
+                key = (client_id, context)
+                self._pending[key] = self._pending.get(key, 0.0) + cost
             return True
 
+    def charge(self, client_id: str, context: str, cost: float) -> None:
+        """Deduct extra cost after the fact (e.g. tool calls); may leave the bucket in debt."""
+        limit = self._limit(context)
+        if limit <= 0 or cost <= 0:
+            return
+        with self._lock:
+            key = (client_id, context)
+            bucket = self._refill(key, limit, time.monotonic())
+            bucket[0] = max(bucket[0] - cost, -float(limit))
+            if self._pending is not None:
+                self._pending[key] = self._pending.get(key, 0.0) + cost
+
+    def enable_sync(self) -> None:
+        """Start recording consumed tokens for a shared backend (see drain_pending)."""
+        with self._lock:
+            if self._pending is None:
+                self._pending = {}
+
+    def drain_pending(self) -> dict[tuple[str, str], float]:
+        """Take the tokens consumed per key since the last drain."""
+        with self._lock:
+            if not self._pending:
+                return {}
+            pending, self._pending = self._pending, {}
+            return pending
+
+    def restore_pending(self, pending: dict[tuple[str, str], float]) -> None:
+        """Put back deltas from a failed sync so the next one retries them."""
+        with self._lock:
+            if self._pending is None:
+                return
+            for key, cost in pending.items():
+                self._pending[key] = self._pending.get(key, 0.0) + cost
+
+    def apply_shared(self, levels: dict[tuple[str, str], float]) -> None:
+        """Adopt global bucket levels from the backend.
+
+        Tokens consumed locally since the drain that produced levels are still
+        pending and not yet in the global level, so they are subtracted again.
+        """
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending or {}
+            for key, tokens in levels.items():
+                limit = self._limit(key[1])
+                if limit <= 0:
+                    continue
+                self._buckets[key] = [min(tokens, float(limit)) - pending.get(key, 0.0), now]
+
     def remaining(self, client_id: str, context: str) -> Optional[int]:
-        """Return remaining requests in the current window, or None if no limit."""
-        limit = self._limits.get(context, self._limits["public"])
+        """Return whole requests currently available, or None if no limit."""
+        limit = self._limit(context)
         if limit <= 0:
             return None
-        key = (client_id, context)
-        now_id = self._window_id()
         with self._lock:
-            window_id = self._windows.get(key)
-            if window_id is None or window_id != now_id:
+            bucket = self._buckets.get((client_id, context))
+            if bucket is None:
                 return limit
-            return max(0, limit - self._counts[key])
+            tokens = bucket[0] + (time.monotonic() - bucket[1]) * limit / self._window_sec
+            return max(0, int(min(tokens, limit)))
+
+    def retry_after(self, client_id: str, context: str, cost: float = 1.0) -> float:
+        """Seconds until cost tokens are available (0.0 if allowed now or no limit)."""
+        limit = self._limit(context)
+        if limit <= 0:
+            return 0.0
+        with self._lock:
+            bucket = self._buckets.get((client_id, context))
+            if bucket is None:
+                return 0.0
+            tokens = bucket[0] + (time.monotonic() - bucket[1]) * limit / self._window_sec
+            return max(0.0, (cost - tokens) * self._window_sec / limit)
+
+    def __len__(self) -> int:
+        """Number of tracked (client_id, context) buckets."""
+        return len(self._buckets)
 
 
 # Module-level singleton for use in FastAPI dependency.
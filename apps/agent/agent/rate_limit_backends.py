@@ -0,0 +1,258 @@
+"""Shared rate-limit state across uvicorn workers and replicas.
+
+The in-process RateLimiter (agent.rate_limit) makes every decision locally and
+records tokens consumed per key. sync_rate_limits() periodically pushes those
+deltas to a backend, which applies them atomically to a global token bucket
+and returns the new levels; the limiter adopts them.
+
+Backends (RATE_LIMIT_BACKEND):
+- local (default): no sharing; each process enforces the limit on its own.
+- memory: in-process stand-in for a key-value store (tests, single worker).
+- postgres: rate_limit_buckets table via the existing db pool
+  (apps/web/scripts/create-rate-limit-table.sql).
+- redis: one Lua script per sync (RATE_LIMIT_REDIS_URL; requires redis-py).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any
+
+from agent.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "local").strip().lower()
+RATE_LIMIT_SYNC_SECONDS = float(os.environ.get("RATE_LIMIT_SYNC_SECONDS", "2"))
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+
+# Prune idle shared buckets every N syncs.
+_PRUNE_EVERY_SYNCS = 300
+
+
+def _encode_key(key: tuple[str, str]) -> str:
+    client_id, context = key
+    return f"{context}:{client_id}"
+
+
+class RateLimitBackend(ABC):
+    """Shared token buckets: apply consumed deltas, return global levels."""
+
+    @abstractmethod
+    async def sync(
+        self,
+        consumed: dict[str, float],
+        capacity: dict[str, float],
+        refill_per_sec: dict[str, float],
+    ) -> dict[str, float]:
+        """Atomically subtract consumed[key] from each bucket and return new levels.
+
+        Args:
+            consumed: Tokens spent per key since the last sync (may be 0.0).
+            capacity: Bucket capacity per key; new buckets start full.
+            refill_per_sec: Refill rate per key.
+        """
+
+    async def prune(self) -> int:
+        """Drop buckets that have refilled to capacity. Returns how many."""
+        return 0
+
+    async def close(self) -> None:
+        pass
+
+
+def _apply_bucket(
+    tokens: float | None,
+    elapsed: float,
+    consumed: float,
+    capacity: float,
+    refill_per_sec: float,
+) -> float:
+    """Token-bucket update shared by the in-process backends (mirrors the SQL/Lua)."""
+    if tokens is None:
+        level = capacity
+    else:
+        level = min(capacity, tokens + elapsed * refill_per_sec)
+    return max(-capacity, level - consumed)
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Process-local stand-in for a shared key-value store."""
+
+    def __init__(self) -> None:
+        # key -> (tokens, updated_at_monotonic, capacity, refill_per_sec)
+        self._buckets: dict[str, tuple[float, float, float, float]] = {}
+
+    async def sync(
+        self,
+        consumed: dict[str, float],
+        capacity: dict[str, float],
+        refill_per_sec: dict[str, float],
+    ) -> dict[str, float]:
+        now = time.monotonic()
+        levels: dict[str, float] = {}
+        for key, spent in consumed.items():
+            current = self._buckets.get(key)
+            tokens = _apply_bucket(
+                current[0] if current else None,
+                now - current[1] if current else 0.0,
+                spent,
+                capacity[key],
+                refill_per_sec[key],
+            )
+            self._buckets[key] = (tokens, now, capacity[key], refill_per_sec[key])
+            levels[key] = tokens
+        return levels
+
+    async def prune(self) -> int:
+        now = time.monotonic()
+        idle = [
+            key
+            for key, (tokens, updated, cap, rate) in self._buckets.items()
+            if tokens + (now - updated) * rate >= cap
+        ]
+        for key in idle:
+            del self._buckets[key]
+        return len(idle)
+
+
+class PostgresRateLimitBackend(RateLimitBackend):
+    """Shared buckets in Postgres (one upsert per sync on the existing pool)."""
+
+    def __init__(self, db: Any) -> None:
+        self._db = db
+
+    async def sync(
+        self,
+        consumed: dict[str, float],
+        capacity: dict[str, float],
+        refill_per_sec: dict[str, float],
+    ) -> dict[str, float]:
+        keys = sorted(consumed)  # fixed lock order across workers avoids deadlocks
+        return await self._db.sync_rate_limit_buckets(
+            keys,
+            [consumed[k] for k in keys],
+            [capacity[k] for k in keys],
+            [refill_per_sec[k] for k in keys],
+        )
+
+    async def prune(self) -> int:
+        return await self._db.prune_rate_limit_buckets()
+
+
+# KEYS: bucket keys; ARGV: consumed, capacity, refill_per_sec triples (same order).
+# Buckets are hashes {tokens, ts}; ts uses the Redis server clock.
+_REDIS_SYNC_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local out = {}
+for i, key in ipairs(KEYS) do
+  local consumed = tonumber(ARGV[3 * i - 2])
+  local capacity = tonumber(ARGV[3 * i - 1])
+  local rate = tonumber(ARGV[3 * i])
+  local state = redis.call('HMGET', key, 'tokens', 'ts')
+  local level = capacity
+  if state[1] then
+    level = math.min(capacity, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+  end
+  level = math.max(-capacity, level - consumed)
+  redis.call('HSET', key, 'tokens', tostring(level), 'ts', tostring(now))
+  -- Expire once the bucket would be full again (from max debt).
+  redis.call('EXPIRE', key, math.ceil(2 * capacity / rate) + 1)
+  out[i] = tostring(level)
+end
+return out
+"""
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Shared buckets in Redis; keys expire instead of being pruned."""
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = "ratelimit:") -> None:
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_SYNC_SCRIPT)
+        self._prefix = prefix
+
+    async def sync(
+        self,
+        consumed: dict[str, float],
+        capacity: dict[str, float],
+        refill_per_sec: dict[str, float],
+    ) -> dict[str, float]:
+        keys = list(consumed)
+        args: list[float] = []
+        for k in keys:
+            args += [consumed[k], capacity[k], refill_per_sec[k]]
+        levels = await self._script(keys=[self._prefix + k for k in keys], args=args)
+        return {k: float(level) for k, level in zip(keys, levels)}
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def create_backend(db: Any = None, name: str = RATE_LIMIT_BACKEND) -> RateLimitBackend | None:
+    """Build the configured backend, or None for process-local limiting."""
+    if name in ("", "local"):
+        return None
+    if name == "memory":
+        return InMemoryRateLimitBackend()
+    if name == "postgres":
+        return PostgresRateLimitBackend(db)
+    if name == "redis":
+        try:
+            return RedisRateLimitBackend()
+        except ImportError as e:
+            logger.warning("redis not installed; rate limits stay process-local. pip install redis. %s", e)
+            return None
+    logger.warning("Unknown RATE_LIMIT_BACKEND=%s; rate limits stay process-local", name)
+    return None
+
+
+class RateLimitSync:
+    """Pushes local consumption to a backend and adopts the global levels."""
+
+    def __init__(self, limiter: RateLimiter, backend: RateLimitBackend) -> None:
+        self.limiter = limiter
+        self.backend = backend
+        self._syncs = 0
+        limiter.enable_sync()
+
+    async def sync_once(self) -> int:
+        """Sync keys with local activity. Returns how many keys were synced."""
+        pending = self.limiter.drain_pending()
+        if not pending:
+            return 0
+        window = self.limiter.window_sec
+        consumed: dict[str, float] = {}
+        capacity: dict[str, float] = {}
+        refill: dict[str, float] = {}
+        keys: dict[str, tuple[str, str]] = {}
+        for key, spent in pending.items():
+            limit = self.limiter.limit(key[1])
+            if limit <= 0:
+                continue
+            encoded = _encode_key(key)
+            keys[encoded] = key
+            consumed[encoded] = spent
+            capacity[encoded] = float(limit)
+            refill[encoded] = limit / window
+        try:
+            levels = await self.backend.sync(consumed, capacity, refill)
+        except Exception as e:
+            self.limiter.restore_pending(pending)
+            logger.warning("Rate-limit sync of %d keys failed: %s", len(consumed), e)
+            return 0
+        self.limiter.apply_shared({keys[k]: v for k, v in levels.items() if k in keys})
+
+        self._syncs += 1
+        if self._syncs % _PRUNE_EVERY_SYNCS == 0:
+            try:
+                await self.backend.prune()
+            except Exception as e:
+                logger.warning("Rate-limit bucket prune failed: %s", e)
+        return len(levels)
@@ -0,0 +1,261 @@
+"""Opt-in cache of agent answers to repeated first questions from public visitors.
+
+Many visitors open with the same question ("who are you", "what do you do").
+With RESPONSE_CACHE_ENABLED=true, main.py checks this cache before run_agent
+for requests that can't depend on the visitor:
+- public context, first turn (a single text user message), not too long
+- no remembered memory, and no visitor profile or an anonymous one with
+  nothing extracted yet (new visitors always get a profile via session_id)
+
+Entries are keyed by (mode, skill, context) and the normalized question; with
+RESPONSE_CACHE_SIMILARITY > 0, a question whose embedding is at least that
+similar to a cached one in the same (mode, skill, context) reuses its answer.
+Only answers that used no tools other than query_profile are stored (no web
+results, never a side-effecting tool), and only from full-quality runs.
+
+Every entry records the owner profile snapshot version it was answered from
+(tools/profile_snapshot.py) and is ignored once the version changes, so answers
+never outlive a profile edit. Without a mapped snapshot there is no version to
+check, and the cache stays off. Per-process, bounded LRU plus TTL.
+
+Hits are replayed through the normal SSE events, in word-group chunks with a
+short delay, so the UI renders them like a live answer.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator
+
+from agent.cache import cosine_similarity, normalize_query
+from agent.embeddings import get_embedding_cache
+from agent.metrics import record_cache_lookup
+from agent.runner import FALLBACK_MESSAGES
+from agent.stream_events import PHASE_THINKING, TYPE_DELTA, TYPE_SOURCES, build_status_event
+from agent.usage import SOURCE_AGENT
+from tools.profile_snapshot import profile_version
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "500"))
+# Reuse an answer for a question at least this similar (0 = exact normalized match only).
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.95"))
+RESPONSE_CACHE_MAX_QUESTION_CHARS = int(os.environ.get("RESPONSE_CACHE_MAX_QUESTION_CHARS", "200"))
+# Replay: words per message_delta and delay between them.
+RESPONSE_CACHE_REPLAY_WORDS = int(os.environ.get("RESPONSE_CACHE_REPLAY_WORDS", "3"))
+RESPONSE_CACHE_REPLAY_DELAY_MS = float(os.environ.get("RESPONSE_CACHE_REPLAY_DELAY_MS", "15"))
+
+# Tools whose results only depend on the owner profile
+CACHEABLE_TOOLS = frozenset({"query_profile"})
+
+
+@dataclass
+class CachedResponse:
+    message: str
+    sources: list[str]
+    profile_version: int
+    expires_at: float
+    embedding: list[float] | None = None
+    hits: int = field(default=0)
+
+
+def first_question(messages: list[dict[str, Any]]) -> str | None:
+    """The question if messages is a first turn (one text user message), else None."""
+    if len(messages) != 1 or messages[0].get("role") != "user":
+        return None
+    content = messages[0].get("content")
+    if not isinstance(content, str) or not content.strip():
+        return None
+    return content
+
+
+def blank_profile(profile: dict[str, Any] | None) -> bool:
+    """True if profile tells the agent nothing about the visitor (None, or anonymous with no data)."""
+    if not profile:
+        return True
+    if profile.get("status", "anonymous") != "anonymous" or profile.get("name") not in (None, "", "Anonymous"):
+        return False
+    data = profile.get("data") or {}
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except (json.JSONDecodeError, TypeError):
+            return False
+    return not any(data.values()) if isinstance(data, dict) else not data
+
+
+class ResponseCache:
+    """Answers per (mode, skill, context) and question. Thread-safe."""
+
+    def __init__(
+        self,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+    ) -> None:
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, str, str, str], CachedResponse] = OrderedDict()
+        self._hits = {"exact": 0, "semantic": 0}
+        self._misses = 0
+        self._stores = 0
+        self._warned_unversioned = False
+
+    def _version(self) -> int | None:
+        version = profile_version()
+        if version is None and self.enabled and not self._warned_unversioned:
+            self._warned_unversioned = True
+            logger.warning("RESPONSE_CACHE_ENABLED needs a mapped profile snapshot (PROFILE_SNAPSHOT_PATH); cache off")
+        return version
+
+    def eligible(
+        self,
+        context: str,
+        messages: list[dict[str, Any]],
+        memory: str | None,
+        profile: dict[str, Any] | None,
+    ) -> str | None:
+        """The question to look up if this request can be answered from the cache, else None."""
+        if not self.enabled or context != "public" or memory or not blank_profile(profile):
+            return None
+        question = first_question(messages)
+        if question is None or len(question) > RESPONSE_CACHE_MAX_QUESTION_CHARS:
+            return None
+        return question
+
+    async def _embed(self, question: str) -> list[float] | None:
+        try:
+            return (await get_embedding_cache().embed([normalize_query(question)], source=SOURCE_AGENT))[0]
+        except Exception as e:
+            logger.warning("Response cache embedding failed; exact match only: %s", e)
+            return None
+
+    async def get(self, mode: str, skill: str, context: str, question: str) -> CachedResponse | None:
+        """Cached answer for question, or None (also when the owner profile changed)."""
+        version = self._version()
+        if version is None:
+            return None
+        partition = (mode, skill, context)
+        key = (*partition, normalize_query(question))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.profile_version != version or now >= entry.expires_at):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry.hits += 1
+                self._hits["exact"] += 1
+            candidates = [
+                e for k, e in self._entries.items()
+                if k[:3] == partition and e.embedding is not None
+                and e.profile_version == version and now < e.expires_at
+            ] if entry is None and self.similarity > 0 else []
+        if entry is None and candidates:
+            embedding = await self._embed(question)
+            if embedding is not None:
+                best_score = self.similarity
+                for candidate in candidates:
+                    score = cosine_similarity(embedding, candidate.embedding)
+                    if score >= best_score:
+                        entry, best_score = candidate, score
+                if entry is not None:
+                    with self._lock:
+                        entry.hits += 1
+                        self._hits["semantic"] += 1
+        if entry is None:
+            with self._lock:
+                self._misses += 1
+        record_cache_lookup("response", entry is not None)
+        return entry
+
+    async def put(
+        self,
+        mode: str,
+        skill: str,
+        context: str,
+        question: str,
+        message: str,
+        sources: list[str],
+        profile_version_at_start: int | None,
+    ) -> None:
+        """Store a finished answer (skipped if it used other tools or the profile changed meanwhile)."""
+        if not message.strip() or message.strip() in FALLBACK_MESSAGES or not set(sources) <= CACHEABLE_TOOLS:
+            return
+        version = self._version()
+        if version is None or version != profile_version_at_start:
+            return
+        embedding = await self._embed(question) if self.similarity > 0 else None
+        key = (mode, skill, context, normalize_query(question))
+        entry = CachedResponse(
+            message=message,
+            sources=sorted(sources),
+            profile_version=version,
+            expires_at=time.monotonic() + self.ttl_seconds,
+            embedding=embedding,
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._stores += 1
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, Any]:
+        """Hit counts for /health."""
+        if not self.enabled:
+            return {"status": "disabled"}
+        with self._lock:
+            hits = self._hits["exact"] + self._hits["semantic"]
+            lookups = hits + self._misses
+            return {
+                "status": "enabled" if profile_version() is not None else "no_profile_snapshot",
+                "entries": len(self._entries),
+                "hits_exact": self._hits["exact"],
+                "hits_semantic": self._hits["semantic"],
+                "misses": self._misses,
+                "stores": self._stores,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+async def replay(
+    entry: CachedResponse,
+    words_per_chunk: int = RESPONSE_CACHE_REPLAY_WORDS,
+    delay_ms: float = RESPONSE_CACHE_REPLAY_DELAY_MS,
+) -> AsyncGenerator[dict[str, Any], None]:
+    """Runner-shaped stream events (status, deltas, sources) for a cached answer."""
+    yield build_status_event(PHASE_THINKING, "Thinking...")
+    words = re.findall(r"\s*\S+\s*", entry.message) or [entry.message]
+    step = max(1, words_per_chunk)
+    for i in range(0, len(words), step):
+        if i and delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000)
+        yield {"type": TYPE_DELTA, "delta": "".join(words[i:i + step])}
+    yield {"type": TYPE_SOURCES, "tools": entry.sources}
+
+
+_response_cache: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Return shared response cache singleton."""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
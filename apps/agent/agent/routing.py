@@ -0,0 +1,233 @@
+"""Per-step model routing between a fast and a full model.
+
+The agent loop asks the router for a model before every LLM step. A step is
+- select: tools are offered and none has run yet; the model mostly decides
+  what to look up (it can also answer directly)
+- answer: tool results are in context or tools are withheld; the step most
+  likely writes the reply the visitor reads
+
+Rules, first match wins:
+1. fast mode (FAST_MODE, or the visitor's spend budget) -> fast
+2. less than ROUTING_FULL_MIN_SECONDS left in the request deadline -> fast
+3. the full model's recent step latency is over ROUTING_FULL_SLO_SECONDS -> fast
+4. mode in ROUTING_FAST_MODES (default annoyed) -> fast
+5. premium request (mode in ROUTING_FULL_MODES, default wise, or private
+   context): answer -> full; select -> a fast probe (see below)
+6. everything else -> fast
+
+A probe is a non-streamed fast call capped at ROUTING_PROBE_MAX_TOKENS. If it
+calls tools they run as usual and the full model answers with the results.
+If it answers directly, its text is dropped and the full model answers
+without tools. If it hits the token cap (tool arguments may be cut off) or
+calls a side-effecting tool (send_email, schedule_meeting), it is discarded
+and the step re-runs on the full model without the cap. Premium replies and
+outgoing messages therefore always come from the full model, and the probe
+only costs a short fast call.
+
+The models are FAST_MODEL and OPENAI_MODEL (both gpt-4o-mini by default, in
+which case every route is the same model and there is nothing to probe).
+Latency is a sliding window of recent time-to-response per model (create()
+returning: headers for a streamed step, the whole reply otherwise), so a slow
+full model is retried once its window empties. Offline comparison of
+policies on recorded conversations: eval/eval_routing.py.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from agent.config import enable_fast_mode, get_fast_model, get_model
+from agent.deadline import Deadline
+from agent.metrics import MODEL_ROUTES
+
+STEP_SELECT = "select"
+STEP_ANSWER = "answer"
+
+ROUTING_FAST_MODES = frozenset(
+    m.strip() for m in os.environ.get("ROUTING_FAST_MODES", "annoyed").split(",") if m.strip()
+)
+ROUTING_FULL_MODES = frozenset(
+    m.strip() for m in os.environ.get("ROUTING_FULL_MODES", "wise").split(",") if m.strip()
+)
+# Use the full model only with at least this much of the request deadline left
+ROUTING_FULL_MIN_SECONDS = float(os.environ.get("ROUTING_FULL_MIN_SECONDS", "15"))
+# Fall back to the fast model while the full model's mean step latency is above this (0 = off)
+ROUTING_FULL_SLO_SECONDS = float(os.environ.get("ROUTING_FULL_SLO_SECONDS", "10"))
+ROUTING_LATENCY_WINDOW_SECONDS = float(os.environ.get("ROUTING_LATENCY_WINDOW_SECONDS", "300"))
+ROUTING_PROBE_MAX_TOKENS = int(os.environ.get("ROUTING_PROBE_MAX_TOKENS", "200"))
+
+
+@dataclass(frozen=True)
+class Route:
+    model: str
+    reason: str
+    # Fast, capped, non-streamed tool-selection call; a direct answer from it is dropped
+    probe: bool = False
+
+
+class ModelRouter:
+    """Chooses the model for each agent step. Thread-safe."""
+
+    def __init__(
+        self,
+        fast_model: str | None = None,
+        full_model: str | None = None,
+        fast_modes: frozenset[str] = ROUTING_FAST_MODES,
+        full_modes: frozenset[str] = ROUTING_FULL_MODES,
+        full_min_seconds: float = ROUTING_FULL_MIN_SECONDS,
+        full_slo_seconds: float = ROUTING_FULL_SLO_SECONDS,
+        window_seconds: float = ROUTING_LATENCY_WINDOW_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.fast_model = fast_model or get_fast_model()
+        self.full_model = full_model or get_model()
+        self.fast_modes = fast_modes
+        self.full_modes = full_modes
+        self.full_min_seconds = full_min_seconds
+        self.full_slo_seconds = full_slo_seconds
+        self._window = window_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._latency: dict[str, deque[tuple[float, float]]] = {}
+
+    def observe(self, model: str, seconds: float) -> None:
+        """Record one LLM step's time to response for model."""
+        now = self._clock()
+        with self._lock:
+            samples = self._latency.setdefault(model, deque(maxlen=256))
+            samples.append((now, seconds))
+
+    def latency(self, model: str) -> float | None:
+        """Mean step latency for model over the window (None without recent samples)."""
+        cutoff = self._clock() - self._window
+        with self._lock:
+            samples = self._latency.get(model)
+            if not samples:
+                return None
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+            if not samples:
+                return None
+            return sum(s for _, s in samples) / len(samples)
+
+    def _full_too_slow(self) -> bool:
+        if self.full_slo_seconds <= 0:
+            return False
+        latency = self.latency(self.full_model)
+        return latency is not None and latency > self.full_slo_seconds
+
+    def route(
+        self,
+        kind: str,
+        *,
+        mode: str = "default",
+        context: str = "public",
+        fast_mode: bool = False,
+        deadline: Deadline | None = None,
+    ) -> Route:
+        """Model for the next step of kind (STEP_SELECT or STEP_ANSWER)."""
+        if fast_mode or enable_fast_mode():
+            route = Route(self.fast_model, "fast_mode")
+        elif deadline is not None and not deadline.allows(self.full_min_seconds):
+            route = Route(self.fast_model, "deadline")
+        elif self._full_too_slow():
+            route = Route(self.fast_model, "latency_slo")
+        elif mode in self.fast_modes:
+            route = Route(self.fast_model, "mode")
+        elif mode in self.full_modes or context == "private":
+            if kind == STEP_ANSWER or self.fast_model == self.full_model:
+                route = Route(self.full_model, "premium")
+            else:
+                route = Route(self.fast_model, "tool_selection", probe=True)
+        else:
+            route = Route(self.fast_model, "default")
+        MODEL_ROUTES.inc(route.model, route.reason)
+        return route
+
+    def escalate(self, reason: str) -> Route:
+        """Full model, uncapped, for a step whose probe was rejected for reason."""
+        route = Route(self.full_model, f"probe_{reason}")
+        MODEL_ROUTES.inc(route.model, route.reason)
+        return route
+
+    def for_request(
+        self,
+        *,
+        mode: str = "default",
+        context: str = "public",
+        fast_mode: bool = False,
+        deadline: Deadline | None = None,
+        model: str | None = None,
+    ) -> RequestRouter:
+        """Router for the steps of one request (every step uses model when given)."""
+        return RequestRouter(self, mode=mode, context=context, fast_mode=fast_mode, deadline=deadline, model=model)
+
+    def stats(self) -> dict[str, Any]:
+        """Models and recent latency for /health."""
+        return {
+            "fast_model": self.fast_model,
+            "full_model": self.full_model,
+            "latency_s": {
+                model: round(latency, 3)
+                for model in {self.fast_model, self.full_model}
+                if (latency := self.latency(model)) is not None
+            },
+        }
+
+
+class RequestRouter:
+    """Routes the steps of one request."""
+
+    def __init__(
+        self,
+        router: ModelRouter,
+        *,
+        mode: str,
+        context: str,
+        fast_mode: bool,
+        deadline: Deadline | None,
+        model: str | None,
+    ) -> None:
+        self._router = router
+        self._mode = mode
+        self._context = context
+        self._fast_mode = fast_mode
+        self._deadline = deadline
+        self._model = model
+        self.routes: list[Route] = []
+
+    def route(self, kind: str) -> Route:
+        """Model for the next step of kind (STEP_SELECT or STEP_ANSWER)."""
+        if self._model:
+            route = Route(self._model, "pinned")
+        else:
+            route = self._router.route(
+                kind, mode=self._mode, context=self._context, fast_mode=self._fast_mode, deadline=self._deadline,
+            )
+        self.routes.append(route)
+        return route
+
+    def escalate(self, reason: str) -> Route:
+        """Full model for re-running a step whose probe was rejected for reason."""
+        route = self._router.escalate(reason)
+        self.routes.append(route)
+        return route
+
+    def observe(self, route: Route, seconds: float) -> None:
+        self._router.observe(route.model, seconds)
+
+
+_router: ModelRouter | None = None
+
+
+def get_router() -> ModelRouter:
+    """Return shared model router singleton."""
+    global _router
+    if _router is None:
+        _router = ModelRouter()
+    return _router
@@ -5,13 +5,27 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
-import time
-from typing import Any, AsyncGenerator
+from typing import Any, AsyncGenerator, AsyncIterator
 
 from openai import AsyncOpenAI
 
-from agent.config import get_openai_max_tokens, get_openai_timeout_seconds
+from agent.config import (
+    enable_fast_mode,
+    get_fast_max_tokens,
+    get_openai_max_tokens,
+    get_openai_timeout_seconds,
+)
+from agent.deadline import DEADLINE_FINAL_ANSWER_SECONDS, DEADLINE_WEB_SEARCH_SECONDS, Deadline
 from agent.prompts import get_system_prompt
+from agent.routing import (
+    ROUTING_PROBE_MAX_TOKENS,
+    STEP_ANSWER,
+    STEP_SELECT,
+    ModelRouter,
+    RequestRouter,
+    Route,
+    get_router,
+)
 from agent.skills import get_allowed_tools
 from agent.stream_events import (
     MAX_QUERY_PREVIEW_LENGTH,
@@ -20,22 +34,35 @@ from agent.stream_events import (
     TYPE_DELTA,
     TYPE_SOURCES,
     TYPE_STATUS,
+    TYPE_USAGE,
     build_status_event,
 )
-from tools import execute_tool, get_tool_definitions
+from agent.tracing import Span, get_tracer
+from agent.usage import Usage, estimate_usage, get_usage_tracker, usage_from_response
+from tools import SIDE_EFFECT_TOOLS, execute_tool, get_tool_definitions
 
 MAX_STEPS = 5
-DEFAULT_MODEL = "gpt-4o-mini"
+
+# Replies when the loop can't produce an answer (never cached)
+TIMEOUT_MESSAGE = "I'm sorry, the request took too long. Please try again."
+INCOMPLETE_MESSAGE = "I'm sorry, I wasn't able to complete that. Please try again."
+FALLBACK_MESSAGES = frozenset({TIMEOUT_MESSAGE, INCOMPLETE_MESSAGE})
+# Tool results when a tool is skipped or cut short to stay within the request deadline
+WEB_SEARCH_SKIPPED = "Web search skipped: not enough time left for this request. Answer from what you already know."
+TOOL_SKIPPED = "Tool skipped: no time left for this request. Answer from what you already know."
 
 logger = logging.getLogger(__name__)
-perf_logger = logging.getLogger("agent.performance")
 _MAX_LOG_RESULT = 200
+# Side-effecting tools still running after their request was cancelled
+_background_tools: set[asyncio.Task] = set()
 
 
-def _create_kwargs() -> dict[str, Any]:
+def _create_kwargs(fast_mode: bool = False) -> dict[str, Any]:
     """Build common kwargs for chat.completions.create (max_tokens, etc.)."""
     kwargs: dict[str, Any] = {}
     max_tokens = get_openai_max_tokens()
+    if fast_mode:
+        max_tokens = min(max_tokens or get_fast_max_tokens(), get_fast_max_tokens())
     if max_tokens is not None:
         kwargs["max_completion_tokens"] = max_tokens
     # Temperature balanced for natural but consistent responses
@@ -43,6 +70,26 @@ def _create_kwargs() -> dict[str, Any]:
     return kwargs
 
 
+def _record_usage(
+    raw_usage: Any,
+    model: str,
+    usage: Usage,
+    request_id: str | None,
+    span: Span | None = None,
+) -> None:
+    """Add one LLM call's usage to the request accumulator and the shared tracker."""
+    call_usage = usage_from_response(raw_usage, model)
+    if call_usage is None:
+        return
+    usage.add(call_usage)
+    if span is not None:
+        span.set_attributes(
+            prompt_tokens=call_usage.prompt_tokens,
+            completion_tokens=call_usage.completion_tokens,
+        )
+    get_usage_tracker().record(call_usage, model=model, request_id=request_id)
+
+
 def _tool_subtitle(tool_name: str, args: dict[str, Any]) -> str:
     """Build a dynamic user-facing subtitle from the tool name and arguments."""
     query = (args.get("query") or "").strip()
@@ -131,76 +178,293 @@ def _messages_for_openai(
     return openai_messages
 
 
+def _tool_choice(deadline: Deadline, step_span: Span) -> str:
+    """"auto", or "none" to force a final answer when the deadline is close."""
+    if deadline.allows(DEADLINE_FINAL_ANSWER_SECONDS):
+        return "auto"
+    deadline.degrade("final_answer")
+    step_span.set_attribute("forced_final", True)
+    return "none"
+
+
+def _tool_kwargs(tools: list[dict[str, Any]], tool_choice: str) -> dict[str, Any]:
+    """tools/tool_choice for create(); omitted when the request has no tools (the API rejects tool_choice alone)."""
+    return {"tools": tools, "tool_choice": tool_choice} if tools else {}
+
+
+def _step_kind(tools: list[dict[str, Any]], tools_ran: bool, tool_choice: str) -> str:
+    """STEP_ANSWER once tool results are in or tools can't be called, else STEP_SELECT."""
+    return STEP_ANSWER if tools_ran or not tools or tool_choice == "none" else STEP_SELECT
+
+
+def _route_kwargs(create_kwargs: dict[str, Any], route: Route) -> dict[str, Any]:
+    """create() kwargs for a routed step (a selection probe gets a small completion cap)."""
+    if not route.probe:
+        return create_kwargs
+    cap = min(create_kwargs.get("max_completion_tokens") or ROUTING_PROBE_MAX_TOKENS, ROUTING_PROBE_MAX_TOKENS)
+    return {**create_kwargs, "max_completion_tokens": cap}
+
+
+def _rejected_probe(route: Route, choice: Any) -> str | None:
+    """Why a probe's reply can't be used (the step re-runs on the full model), or None.
+
+    A probe cut off by its token cap may hold truncated tool arguments, and
+    side-effecting tools (e.g. send_email) are written by the full model.
+    """
+    if not route.probe:
+        return None
+    if choice.finish_reason == "length":
+        return "length"
+    if any(tc.function.name in SIDE_EFFECT_TOOLS for tc in choice.message.tool_calls or []):
+        return "side_effect"
+    return None
+
+
+def _tool_arguments(raw: str | None) -> tuple[dict[str, Any], str | None]:
+    """(arguments, None), or ({}, an error result for the model) if raw isn't a JSON object."""
+    if not raw:
+        return {}, None
+    try:
+        args = json.loads(raw)
+    except json.JSONDecodeError as e:
+        return {}, f"Tool argument error: arguments are not valid JSON ({e.msg}). Call the tool again with complete arguments."
+    if not isinstance(args, dict):
+        return {}, "Tool argument error: arguments must be a JSON object."
+    return args, None
+
+
+def _skip_tool(name: str, deadline: Deadline) -> str | None:
+    """Result to use instead of running a tool the deadline can't afford (None: run it).
+
+    Checked before each tool call of a step; side-effecting tools always run.
+    """
+    if name in SIDE_EFFECT_TOOLS:
+        return None
+    if name == "web_search" and not deadline.allows(DEADLINE_WEB_SEARCH_SECONDS):
+        deadline.degrade("web_search")
+        return WEB_SEARCH_SKIPPED
+    if deadline.expired:
+        deadline.degrade("tools")
+        return TOOL_SKIPPED
+    return None
+
+
+async def _execute_tool(name: str, args: dict[str, Any], deadline: Deadline) -> str:
+    """Run a tool in a worker thread, so a slow one doesn't block the event loop.
+
+    A read-only tool is awaited until the deadline; on timeout or cancellation
+    its thread finishes in the background and the result is dropped. A
+    side-effecting tool (SIDE_EFFECT_TOOLS) is shielded: once started it runs
+    to completion even if the request is cancelled.
+    """
+    task = asyncio.ensure_future(asyncio.to_thread(execute_tool, name, args, timeout=deadline.timeout()))
+    if name in SIDE_EFFECT_TOOLS:
+        _background_tools.add(task)
+        task.add_done_callback(_background_tools.discard)
+        return await asyncio.shield(task)
+    try:
+        async with asyncio.timeout_at(deadline.at()):
+            return await task
+    except TimeoutError:
+        deadline.degrade("tools")
+        return TOOL_SKIPPED
+
+
+def _record_estimated_usage(
+    openai_messages: list[dict[str, Any]],
+    completion_chars: int,
+    model: str,
+    usage: Usage,
+    request_id: str | None,
+    span: Span | None = None,
+) -> None:
+    """Record an estimate for a streamed call that ended before its usage chunk (cancelled or timed out)."""
+    call_usage = estimate_usage(model, len(json.dumps(openai_messages)), completion_chars)
+    usage.add(call_usage)
+    if span is not None:
+        span.set_attributes(
+            prompt_tokens=call_usage.prompt_tokens,
+            completion_tokens=call_usage.completion_tokens,
+            usage_estimated=True,
+        )
+    get_usage_tracker().record(call_usage, model=model, request_id=request_id)
+
+
 async def _run_agent_sync(
     client: AsyncOpenAI,
     openai_messages: list[dict[str, Any]],
-    model: str,
+    routing: RequestRouter,
     tools: list[dict[str, Any]],
+    usage: Usage,
     request_id: str | None = None,
+    fast_mode: bool = False,
+    deadline: Deadline | None = None,
+    tools_used: set[str] | None = None,
 ) -> tuple[str, list[str]]:
     """Run the loop without streaming; return (final text, tools_used)."""
-    tools_used: set[str] = set()
+    deadline = deadline or Deadline()
+    tools_used = set() if tools_used is None else tools_used
+    tools_ran = answer_only = False
+    escalate: str | None = None
     step = 0
     timeout_sec = get_openai_timeout_seconds()
-    create_kwargs = _create_kwargs()
+    create_kwargs = _create_kwargs(fast_mode)
     req_log = f" request_id={request_id}" if request_id else ""
     while step < MAX_STEPS:
         step += 1
-        try:
-            response = await asyncio.wait_for(
-                client.chat.completions.create(
-                    model=model,
-                    messages=openai_messages,
-                    tools=tools,
-                    tool_choice="auto",
-                    stream=False,
-                    **create_kwargs,
-                ),
-                timeout=timeout_sec,
-            )
-        except asyncio.TimeoutError:
-            logger.warning("OpenAI request timed out after %s s%s", timeout_sec, req_log)
-            return ("I'm sorry, the request took too long. Please try again.", sorted(tools_used))
-        choice = response.choices[0]
-        message = choice.message
-        if getattr(message, "tool_calls", None) and message.tool_calls:
-            openai_messages.append(
-                {
-                    "role": "assistant",
-                    "content": message.content or "",
-                    "tool_calls": [
-                        {
-                            "id": tc.id,
-                            "type": "function",
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments or "{}",
-                            },
-                        }
-                        for tc in message.tool_calls
-                    ],
-                }
-            )
-            tool_results = []
-            for tc in message.tool_calls:
-                tools_used.add(tc.function.name)
-                args = json.loads(tc.function.arguments) if tc.function.arguments else {}
-                logger.info("tool_call name=%s args=%s%s", tc.function.name, args, req_log)
-                result = execute_tool(tc.function.name, args)
-                preview = result[: _MAX_LOG_RESULT] + "..." if len(result) > _MAX_LOG_RESULT else result
-                logger.info("tool_result name=%s preview=%s%s", tc.function.name, preview, req_log)
-                tool_results.append(
-                    {"type": "tool_result", "tool_use_id": tc.id, "content": result}
+        with get_tracer().span(
+            "llm.step", request_id=request_id, step=step, stream=False,
+        ) as step_span:
+            tool_choice = "none" if answer_only else _tool_choice(deadline, step_span)
+            if escalate:
+                route, escalate = routing.escalate(escalate), None
+            else:
+                route = routing.route(_step_kind(tools, tools_ran, tool_choice))
+            step_span.set_attributes(model=route.model, route=route.reason)
+            try:
+                if deadline.expired:
+                    raise asyncio.TimeoutError
+                response = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=route.model,
+                        messages=openai_messages,
+                        **_tool_kwargs(tools, tool_choice),
+                        stream=False,
+                        **_route_kwargs(create_kwargs, route),
+                    ),
+                    timeout=deadline.timeout(timeout_sec),
                 )
-            for tr in tool_results:
-                openai_messages.append({
-                    "role": "tool",
-                    "tool_call_id": tr["tool_use_id"],
-                    "content": tr["content"],
-                })
-            continue
-        return ((message.content or "").strip(), sorted(tools_used))
-    return ("I'm sorry, I wasn't able to complete that. Please try again.", sorted(tools_used))
+            except asyncio.TimeoutError:
+                logger.warning("OpenAI request timed out (%.1f s left in the request)%s", deadline.remaining, req_log)
+                step_span.set_attribute("timeout", True)
+                deadline.degrade("timeout")
+                return (TIMEOUT_MESSAGE, sorted(tools_used))
+            routing.observe(route, step_span.duration_s)
+            _record_usage(response.usage, route.model, usage, request_id, step_span)
+            choice = response.choices[0]
+            message = choice.message
+            escalate = _rejected_probe(route, choice)
+            if escalate:
+                logger.info("probe rejected (%s); re-running on the full model%s", escalate, req_log)
+                step_span.set_attribute("probe_rejected", escalate)
+                continue
+            if getattr(message, "tool_calls", None) and message.tool_calls:
+                openai_messages.append(
+                    {
+                        "role": "assistant",
+                        "content": message.content or "",
+                        "tool_calls": [
+                            {
+                                "id": tc.id,
+                                "type": "function",
+                                "function": {
+                                    "name": tc.function.name,
+                                    "arguments": tc.function.arguments or "{}",
+                                },
+                            }
+                            for tc in message.tool_calls
+                        ],
+                    }
+                )
+                tool_results = []
+                for tc in message.tool_calls:
+                    args, result = _tool_arguments(tc.function.arguments)
+                    if result is not None:
+                        logger.warning("tool_arguments_invalid name=%s%s", tc.function.name, req_log)
+                        tool_results.append({"type": "tool_result", "tool_use_id": tc.id, "content": result})
+                        continue
+                    result = _skip_tool(tc.function.name, deadline)
+                    if result is not None:
+                        logger.info("tool_skipped name=%s (%.1f s left)%s", tc.function.name, deadline.remaining, req_log)
+                        tool_results.append({"type": "tool_result", "tool_use_id": tc.id, "content": result})
+                        continue
+                    tools_used.add(tc.function.name)
+                    logger.info("tool_call name=%s args=%s%s", tc.function.name, args, req_log)
+                    usage.tool_calls += 1
+                    result = await _execute_tool(tc.function.name, args, deadline)
+                    preview = result[: _MAX_LOG_RESULT] + "..." if len(result) > _MAX_LOG_RESULT else result
+                    logger.info("tool_result name=%s preview=%s%s", tc.function.name, preview, req_log)
+                    tool_results.append(
+                        {"type": "tool_result", "tool_use_id": tc.id, "content": result}
+                    )
+                for tr in tool_results:
+                    openai_messages.append({
+                        "role": "tool",
+                        "tool_call_id": tr["tool_use_id"],
+                        "content": tr["content"],
+                    })
+                tools_ran = True
+                continue
+            if route.probe:
+                # The selection probe answered directly; the full model writes the reply
+                answer_only = True
+                continue
+            return ((message.content or "").strip(), sorted(tools_used))
+    return (INCOMPLETE_MESSAGE, sorted(tools_used))
+
+
+class _ToolCallBuffer:
+    """One streamed tool call; argument fragments are joined once, after the stream."""
+
+    __slots__ = ("id", "name", "parts")
+
+    def __init__(self) -> None:
+        self.id = ""
+        self.name = ""
+        self.parts: list[str] = []
+
+    @property
+    def arguments(self) -> str:
+        return "".join(self.parts)
+
+
+class _ReadDeadline:
+    """Bounds each read of a completion stream by one end time, never a yield.
+
+    Same effect as asyncio.timeout_at around every __anext__(), with one timer
+    per stream instead of one per chunk (the per-chunk hot path): the timer
+    cancels the task only while it is waiting in read(), and that cancellation
+    surfaces as TimeoutError. Once the end time has passed, read() raises at once.
+    """
+
+    __slots__ = ("_task", "_handle", "_reading", "_expired", "_fired")
+
+    def __init__(self, when: float | None) -> None:
+        self._task = asyncio.current_task()
+        self._reading = self._expired = self._fired = False
+        self._handle = None if when is None else asyncio.get_running_loop().call_at(when, self._expire)
+
+    def _expire(self) -> None:
+        self._expired = True
+        if self._reading:
+            self._fired = True
+            self._task.cancel()
+
+    async def read(self, chunks: AsyncIterator[Any]) -> Any:
+        """The next chunk; StopAsyncIteration at the end, TimeoutError past the end time."""
+        if self._expired:
+            raise TimeoutError
+        self._reading = True
+        try:
+            return await anext(chunks)
+        except asyncio.CancelledError:
+            if self._fired and self._task.uncancel() == 0:
+                raise TimeoutError from None
+            raise
+        finally:
+            self._reading = False
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+
+
+async def _close_stream(response: Any) -> None:
+    """Close a completion stream; if it wasn't fully read, this stops generation upstream."""
+    try:
+        await response.close()
+    except Exception as e:
+        logger.debug("closing completion stream failed: %s", e)
 
 
 def _sources_event(tools_used: set[str]) -> dict[str, Any]:
@@ -211,127 +475,259 @@ def _sources_event(tools_used: set[str]) -> dict[str, Any]:
 async def _run_agent_stream(
     client: AsyncOpenAI,
     openai_messages: list[dict[str, Any]],
-    model: str,
+    routing: RequestRouter,
     tools: list[dict[str, Any]],
+    usage: Usage,
     request_id: str | None = None,
+    trace_parent: Span | None = None,
+    fast_mode: bool = False,
+    deadline: Deadline | None = None,
+    tools_used: set[str] | None = None,
 ) -> AsyncGenerator[dict[str, Any], None]:
-    """Run the loop with streaming; yield status, delta, and sources events for the UI."""
-    tools_used: set[str] = set()
+    """Run the loop with streaming; yield status, delta, and sources events for the UI.
+
+    Spans are started with an explicit parent and ended in finally blocks, since a
+    ContextVar-scoped span can't be held across yields of an async generator.
+
+    Cancellation (the client disconnected) lands at the current await: the
+    model call, the stream read (which then closes the upstream stream) or a
+    tool. Tools run one at a time in worker threads (_execute_tool), so later
+    tools of the step never start; a running read-only tool is abandoned, a
+    side-effecting one (e.g. send_email) is shielded and completes. A streamed
+    step cut off before its usage chunk is recorded as an estimate, so usage
+    (which the caller may own and read after a cancel) still covers it.
+
+    Each step (create() through the last chunk) is bounded by the request
+    deadline: create() and every chunk read wait at most until the step's end.
+    Only those awaits are timed, never a yield, so any consumer may iterate.
+    """
+    deadline = deadline or Deadline()
+    tracer = get_tracer()
+    tools_used = set() if tools_used is None else tools_used
+    tools_ran = answer_only = False
+    # The first step that isn't a selection probe streams; later steps return whole replies
+    stream_pending = True
+    escalate: str | None = None
     step = 0
     timeout_sec = get_openai_timeout_seconds()
-    create_kwargs = _create_kwargs()
+    create_kwargs = _create_kwargs(fast_mode)
     req_log = f" request_id={request_id}" if request_id else ""
     while step < MAX_STEPS:
         step += 1
-        use_stream = step == 1
-        step_start = time.time()
-        logger.info("stream step %s use_stream=%s%s", step, use_stream, req_log)
-        yield build_status_event(PHASE_THINKING, "Thinking...")
+        step_span = tracer.start_span("llm.step", parent=trace_parent, request_id=request_id, step=step)
         try:
-            llm_start = time.time()
-            if use_stream:
-                response = await client.chat.completions.create(
-                    model=model,
-                    messages=openai_messages,
-                    tools=tools,
-                    tool_choice="auto",
-                    stream=True,
-                    **create_kwargs,
-                )
-                llm_init_time = time.time() - llm_start
-                perf_logger.info(f"[{request_id}] LLM init (step {step}): {llm_init_time:.3f}s")
-                logger.info("stream step %s create() returned, consuming stream%s", step, req_log)
+            tool_choice = "none" if answer_only else _tool_choice(deadline, step_span)
+            if escalate:
+                route, escalate = routing.escalate(escalate), None
             else:
-                response = await asyncio.wait_for(
-                    client.chat.completions.create(
-                        model=model,
+                route = routing.route(_step_kind(tools, tools_ran, tool_choice))
+            use_stream = stream_pending and not route.probe
+            step_span.set_attributes(model=route.model, route=route.reason, stream=use_stream)
+            logger.info("stream step %s use_stream=%s model=%s route=%s%s", step, use_stream, route.model, route.reason, req_log)
+            yield build_status_event(PHASE_THINKING, "Thinking...")
+            step_ends = deadline.at(timeout_sec)
+            try:
+                if deadline.expired:
+                    raise asyncio.TimeoutError
+                async with asyncio.timeout_at(step_ends):
+                    response = await client.chat.completions.create(
+                        model=route.model,
                         messages=openai_messages,
-                        tools=tools,
-                        tool_choice="auto",
-                        stream=False,
-                        **create_kwargs,
-                    ),
-                    timeout=timeout_sec,
-                )
-        except asyncio.TimeoutError:
-            logger.warning("OpenAI request timed out after %s s%s", timeout_sec, req_log)
-            yield _sources_event(tools_used)
-            yield {"type": TYPE_DELTA, "delta": "I'm sorry, the request took too long. Please try again."}
-            return
+                        **_tool_kwargs(tools, tool_choice),
+                        stream=use_stream,
+                        **({"stream_options": {"include_usage": True}} if use_stream else {}),
+                        **_route_kwargs(create_kwargs, route),
+                    )
+                routing.observe(route, step_span.duration_s)
+                if use_stream:
+                    step_span.set_attribute("create_s", round(step_span.duration_s, 3))
+                    logger.info("stream step %s create() returned, consuming stream%s", step, req_log)
+            except asyncio.TimeoutError:
+                logger.warning("OpenAI request timed out (%.1f s left in the request)%s", deadline.remaining, req_log)
+                step_span.set_attribute("timeout", True)
+                deadline.degrade("timeout")
+                yield _sources_event(tools_used)
+                yield {"type": TYPE_DELTA, "delta": TIMEOUT_MESSAGE}
+                return
 
-        if use_stream:
-            tool_calls_buffer: list[dict[str, Any]] = []
-            chunk_count = 0
-            async for chunk in response:
-                chunk_count += 1
-                if chunk_count == 1 or chunk_count % 20 == 0:
-                    logger.info("stream step %s chunk %s%s", step, chunk_count, req_log)
-                delta = chunk.choices[0].delta if chunk.choices else None
-                if not delta:
+            if use_stream:
+                tool_calls_buffer: list[_ToolCallBuffer] = []
+                chunk_count = completion_chars = 0
+                streamed = timed_out = usage_recorded = False
+                stream_span = tracer.start_span("llm.stream", parent=step_span, request_id=request_id, step=step)
+                read_deadline = _ReadDeadline(step_ends)
+                try:
+                    # Per-chunk hot path: plain attribute reads on the typed chunk,
+                    # one event dict per content delta, no string concatenation.
+                    chunks = aiter(response)
+                    while True:
+                        try:
+                            chunk = await read_deadline.read(chunks)
+                        except StopAsyncIteration:
+                            break
+                        chunk_count += 1
+                        if chunk_count == 1:
+                            logger.info("stream step %s first chunk%s", step, req_log)
+                        elif chunk_count % 20 == 0:
+                            logger.debug("stream step %s chunk %s%s", step, chunk_count, req_log)
+                        if chunk.usage:
+                            # Final chunk (include_usage) carries usage and no choices.
+                            _record_usage(chunk.usage, route.model, usage, request_id, step_span)
+                            usage_recorded = True
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta
+                        content = delta.content
+                        if content:
+                            streamed = True
+                            completion_chars += len(content)
+                            yield {"type": TYPE_DELTA, "delta": content}
+                        if delta.tool_calls:
+                            for tc in delta.tool_calls:
+                                idx = tc.index if tc.index is not None else len(tool_calls_buffer)
+                                while len(tool_calls_buffer) <= idx:
+                                    tool_calls_buffer.append(_ToolCallBuffer())
+                                call = tool_calls_buffer[idx]
+                                if tc.id:
+                                    call.id = tc.id
+                                if tc.function:
+                                    if tc.function.name:
+                                        call.name = tc.function.name
+                                    if tc.function.arguments:
+                                        call.parts.append(tc.function.arguments)
+                                        completion_chars += len(tc.function.arguments)
+                except asyncio.TimeoutError:
+                    timed_out = True
+                except (asyncio.CancelledError, GeneratorExit):
+                    # Client gone (main.py cancels the stream); don't pay for the rest
+                    step_span.set_attribute("cancelled", True)
+                    raise
+                finally:
+                    read_deadline.close()
+                    if not usage_recorded:
+                        _record_estimated_usage(openai_messages, completion_chars, route.model, usage, request_id, step_span)
+                    await _close_stream(response)
+                    stream_span.end(chunks=chunk_count)
+                if timed_out:
+                    logger.warning("OpenAI stream timed out (%.1f s left in the request)%s", deadline.remaining, req_log)
+                    step_span.set_attribute("timeout", True)
+                    deadline.degrade("timeout")
+                    yield _sources_event(tools_used)
+                    yield {"type": TYPE_DELTA, "delta": ("\n\n" if streamed else "") + TIMEOUT_MESSAGE}
+                    return
+                stream_pending = False
+                logger.info("stream step %s stream done chunks=%s tool_calls_buffer=%s%s", step, chunk_count, len(tool_calls_buffer), req_log)
+                calls = [(t, t.arguments) for t in tool_calls_buffer if t.name]
+                if calls:
+                    tool_calls_for_api = [
+                        {
+                            "id": t.id,
+                            "type": "function",
+                            "function": {
+                                "name": t.name,
+                                "arguments": arguments or "{}",
+                            },
+                        }
+                        for t, arguments in calls
+                    ]
+                    openai_messages.append({
+                        "role": "assistant",
+                        "content": None,
+                        "tool_calls": tool_calls_for_api,
+                    })
+                    tool_results = []
+                    for t, arguments in calls:
+                        args, result = _tool_arguments(arguments)
+                        if result is not None:
+                            logger.warning("tool_arguments_invalid name=%s%s", t.name, req_log)
+                            tool_results.append({"type": "tool_result", "tool_use_id": t.id, "content": result})
+                            continue
+                        result = _skip_tool(t.name, deadline)
+                        if result is not None:
+                            logger.info("tool_skipped name=%s (%.1f s left)%s", t.name, deadline.remaining, req_log)
+                            tool_results.append({"type": "tool_result", "tool_use_id": t.id, "content": result})
+                            continue
+                        tools_used.add(t.name)
+                        logger.info("tool_call name=%s args=%s%s", t.name, args, req_log)
+                        subtitle = _tool_subtitle(t.name, args)
+                        yield build_status_event(
+                            PHASE_TOOL_START, subtitle, tool=t.name
+                        )
+                        with tracer.activate(step_span):
+                            usage.tool_calls += 1
+                            result = await _execute_tool(t.name, args, deadline)
+                        preview = result[: _MAX_LOG_RESULT] + "..." if len(result) > _MAX_LOG_RESULT else result
+                        logger.info("tool_result name=%s preview=%s%s", t.name, preview, req_log)
+                        tool_results.append(
+                            {
+                                "type": "tool_result",
+                                "tool_use_id": t.id,
+                                "content": result,
+                            }
+                        )
+                    for tr in tool_results:
+                        openai_messages.append({
+                            "role": "tool",
+                            "tool_call_id": tr["tool_use_id"],
+                            "content": tr["content"],
+                        })
+                    tools_ran = True
                     continue
-                if getattr(delta, "content", None) and delta.content:
-                    yield {"type": TYPE_DELTA, "delta": delta.content}
-                if getattr(delta, "tool_calls", None) and delta.tool_calls:
-                    for tc in delta.tool_calls:
-                        idx = tc.index if tc.index is not None else len(tool_calls_buffer)
-                        while len(tool_calls_buffer) <= idx:
-                            tool_calls_buffer.append(
-                                {"id": "", "name": "", "arguments": ""}
-                            )
-                        if tc.id:
-                            tool_calls_buffer[idx]["id"] = tc.id
-                        if tc.function:
-                            if tc.function.name:
-                                tool_calls_buffer[idx]["name"] = tc.function.name
-                            if tc.function.arguments:
-                                tool_calls_buffer[idx]["arguments"] += (
-                                    tc.function.arguments or ""
-                                )
-
-            stream_time = time.time() - llm_start
-            perf_logger.info(f"[{request_id}] LLM streaming (step {step}): {stream_time:.3f}s ({chunk_count} chunks)")
-            logger.info("stream step %s stream done chunks=%s tool_calls_buffer=%s%s", step, chunk_count, len(tool_calls_buffer), req_log)
-            if tool_calls_buffer and any(t.get("name") for t in tool_calls_buffer):
-                tool_calls_for_api = [
+                yield _sources_event(tools_used)
+                return
+
+            # Non-streaming step (after the streamed one, or a selection probe)
+            _record_usage(response.usage, route.model, usage, request_id, step_span)
+            choice = response.choices[0]
+            message = choice.message
+            escalate = _rejected_probe(route, choice)
+            if escalate:
+                logger.info("probe rejected (%s); re-running on the full model%s", escalate, req_log)
+                step_span.set_attribute("probe_rejected", escalate)
+                continue
+            if getattr(message, "tool_calls", None) and message.tool_calls:
+                openai_messages.append(
                     {
-                        "id": t["id"],
-                        "type": "function",
-                        "function": {
-                            "name": t["name"],
-                            "arguments": t.get("arguments") or "{}",
-                        },
+                        "role": "assistant",
+                        "content": message.content or "",
+                        "tool_calls": [
+                            {
+                                "id": tc.id,
+                                "type": "function",
+                                "function": {
+                                    "name": tc.function.name,
+                                    "arguments": tc.function.arguments or "{}",
+                                },
+                            }
+                            for tc in message.tool_calls
+                        ],
                     }
-                    for t in tool_calls_buffer
-                    if t.get("name")
-                ]
-                openai_messages.append({
-                    "role": "assistant",
-                    "content": None,
-                    "tool_calls": tool_calls_for_api,
-                })
+                )
                 tool_results = []
-                for t in tool_calls_buffer:
-                    if not t.get("name"):
+                for tc in message.tool_calls:
+                    args, result = _tool_arguments(tc.function.arguments)
+                    if result is not None:
+                        logger.warning("tool_arguments_invalid name=%s%s", tc.function.name, req_log)
+                        tool_results.append({"type": "tool_result", "tool_use_id": tc.id, "content": result})
+                        continue
+                    result = _skip_tool(tc.function.name, deadline)
+                    if result is not None:
+                        logger.info("tool_skipped name=%s (%.1f s left)%s", tc.function.name, deadline.remaining, req_log)
+                        tool_results.append({"type": "tool_result", "tool_use_id": tc.id, "content": result})
                         continue
-                    tools_used.add(t["name"])
-                    args = json.loads(t["arguments"]) if t.get("arguments") else {}
-                    logger.info("tool_call name=%s args=%s%s", t["name"], args, req_log)
-                    subtitle = _tool_subtitle(t["name"], args)
+                    tools_used.add(tc.function.name)
+                    logger.info("tool_call name=%s args=%s%s", tc.function.name, args, req_log)
+                    subtitle = _tool_subtitle(tc.function.name, args)
                     yield build_status_event(
-                        PHASE_TOOL_START, subtitle, tool=t["name"]
+                        PHASE_TOOL_START, subtitle, tool=tc.function.name
                     )
-                    tool_start = time.time()
-                    result = execute_tool(t["name"], args)
-                    tool_time = time.time() - tool_start
-                    perf_logger.info(f"[{request_id}] Tool {t['name']}: {tool_time:.3f}s")
+                    with tracer.activate(step_span):
+                        usage.tool_calls += 1
+                        result = await _execute_tool(tc.function.name, args, deadline)
                     preview = result[: _MAX_LOG_RESULT] + "..." if len(result) > _MAX_LOG_RESULT else result
-                    logger.info("tool_result name=%s preview=%s%s", t["name"], preview, req_log)
+                    logger.info("tool_result name=%s preview=%s%s", tc.function.name, preview, req_log)
                     tool_results.append(
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": t["id"],
-                            "content": result,
-                        }
+                        {"type": "tool_result", "tool_use_id": tc.id, "content": result}
                     )
                 for tr in tool_results:
                     openai_messages.append({
@@ -339,72 +735,41 @@ async def _run_agent_stream(
                         "tool_call_id": tr["tool_use_id"],
                         "content": tr["content"],
                     })
+                tools_ran = True
                 continue
-            step_time = time.time() - step_start
-            perf_logger.info(f"[{request_id}] Step {step} total: {step_time:.3f}s")
+            if route.probe:
+                # The selection probe answered directly; the full model streams the reply
+                answer_only = True
+                continue
+            text = (message.content or "").strip()
+            if text:
+                yield {"type": TYPE_DELTA, "delta": text}
             yield _sources_event(tools_used)
             return
-
-        # Non-streaming step (step > 1)
-        choice = response.choices[0]
-        message = choice.message
-        if getattr(message, "tool_calls", None) and message.tool_calls:
-            openai_messages.append(
-                {
-                    "role": "assistant",
-                    "content": message.content or "",
-                    "tool_calls": [
-                        {
-                            "id": tc.id,
-                            "type": "function",
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments or "{}",
-                            },
-                        }
-                        for tc in message.tool_calls
-                    ],
-                }
-            )
-            tool_results = []
-            for tc in message.tool_calls:
-                tools_used.add(tc.function.name)
-                args = json.loads(tc.function.arguments) if tc.function.arguments else {}
-                logger.info("tool_call name=%s args=%s%s", tc.function.name, args, req_log)
-                subtitle = _tool_subtitle(tc.function.name, args)
-                yield build_status_event(
-                    PHASE_TOOL_START, subtitle, tool=tc.function.name
-                )
-                result = execute_tool(tc.function.name, args)
-                preview = result[: _MAX_LOG_RESULT] + "..." if len(result) > _MAX_LOG_RESULT else result
-                logger.info("tool_result name=%s preview=%s%s", tc.function.name, preview, req_log)
-                tool_results.append(
-                    {"type": "tool_result", "tool_use_id": tc.id, "content": result}
-                )
-            for tr in tool_results:
-                openai_messages.append({
-                    "role": "tool",
-                    "tool_call_id": tr["tool_use_id"],
-                    "content": tr["content"],
-                })
-            continue
-        text = (message.content or "").strip()
-        if text:
-            yield {"type": TYPE_DELTA, "delta": text}
-        yield _sources_event(tools_used)
-        return
+        finally:
+            step_span.end()
 
     yield _sources_event(tools_used)
     yield {
         "type": TYPE_DELTA,
-        "delta": "I'm sorry, I wasn't able to complete that. Please try again.",
+        "delta": INCOMPLETE_MESSAGE,
     }
 
 
+async def _with_usage_event(
+    events: AsyncGenerator[dict[str, Any], None],
+    usage: Usage,
+) -> AsyncGenerator[dict[str, Any], None]:
+    """Re-yield runner events, then a final usage event with the request's token totals."""
+    async for item in events:
+        yield item
+    yield {"type": TYPE_USAGE, **usage.to_dict()}
+
+
 async def run_agent(
     messages: list[dict[str, Any]],
     *,
-    model: str = DEFAULT_MODEL,
+    model: str | None = None,
     context: str = "public",
     skill: str = "answer_about_bill",
     memory: str | None = None,
@@ -412,12 +777,19 @@ async def run_agent(
     stream: bool = False,
     request_id: str | None = None,
     mode: str = "default",
+    fast_mode: bool = False,
+    disabled_tools: frozenset[str] = frozenset(),
+    deadline: Deadline | None = None,
+    router: ModelRouter | None = None,
+    usage: Usage | None = None,
+    tools_used: set[str] | None = None,
 ) -> dict[str, Any] | AsyncGenerator[dict[str, Any], None]:
     """Run the agent loop until the model returns a final text response.
 
     Args:
         messages: Conversation history (each has role and content).
-        model: OpenAI model name.
+        model: OpenAI model for every step (default: routed per step between
+            FAST_MODEL and OPENAI_MODEL, see agent/routing.py).
         context: "public" or "private" for system prompt.
         memory: Optional memory from Mem0.
         visitor_context: Optional visitor profile context.
@@ -427,16 +799,52 @@ async def run_agent(
             otherwise return a dict with message and sources.
         request_id: Optional ID for request tracing in logs.
         mode: Conversation mode (default, funny, wise, annoyed).
+        fast_mode: Use the fast model for every step with a lower completion
+            cap (also on when FAST_MODE=true; overrides model).
+        disabled_tools: Tool names to withhold from the model for this request
+            (e.g. web_search when the visitor's budget is low).
+        deadline: The request's end-to-end deadline (default: a new
+            REQUEST_DEADLINE_SECONDS budget); every LLM step and tool is bounded by it.
+        router: Model router (default: the shared one from get_router()).
+        usage: Accumulator for the request's token and tool-call usage (default:
+            a new one). Pass one to charge a stream that was cancelled before
+            its final usage event.
+        tools_used: Set the names of tools that ran are added to (default: a
+            new one), readable by the caller after a cancel like usage.
 
     Returns:
-        If stream is False: {"message": str, "sources": list[str]}.
-        If stream is True: an async generator that yields status, delta, and sources events.
+        If stream is False: {"message": str, "sources": list[str], "usage": dict}.
+        If stream is True: an async generator that yields status, delta, and sources
+        events, followed by a final usage event.
     """
     client = AsyncOpenAI(timeout=get_openai_timeout_seconds())
     system_prompt = get_system_prompt(context, skill, memory, visitor_context, mode)
     openai_messages = _messages_for_openai(messages, system_prompt)
-    tools = get_tool_definitions(get_allowed_tools(skill))
+    allowed_tools = get_allowed_tools(skill)
+    tools = get_tool_definitions(allowed_tools)
+    if disabled_tools:
+        names = allowed_tools or [t["function"]["name"] for t in tools]
+        allowed_tools = [name for name in names if name not in disabled_tools]
+        # get_tool_definitions reads an empty list as "all tools"
+        tools = get_tool_definitions(allowed_tools) if allowed_tools else []
+    fast_mode = fast_mode or enable_fast_mode()
+    deadline = deadline or Deadline()
+    routing = (router or get_router()).for_request(
+        mode=mode, context=context, fast_mode=fast_mode, deadline=deadline,
+        model=None if fast_mode else model,
+    )
+    usage = Usage() if usage is None else usage
     if stream:
-        return _run_agent_stream(client, openai_messages, model, tools, request_id=request_id)
-    text, sources = await _run_agent_sync(client, openai_messages, model, tools, request_id=request_id)
-    return {"message": text, "sources": sources}
+        return _with_usage_event(
+            _run_agent_stream(
+                client, openai_messages, routing, tools, usage,
+                request_id=request_id, trace_parent=get_tracer().current_span(), fast_mode=fast_mode,
+                deadline=deadline, tools_used=tools_used,
+            ),
+            usage,
+        )
+    text, sources = await _run_agent_sync(
+        client, openai_messages, routing, tools, usage, request_id=request_id, fast_mode=fast_mode,
+        deadline=deadline, tools_used=tools_used,
+    )
+    return {"message": text, "sources": sources, "usage": usage.to_dict()}
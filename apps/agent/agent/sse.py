@@ -0,0 +1,211 @@
+"""Server-sent event framing for /chat/stream: delta coalescing and heartbeats.
+
+Token deltas are the hot path: one frame per token means a json.dumps call and
+a tiny socket write for every few characters. SSEWriter instead
+- escapes delta text with the C string encoder json.dumps uses internally
+  (same bytes as json.dumps({"delta": text}), without the dict round-trip)
+- sends a delta at once when it is the first one or deltas have been quiet for
+  the flush interval (so first-token latency is unchanged), and coalesces bursts into one
+  message_delta until SSE_FLUSH_INTERVAL_MS passes or SSE_FLUSH_CHARS are buffered
+- emits an SSE comment as a heartbeat after SSE_HEARTBEAT_SECONDS without a
+  write (long tool phases), so proxies don't drop the idle connection
+
+Other events flush buffered deltas first, so ordering is preserved. pump_frames
+runs the per-event work in its own task and wakes the response loop only for
+finished frames, or when a buffered delta or a heartbeat is due while the agent
+stream is quiet. Benchmark: eval/bench_sse.py.
+
+watch_disconnect polls the request every SSE_DISCONNECT_POLL_SECONDS. Once the
+client is gone, pump_frames stops and cancels the agent stream, even while it
+is waiting on the model or between writes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from json.encoder import encode_basestring_ascii
+from typing import Any, AsyncGenerator, AsyncIterable, Callable, Protocol
+
+# Coalesce deltas for up to this long after the first buffered one (0 = one event per delta).
+SSE_FLUSH_INTERVAL_MS = float(os.environ.get("SSE_FLUSH_INTERVAL_MS", "25"))
+SSE_FLUSH_CHARS = int(os.environ.get("SSE_FLUSH_CHARS", "256"))
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_DISCONNECT_POLL_SECONDS = float(os.environ.get("SSE_DISCONNECT_POLL_SECONDS", "0.5"))
+
+EV_DELTA = "message_delta"
+HEARTBEAT = ": keep-alive\n\n"
+
+
+def format_event(event: str, data: str) -> str:
+    """Format a single SSE event (event + data lines + blank line)."""
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def delta_frame(text: str) -> str:
+    """message_delta event for text, byte-identical to json.dumps({"delta": text})."""
+    return "event: " + EV_DELTA + '\ndata: {"delta": ' + encode_basestring_ascii(text) + "}\n\n"
+
+
+class SSEWriter:
+    """Frames events for one stream; buffers deltas between flushes."""
+
+    def __init__(
+        self,
+        flush_interval_ms: float = SSE_FLUSH_INTERVAL_MS,
+        flush_chars: int = SSE_FLUSH_CHARS,
+        heartbeat_seconds: float = SSE_HEARTBEAT_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._interval = flush_interval_ms / 1000
+        self._flush_chars = flush_chars
+        self._heartbeat = heartbeat_seconds
+        self._clock = clock
+        self._pending: list[str] = []
+        self._pending_chars = 0
+        self._flush_at = 0.0
+        self._last_delta = float("-inf")
+        self._last_write = clock()
+        self.events = 0
+        self.deltas = 0
+
+    def delta(self, text: str) -> str:
+        """Frame(s) to send now for a delta ("" while it is buffered)."""
+        self.deltas += 1
+        now = self._clock()
+        if not self._pending:
+            if self._interval <= 0 or now - self._last_delta >= self._interval:
+                self._last_delta = self._last_write = now
+                self.events += 1
+                return delta_frame(text)
+            self._flush_at = now + self._interval
+        self._pending.append(text)
+        self._pending_chars += len(text)
+        if self._pending_chars >= self._flush_chars or now >= self._flush_at:
+            return self.flush()
+        return ""
+
+    def flush(self) -> str:
+        """Buffered deltas as one message_delta frame ("" if none)."""
+        if not self._pending:
+            return ""
+        text = "".join(self._pending)
+        self._pending.clear()
+        self._pending_chars = 0
+        self._last_delta = self._last_write = self._clock()
+        self.events += 1
+        return delta_frame(text)
+
+    def event(self, event: str, payload: dict[str, Any]) -> str:
+        """Buffered deltas, then a non-delta event."""
+        frames = self.flush()
+        self._last_write = self._clock()
+        self.events += 1
+        return frames + format_event(event, json.dumps(payload))
+
+    def timeout(self) -> float | None:
+        """Seconds until tick has something to send (None: nothing will be due)."""
+        if self._pending:
+            due = self._flush_at
+        elif self._heartbeat > 0:
+            due = self._last_write + self._heartbeat
+        else:
+            return None
+        return max(0.0, due - self._clock())
+
+    def tick(self) -> str:
+        """Due buffered deltas, or a heartbeat comment after a quiet period ("" otherwise)."""
+        now = self._clock()
+        if self._pending:
+            return self.flush() if now >= self._flush_at else ""
+        if self._heartbeat > 0 and now - self._last_write >= self._heartbeat:
+            self._last_write = now
+            return HEARTBEAT
+        return ""
+
+
+_END = object()
+_CANCELLED = object()
+
+
+class _Failed:
+    def __init__(self, error: Exception) -> None:
+        self.error = error
+
+
+class _Disconnectable(Protocol):
+    async def is_disconnected(self) -> bool: ...
+
+
+async def watch_disconnect(
+    request: _Disconnectable,
+    disconnected: asyncio.Event,
+    interval: float = SSE_DISCONNECT_POLL_SECONDS,
+) -> None:
+    """Set disconnected once the client has gone away (run as a task next to the stream)."""
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+    disconnected.set()
+
+
+async def pump_frames(
+    events: AsyncIterable[Any],
+    handle: Callable[[Any], str],
+    writer: SSEWriter,
+    cancel: asyncio.Event | None = None,
+) -> AsyncGenerator[str, None]:
+    """Yield the frames handle(event) returns for each event, plus due flushes and heartbeats.
+
+    A pump task reads events and calls handle (usually through writer.delta /
+    writer.event), so per-token work stays in one task and only finished
+    frames cross to the response; while events are quiet, this generator
+    wakes at writer.timeout() for writer.tick(). Errors from events or handle
+    are re-raised here; closing the generator cancels the pump (and the source)
+    and waits for the source to unwind, so its finally blocks have run when
+    the caller's do. When cancel is set, the generator returns at once (queued
+    frames are dropped) and the source is cancelled at its current await.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump() -> None:
+        try:
+            async for item in events:
+                frame = handle(item)
+                if frame:
+                    queue.put_nowait(frame)
+        except Exception as e:
+            queue.put_nowait(_Failed(e))
+        else:
+            queue.put_nowait(_END)
+
+    async def stop() -> None:
+        await cancel.wait()
+        queue.put_nowait(_CANCELLED)
+
+    task = asyncio.create_task(pump())
+    stopper = asyncio.create_task(stop()) if cancel is not None else None
+    try:
+        while True:
+            if not queue.empty():
+                item = queue.get_nowait()
+            else:
+                try:
+                    async with asyncio.timeout(writer.timeout()):
+                        item = await queue.get()
+                except TimeoutError:
+                    frame = writer.tick()
+                    if frame:
+                        yield frame
+                    continue
+            if item is _END or item is _CANCELLED:
+                return
+            if isinstance(item, _Failed):
+                raise item.error
+            yield item
+    finally:
+        task.cancel()
+        if stopper is not None:
+            stopper.cancel()
+        await asyncio.wait([task])
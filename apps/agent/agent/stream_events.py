@@ -15,6 +15,7 @@ from typing import Any
 TYPE_STATUS = "status"
 TYPE_DELTA = "delta"
 TYPE_SOURCES = "sources"
+TYPE_USAGE = "usage"
 
 # Status phases (present tense for in-progress; category:action style).
 PHASE_THINKING = "thinking"
@@ -0,0 +1,332 @@
+"""Lightweight in-process tracing: nested spans with monotonic timings.
+
+Spans cover the request, profile lookup, memory search, each LLM step, stream
+consumption, and each tool. Finished spans go to exporters:
+
+- log: one structured line per span on the "agent.performance" logger (default on).
+- JSON lines: TRACE_JSONL_PATH=/path/to/spans.jsonl appends one object per span.
+- OTLP/HTTP JSON: OTEL_EXPORTER_OTLP_ENDPOINT=http://localhost:4318 posts batches
+  to {endpoint}/v1/traces from a background thread (see eval/otlp_collector_stub.py).
+
+The current span lives in a ContextVar, so tracer.span() nests naturally in
+coroutines. Inside async generators, don't hold tracer.span()/activate() across
+a yield; use start_span(parent=...) and span.end() instead.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from agent.metrics import SpanMetricsExporter
+
+logger = logging.getLogger(__name__)
+perf_logger = logging.getLogger("agent.performance")
+
+SERVICE_NAME = "bills-bio-agent"
+
+STATUS_UNSET = "unset"
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "agent_current_span", default=None
+)
+
+
+class Span:
+    """A timed operation with attributes; ended exactly once."""
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "attributes", "status",
+        "start_unix_ns", "_start_mono_ns", "_end_mono_ns", "_tracer",
+    )
+
+    def __init__(
+        self,
+        tracer: Tracer,
+        name: str,
+        parent: Span | None,
+        attributes: dict[str, Any],
+    ) -> None:
+        self._tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.status = STATUS_UNSET
+        self.start_unix_ns = time.time_ns()
+        self._start_mono_ns = time.monotonic_ns()
+        self._end_mono_ns: int | None = None
+
+    @property
+    def ended(self) -> bool:
+        return self._end_mono_ns is not None
+
+    @property
+    def duration_s(self) -> float:
+        """Elapsed seconds (so far, if the span is still open)."""
+        end = self._end_mono_ns if self._end_mono_ns is not None else time.monotonic_ns()
+        return (end - self._start_mono_ns) / 1e9
+
+    @property
+    def end_unix_ns(self) -> int:
+        end = self._end_mono_ns if self._end_mono_ns is not None else time.monotonic_ns()
+        return self.start_unix_ns + (end - self._start_mono_ns)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.attributes["error.type"] = type(error).__name__
+        self.attributes["error.message"] = str(error)[:500]
+
+    def end(self, **attributes: Any) -> None:
+        """End the span (idempotent) and hand it to the exporters."""
+        if self._end_mono_ns is not None:
+            return
+        self._end_mono_ns = time.monotonic_ns()
+        if attributes:
+            self.attributes.update(attributes)
+        if self.status == STATUS_UNSET:
+            self.status = STATUS_OK
+        self._tracer._export(self)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_unix_ns": self.start_unix_ns,
+            "duration_ms": round(self.duration_s * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class LogExporter:
+    """Write one structured perf line per span."""
+
+    def export(self, span: Span) -> None:
+        attrs = " ".join(f"{k}={v}" for k, v in span.attributes.items())
+        level = logging.WARNING if span.status == STATUS_ERROR else logging.INFO
+        perf_logger.log(level, "span=%s duration=%.3fs %s", span.name, span.duration_s, attrs)
+
+    def shutdown(self) -> None:
+        pass
+
+
+class JsonLinesExporter:
+    """Append finished spans as JSON lines to a local file."""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def span_to_otlp(span: Span) -> dict[str, Any]:
+    """Encode a span in OTLP/JSON form (opentelemetry-proto trace.v1.Span)."""
+    out: dict[str, Any] = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start_unix_ns),
+        "endTimeUnixNano": str(span.end_unix_ns),
+        "attributes": [
+            {"key": k, "value": _otlp_value(v)}
+            for k, v in span.attributes.items()
+            if v is not None
+        ],
+        "status": {"code": 2 if span.status == STATUS_ERROR else 1},
+    }
+    if span.parent_id:
+        out["parentSpanId"] = span.parent_id
+    return out
+
+
+class OTLPHttpExporter:
+    """Batch spans and POST them as OTLP/HTTP JSON from a daemon thread."""
+
+    def __init__(
+        self,
+        endpoint: str,
+        *,
+        batch_size: int = 256,
+        interval_seconds: float = 2.0,
+        max_queue: int = 10_000,
+        timeout_seconds: float = 5.0,
+    ) -> None:
+        self._url = endpoint.rstrip("/") + "/v1/traces"
+        self._batch_size = batch_size
+        self._interval = interval_seconds
+        self._timeout = timeout_seconds
+        self._queue: queue.Queue[Span | None] = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        batch: list[Span] = []
+        deadline = time.monotonic() + self._interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = ...
+            if item is None:
+                self._post(batch)
+                return
+            if isinstance(item, Span):
+                batch.append(item)
+            if len(batch) >= self._batch_size or time.monotonic() >= deadline:
+                self._post(batch)
+                batch = []
+                deadline = time.monotonic() + self._interval
+
+    def _post(self, spans: list[Span]) -> None:
+        if not spans:
+            return
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "agent.tracing"},
+                    "spans": [span_to_otlp(s) for s in spans],
+                }],
+            }],
+        }
+        try:
+            import httpx
+
+            httpx.post(self._url, json=payload, timeout=self._timeout).raise_for_status()
+        except Exception as e:
+            logger.warning("OTLP export of %d spans failed: %s", len(spans), e)
+
+    def shutdown(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=self._timeout + 1)
+
+
+class Tracer:
+    """Creates spans and fans finished spans out to exporters."""
+
+    def __init__(self, exporters: list[Any] | None = None) -> None:
+        self.exporters = list(exporters or [])
+
+    def current_span(self) -> Span | None:
+        return _current_span.get()
+
+    def start_span(self, name: str, *, parent: Span | None = None, **attributes: Any) -> Span:
+        """Start a span; parent defaults to the current span. Caller must end() it."""
+        return Span(self, name, parent or _current_span.get(), attributes)
+
+    @contextmanager
+    def span(self, name: str, *, parent: Span | None = None, **attributes: Any) -> Iterator[Span]:
+        """Start a span, make it current for the block, and end it (recording errors)."""
+        s = self.start_span(name, parent=parent, **attributes)
+        token = _current_span.set(s)
+        try:
+            yield s
+        except BaseException as e:
+            s.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            s.end()
+
+    @contextmanager
+    def activate(self, span: Span | None) -> Iterator[Span | None]:
+        """Make an existing span current for the block without ending it."""
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+
+    def _export(self, span: Span) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.debug("Span exporter %s failed: %s", type(exporter).__name__, e)
+
+    def shutdown(self) -> None:
+        """Flush and stop exporters (call on app shutdown)."""
+        for exporter in self.exporters:
+            try:
+                exporter.shutdown()
+            except Exception as e:
+                logger.debug("Span exporter shutdown failed: %s", e)
+
+
+def _env_flag(name: str, default: str = "true") -> bool:
+    return os.environ.get(name, default).strip().lower() not in ("0", "false", "no")
+
+
+def _build_tracer() -> Tracer:
+    # Latency metrics (/metrics) are derived from spans, so they are always exported.
+    exporters: list[Any] = [SpanMetricsExporter()]
+    if _env_flag("TRACING_ENABLED"):
+        if _env_flag("TRACE_LOG_SPANS"):
+            exporters.append(LogExporter())
+        jsonl_path = os.environ.get("TRACE_JSONL_PATH", "").strip()
+        if jsonl_path:
+            exporters.append(JsonLinesExporter(jsonl_path))
+        otlp_endpoint = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "").strip()
+        if otlp_endpoint:
+            exporters.append(OTLPHttpExporter(otlp_endpoint))
+    return Tracer(exporters)
+
+
+_tracer: Tracer | None = None
+
+
+def get_tracer() -> Tracer:
+    """Return shared tracer singleton (exporters configured from env on first use)."""
+    global _tracer
+    if _tracer is None:
+        _tracer = _build_tracer()
+    return _tracer
@@ -0,0 +1,272 @@
+"""Token usage and cost accounting per request, session, and profile.
+
+Every LLM call (agent runner steps, profile extraction) reports its usage here.
+Aggregates are kept in memory (bounded LRU per dimension) and per-profile deltas
+are flushed in batches to Postgres (profiles.data.llm_usage) by a background
+task in main.py. Per-process; each worker flushes its own deltas.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# USD per 1M tokens: (input, cached input, output). Longest matching prefix wins;
+# unknown models are counted with zero cost.
+MODEL_PRICES: dict[str, tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.13, 0.0),
+}
+
+SOURCE_AGENT = "agent"
+SOURCE_EXTRACTION = "extraction"
+SOURCE_MEMORY = "memory"
+
+USAGE_FLUSH_INTERVAL_SECONDS = float(os.environ.get("USAGE_FLUSH_INTERVAL_SECONDS", "30"))
+
+
+@dataclass
+class Usage:
+    """Token counts and estimated cost for one or more LLM calls."""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    llm_calls: int = 0
+    tool_calls: int = 0
+    cost_usd: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, other: Usage) -> None:
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cached_tokens += other.cached_tokens
+        self.llm_calls += other.llm_calls
+        self.tool_calls += other.tool_calls
+        self.cost_usd += other.cost_usd
+
+    def to_dict(self) -> dict[str, Any]:
+        d = asdict(self)
+        d["total_tokens"] = self.total_tokens
+        d["cost_usd"] = round(self.cost_usd, 6)
+        return d
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """Return estimated USD cost for the given token counts (0 for unknown models)."""
+    match = max((m for m in MODEL_PRICES if model.startswith(m)), key=len, default=None)
+    if match is None:
+        return 0.0
+    price_in, price_cached, price_out = MODEL_PRICES[match]
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * price_in + cached_tokens * price_cached + completion_tokens * price_out) / 1_000_000
+
+
+def estimate_usage(model: str, prompt_chars: int, completion_chars: int) -> Usage:
+    """Approximate Usage (about 4 characters per token) for a call whose usage never arrived."""
+    prompt = prompt_chars // 4
+    completion = completion_chars // 4
+    return Usage(
+        prompt_tokens=prompt,
+        completion_tokens=completion,
+        llm_calls=1,
+        cost_usd=estimate_cost(model, prompt, completion),
+    )
+
+
+def usage_from_response(usage: Any, model: str) -> Usage | None:
+    """Build a Usage from an OpenAI CompletionUsage object (None if missing)."""
+    if usage is None:
+        return None
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+    return Usage(
+        prompt_tokens=prompt,
+        completion_tokens=completion,
+        cached_tokens=cached,
+        llm_calls=1,
+        cost_usd=estimate_cost(model, prompt, completion, cached),
+    )
+
+
+class _LRU(OrderedDict):
+    """OrderedDict of Usage aggregates that evicts the least recently touched key."""
+
+    def __init__(self, max_size: int) -> None:
+        super().__init__()
+        self.max_size = max_size
+
+    def bump(self, key: str, usage: Usage) -> None:
+        agg = self.get(key)
+        if agg is None:
+            agg = self[key] = Usage()
+            if len(self) > self.max_size:
+                self.popitem(last=False)
+        else:
+            self.move_to_end(key)
+        agg.add(usage)
+
+
+class UsageTracker:
+    """In-memory usage aggregation by request, session, profile, and dimension. Thread-safe."""
+
+    def __init__(
+        self,
+        max_requests: int = 1000,
+        max_sessions: int = 5000,
+        max_profiles: int = 5000,
+    ) -> None:
+        self._lock = threading.Lock()
+        self._request_meta: OrderedDict[str, dict[str, str | None]] = OrderedDict()
+        self._max_requests = max_requests
+        self._requests = _LRU(max_requests)
+        self._sessions = _LRU(max_sessions)
+        self._profiles = _LRU(max_profiles)
+        self._dimensions: dict[str, dict[str, Usage]] = {
+            "source": {}, "model": {}, "mode": {}, "skill": {}, "context": {},
+        }
+        self._totals = Usage()
+        # Per-profile deltas not yet written to Postgres.
+        self._pending: dict[str, Usage] = {}
+
+    def begin_request(
+        self,
+        request_id: str,
+        *,
+        session_id: str | None = None,
+        profile_id: Any = None,
+        mode: str | None = None,
+        skill: str | None = None,
+        context: str | None = None,
+    ) -> None:
+        """Attach session/profile/mode/skill/context to a request id for later records."""
+        meta = {
+            "session_id": session_id,
+            "profile_id": str(profile_id) if profile_id else None,
+            "mode": mode,
+            "skill": skill,
+            "context": context,
+        }
+        with self._lock:
+            self._request_meta[request_id] = meta
+            self._request_meta.move_to_end(request_id)
+            if len(self._request_meta) > self._max_requests:
+                self._request_meta.popitem(last=False)
+
+    def record(
+        self,
+        usage: Usage,
+        *,
+        model: str,
+        request_id: str | None = None,
+        source: str = SOURCE_AGENT,
+        profile_id: Any = None,
+    ) -> None:
+        """Record one LLM call. profile_id overrides the one attached to request_id."""
+        with self._lock:
+            meta = self._request_meta.get(request_id, {}) if request_id else {}
+            pid = str(profile_id) if profile_id else meta.get("profile_id")
+            self._totals.add(usage)
+            if request_id:
+                self._requests.bump(request_id, usage)
+            if meta.get("session_id"):
+                self._sessions.bump(meta["session_id"], usage)
+            if pid:
+                self._profiles.bump(pid, usage)
+                self._pending.setdefault(pid, Usage()).add(usage)
+            for dim, value in (
+                ("source", source),
+                ("model", model),
+                ("mode", meta.get("mode")),
+                ("skill", meta.get("skill")),
+                ("context", meta.get("context")),
+            ):
+                if value:
+                    self._dimensions[dim].setdefault(value, Usage()).add(usage)
+
+    def get_request(self, request_id: str) -> Usage | None:
+        """Return aggregated usage for a request id (None if unknown or evicted)."""
+        with self._lock:
+            agg = self._requests.get(request_id)
+            return Usage(**asdict(agg)) if agg is not None else None
+
+    def drain_pending(self) -> dict[str, Usage]:
+        """Return and clear per-profile deltas awaiting a Postgres flush."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            return pending
+
+    def restore_pending(self, pending: dict[str, Usage]) -> None:
+        """Put back deltas from a failed flush so the next flush retries them."""
+        with self._lock:
+            for pid, usage in pending.items():
+                self._pending.setdefault(pid, Usage()).add(usage)
+
+    def snapshot(self, top: int = 20) -> dict[str, Any]:
+        """Return totals, per-dimension breakdowns, and top sessions/profiles by cost."""
+
+        def _top(lru: _LRU) -> list[dict[str, Any]]:
+            items = sorted(lru.items(), key=lambda kv: kv[1].cost_usd, reverse=True)[:top]
+            return [{"id": k, **v.to_dict()} for k, v in items]
+
+        with self._lock:
+            return {
+                "totals": self._totals.to_dict(),
+                **{
+                    f"by_{dim}": {k: v.to_dict() for k, v in values.items()}
+                    for dim, values in self._dimensions.items()
+                },
+                "top_profiles": _top(self._profiles),
+                "top_sessions": _top(self._sessions),
+                "recent_requests": [
+                    {"id": k, **v.to_dict()} for k, v in list(self._requests.items())[-top:]
+                ],
+                "pending_flush_profiles": len(self._pending),
+            }
+
+
+_tracker: UsageTracker | None = None
+
+
+def get_usage_tracker() -> UsageTracker:
+    """Return shared usage tracker singleton."""
+    global _tracker
+    if _tracker is None:
+        _tracker = UsageTracker()
+    return _tracker
+
+
+async def flush_usage(db: Any) -> int:
+    """Write pending per-profile usage deltas to Postgres in one batch.
+
+    Returns the number of profiles flushed. On failure the deltas are restored
+    and retried on the next flush.
+    """
+    tracker = get_usage_tracker()
+    pending = tracker.drain_pending()
+    if not pending:
+        return 0
+    try:
+        await db.add_profile_usage(pending)
+    except Exception as e:
+        tracker.restore_pending(pending)
+        logger.warning("Usage flush failed (%d profiles): %s", len(pending), e)
+        return 0
+    logger.debug("Usage flushed for %d profiles", len(pending))
+    return len(pending)
@@ -0,0 +1,321 @@
+"""
+Database maintenance: merge duplicate profiles, prune stale rows, VACUUM
+Every new IP/session without a match creates an anonymous profile, so profiles
+and sessions grow without bound and the lookup joins slow down. One run:
+1. Merge duplicate visitors among recently active profiles (find_duplicate_pairs)
+2. Delete anonymous profiles not seen for MAINTENANCE_ANONYMOUS_RETENTION_DAYS
+   that we learned nothing about
+3. Delete sessions not seen for MAINTENANCE_SESSION_RETENTION_DAYS
+4. VACUUM (ANALYZE) tables that lost rows, ANALYZE tables that only changed
+
+Work is done in batches of MAINTENANCE_BATCH_SIZE with a pause between them,
+on a dedicated single-connection pool, so it never takes connections from chat
+traffic. In-process, batches also wait while the chat pool has no idle
+connection.
+
+Run in the agent (MAINTENANCE_INTERVAL_SECONDS > 0) or as a CLI from apps/agent
+(e.g. from cron). Each run first takes a Postgres advisory lock on a separate
+connection; when another worker, replica or cron job holds it, the run is
+skipped, so only one process merges, prunes and VACUUMs at a time:
+    python -m db.maintenance
+    python -m db.maintenance --loop
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Optional
+
+import asyncpg
+from dotenv import load_dotenv
+
+from agent.metrics import MAINTENANCE_ROWS, MAINTENANCE_SECONDS
+from db.postgres import PostgresDB
+from db.profile_management import merge_duplicate_profiles
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_INTERVAL_SECONDS = float(os.environ.get("MAINTENANCE_INTERVAL_SECONDS", "0"))
+MAINTENANCE_BATCH_SIZE = int(os.environ.get("MAINTENANCE_BATCH_SIZE", "200"))
+MAINTENANCE_MAX_BATCHES = int(os.environ.get("MAINTENANCE_MAX_BATCHES", "50"))
+MAINTENANCE_BATCH_PAUSE_SECONDS = float(os.environ.get("MAINTENANCE_BATCH_PAUSE_SECONDS", "0.5"))
+MAINTENANCE_DEDUP_ACTIVE_HOURS = float(os.environ.get("MAINTENANCE_DEDUP_ACTIVE_HOURS", "24"))
+MAINTENANCE_ANONYMOUS_RETENTION_DAYS = float(os.environ.get("MAINTENANCE_ANONYMOUS_RETENTION_DAYS", "30"))
+MAINTENANCE_SESSION_RETENTION_DAYS = float(os.environ.get("MAINTENANCE_SESSION_RETENTION_DAYS", "90"))
+MAINTENANCE_STATEMENT_TIMEOUT_MS = int(os.environ.get("MAINTENANCE_STATEMENT_TIMEOUT_MS", "60000"))
+
+# Give up waiting for the chat pool to free up after this long and skip the step
+_BUSY_WAIT_LIMIT_SECONDS = 60.0
+# pg_try_advisory_lock key held for the duration of one maintenance run
+MAINTENANCE_LOCK_KEY = 0x62626D61696E74  # "bbmaint"
+
+
+@dataclass
+class MaintenanceReport:
+    """Rows touched by one maintenance run"""
+
+    merged_profiles: int = 0
+    pruned_profiles: int = 0
+    pruned_sessions: int = 0
+    vacuumed: list = field(default_factory=list)
+    analyzed: list = field(default_factory=list)
+    seconds: float = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "merged_profiles": self.merged_profiles,
+            "pruned_profiles": self.pruned_profiles,
+            "pruned_sessions": self.pruned_sessions,
+            "vacuumed": self.vacuumed,
+            "analyzed": self.analyzed,
+            "seconds": round(self.seconds, 3),
+        }
+
+
+def pool_busy(db: PostgresDB) -> Callable[[], bool]:
+    """Busy check for a chat pool: True when no connection is idle and it can't grow."""
+
+    def busy() -> bool:
+        pool = db.pool
+        if pool is None:
+            return False
+        return pool.get_idle_size() == 0 and pool.get_size() >= pool.get_max_size()
+
+    return busy
+
+
+class MaintenanceWorker:
+    """Runs maintenance steps in paced batches on its own connection"""
+
+    def __init__(
+        self,
+        db: PostgresDB,
+        batch_size: int = MAINTENANCE_BATCH_SIZE,
+        max_batches: int = MAINTENANCE_MAX_BATCHES,
+        pause_seconds: float = MAINTENANCE_BATCH_PAUSE_SECONDS,
+        busy: Optional[Callable[[], bool]] = None,
+    ):
+        """
+        Args:
+            db: Database with a dedicated maintenance pool (see connect_maintenance_db)
+            batch_size: Rows per batch (pairs for merging)
+            max_batches: Batches per step per run, so one run is bounded
+            pause_seconds: Sleep between batches
+            busy: Returns True while chat traffic needs the database; batches wait
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.pause_seconds = pause_seconds
+        self.busy = busy
+
+    async def _pace(self) -> bool:
+        """Pause between batches; False if chat traffic stayed busy too long."""
+        await asyncio.sleep(self.pause_seconds)
+        if not self.busy:
+            return True
+        waited = 0.0
+        while self.busy():
+            if waited >= _BUSY_WAIT_LIMIT_SECONDS:
+                logger.info("Chat pool busy; deferring maintenance to the next run")
+                return False
+            await asyncio.sleep(max(self.pause_seconds, 0.1))
+            waited += max(self.pause_seconds, 0.1)
+        return True
+
+    async def merge_duplicates(self, active_within_hours: float = MAINTENANCE_DEDUP_ACTIVE_HOURS) -> int:
+        """Merge duplicate visitor pairs in batches. Returns profiles merged."""
+        merged = 0
+        for _ in range(self.max_batches):
+            if not await self._pace():
+                break
+            batch_merged = await merge_duplicate_profiles(self.db, active_within_hours, self.batch_size)
+            merged += batch_merged
+            if batch_merged == 0:
+                break
+        MAINTENANCE_ROWS.inc("merged_profiles", amount=merged)
+        return merged
+
+    async def _prune(self, action: str, delete_batch) -> int:
+        total = 0
+        for _ in range(self.max_batches):
+            if not await self._pace():
+                break
+            deleted = await delete_batch()
+            total += deleted
+            if deleted < self.batch_size:
+                break
+        MAINTENANCE_ROWS.inc(action, amount=total)
+        return total
+
+    async def prune_anonymous_profiles(
+        self, retention_days: float = MAINTENANCE_ANONYMOUS_RETENTION_DAYS
+    ) -> int:
+        """Delete stale anonymous profiles in batches. Returns rows deleted."""
+        if retention_days <= 0:
+            return 0
+        return await self._prune(
+            "pruned_profiles",
+            lambda: self.db.prune_stale_anonymous_profiles(retention_days, self.batch_size),
+        )
+
+    async def prune_sessions(self, retention_days: float = MAINTENANCE_SESSION_RETENTION_DAYS) -> int:
+        """Delete sessions past the retention horizon in batches. Returns rows deleted."""
+        if retention_days <= 0:
+            return 0
+        return await self._prune(
+            "pruned_sessions",
+            lambda: self.db.prune_old_sessions(retention_days, self.batch_size),
+        )
+
+    async def run_once(self) -> MaintenanceReport:
+        """Run every step once and VACUUM/ANALYZE what changed"""
+        start = time.monotonic()
+        report = MaintenanceReport()
+        report.merged_profiles = await self.merge_duplicates()
+        report.pruned_profiles = await self.prune_anonymous_profiles()
+        report.pruned_sessions = await self.prune_sessions()
+
+        # Merges and profile deletes remove rows from both tables; session pruning only sessions
+        if report.merged_profiles or report.pruned_profiles:
+            report.vacuumed += ["profiles", "sessions"]
+        elif report.pruned_sessions:
+            report.vacuumed.append("sessions")
+        if report.merged_profiles:
+            report.analyzed.append("conversations")
+
+        if report.vacuumed and await self._pace():
+            await self.db.vacuum_analyze(report.vacuumed)
+        if report.analyzed and await self._pace():
+            await self.db.vacuum_analyze(report.analyzed, vacuum=False)
+
+        report.seconds = time.monotonic() - start
+        MAINTENANCE_SECONDS.observe(report.seconds)
+        return report
+
+
+async def connect_maintenance_db(database_url: Optional[str] = None) -> PostgresDB:
+    """Separate one-connection pool so maintenance never uses chat connections"""
+    db = PostgresDB(database_url)
+    await db.connect(
+        min_size=1,
+        max_size=1,
+        server_settings={
+            "application_name": "agent-maintenance",
+            "statement_timeout": str(MAINTENANCE_STATEMENT_TIMEOUT_MS),
+        },
+    )
+    return db
+
+
+@asynccontextmanager
+async def maintenance_lock(database_url: Optional[str] = None) -> AsyncIterator[bool]:
+    """
+    Hold the maintenance advisory lock for one run; yields False if another process has it.
+
+    The lock is session-level, so it is taken on its own connection (pooled
+    connections run pg_advisory_unlock_all when released); closing the
+    connection releases it, also if this process dies mid-run.
+    """
+    conn = await asyncpg.connect(
+        database_url or os.getenv("DATABASE_URL"),
+        server_settings={"application_name": "agent-maintenance-lock"},
+    )
+    try:
+        yield await conn.fetchval("SELECT pg_try_advisory_lock($1)", MAINTENANCE_LOCK_KEY)
+    finally:
+        await conn.close()
+
+
+async def maintenance_loop(
+    interval_seconds: float = MAINTENANCE_INTERVAL_SECONDS,
+    busy: Optional[Callable[[], bool]] = None,
+) -> None:
+    """Run maintenance every interval_seconds until cancelled"""
+    db = None
+    try:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                if db is None:
+                    db = await connect_maintenance_db()
+                async with maintenance_lock(db.database_url) as acquired:
+                    if not acquired:
+                        logger.info("Maintenance run skipped: another process is running it")
+                        continue
+                    report = await MaintenanceWorker(db, busy=busy).run_once()
+                logger.info("Maintenance run: %s", report.as_dict())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Maintenance run failed: %s", e)
+    finally:
+        if db is not None:
+            await db.close()
+
+
+async def _main(args: argparse.Namespace) -> None:
+    db = await connect_maintenance_db(args.database_url)
+    try:
+        while True:
+            async with maintenance_lock(db.database_url) as acquired:
+                if acquired:
+                    await _run_step(db, args)
+                else:
+                    print({"skipped": "another process is running maintenance"})
+            if not args.loop:
+                break
+            await asyncio.sleep(args.interval)
+    finally:
+        await db.close()
+
+
+async def _run_step(db: PostgresDB, args: argparse.Namespace) -> None:
+    worker = MaintenanceWorker(
+        db,
+        batch_size=args.batch_size,
+        max_batches=args.max_batches,
+        pause_seconds=args.pause,
+    )
+    if args.step == "all":
+        print((await worker.run_once()).as_dict())
+    elif args.step == "merge":
+        print({"merged_profiles": await worker.merge_duplicates()})
+    elif args.step == "prune":
+        print({
+            "pruned_profiles": await worker.prune_anonymous_profiles(),
+            "pruned_sessions": await worker.prune_sessions(),
+        })
+    elif args.step == "vacuum":
+        await db.vacuum_analyze(["profiles", "sessions", "conversations", "messages"])
+        print({"vacuumed": ["profiles", "sessions", "conversations", "messages"]})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Merge duplicate profiles, prune stale profiles/sessions, VACUUM/ANALYZE."
+    )
+    parser.add_argument("--database-url", default=None, help="Defaults to DATABASE_URL")
+    parser.add_argument("--step", choices=["all", "merge", "prune", "vacuum"], default="all")
+    parser.add_argument("--batch-size", type=int, default=MAINTENANCE_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=MAINTENANCE_MAX_BATCHES)
+    parser.add_argument("--pause", type=float, default=MAINTENANCE_BATCH_PAUSE_SECONDS,
+                        help="Seconds between batches")
+    parser.add_argument("--loop", action="store_true", help="Keep running every --interval seconds")
+    parser.add_argument("--interval", type=float, default=MAINTENANCE_INTERVAL_SECONDS or 3600)
+    args = parser.parse_args()
+
+    env = Path(__file__).resolve().parent.parent / ".env"
+    if env.exists():
+        load_dotenv(env)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
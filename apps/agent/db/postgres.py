@@ -2,11 +2,166 @@
 PostgreSQL database functions for the agent
 """
 
+import asyncio
 import asyncpg
 import json
+import numpy as np
+import time
+from contextlib import asynccontextmanager
 from typing import Dict, List, Optional
 import os
 
+from agent.metrics import DB_POOL_WAIT_SECONDS, PROFILE_DATA_WRITES
+
+# Hybrid facts search: text hits fetched per query = limit * OVERFETCH, plus up
+# to VECTOR_CANDIDATES recent embedded facts of the profile (every candidate's
+# embedding crosses the wire); RRF constant K.
+FACTS_HYBRID_OVERFETCH = int(os.getenv("FACTS_HYBRID_OVERFETCH", "4"))
+FACTS_VECTOR_CANDIDATES = int(os.getenv("FACTS_VECTOR_CANDIDATES", "100"))
+FACTS_RRF_K = 60
+
+
+class _TimedPool:
+    """Wraps an asyncpg pool so acquire() records pool wait time in /metrics."""
+    
+    def __init__(self, pool: asyncpg.Pool):
+        self._pool = pool
+    
+    @asynccontextmanager
+    async def acquire(self):
+        start = time.monotonic()
+        async with self._pool.acquire() as conn:
+            DB_POOL_WAIT_SECONDS.observe(time.monotonic() - start)
+            yield conn
+    
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+def _item_key(item) -> str:
+    """Dedup key for array items (strings compare case-insensitively)."""
+    if isinstance(item, str):
+        return item.strip().casefold()
+    return json.dumps(item, sort_keys=True)
+
+
+def _diff_profile_data(current, updates: Dict, path: tuple = ()) -> List[tuple]:
+    """Changes needed to deep-merge updates into current.
+
+    Returns disjoint (op, path, value) entries: ("set", path, value) replaces the
+    value at path (whole subtree when it's new), ("append", path, items) appends
+    items not already in the array at path.
+    """
+    changes = []
+    for key, new in updates.items():
+        key_path = path + (str(key),)
+        old = current.get(key) if isinstance(current, dict) else None
+        if isinstance(new, dict) and isinstance(old, dict):
+            changes.extend(_diff_profile_data(old, new, key_path))
+        elif isinstance(new, list) and isinstance(old, list):
+            seen = {_item_key(item) for item in old}
+            added = []
+            for item in new:
+                item_key = _item_key(item)
+                if item_key not in seen:
+                    seen.add(item_key)
+                    added.append(item)
+            if added:
+                changes.append(("append", key_path, added))
+        elif new != old:
+            changes.append(("set", key_path, new))
+    return changes
+
+
+# Visitor matching lookups in get_or_create_visitor_profile, most reliable first.
+# fingerprint/ip are generated columns with covering (key, last_seen DESC) indexes
+# (apps/web/scripts/add-session-match-indexes.sql), so the sessions side is an
+# index-only scan; eval/explain_session_matching.py checks the plans.
+VISITOR_MATCH_QUERIES = {
+    "session_id": """
+        SELECT p.* FROM profiles p
+        JOIN sessions s ON s.profile_id = p.id
+        WHERE s.session_id = $1 AND p.type = 'visitor'
+        ORDER BY s.last_seen DESC
+        LIMIT 1
+    """,
+    "fingerprint": """
+        SELECT s.profile_id FROM sessions s
+        JOIN profiles p ON p.id = s.profile_id
+        WHERE s.fingerprint = $1 AND p.type = 'visitor'
+        ORDER BY s.last_seen DESC
+        LIMIT 1
+    """,
+    # Least reliable: only anonymous profiles with recent activity
+    "ip": """
+        SELECT s.profile_id FROM sessions s
+        JOIN profiles p ON p.id = s.profile_id
+        WHERE s.ip = $1
+          AND p.type = 'visitor'
+          AND p.status = 'anonymous'
+          AND s.last_seen > NOW() - INTERVAL '24 hours'
+        ORDER BY s.last_seen DESC
+        LIMIT 1
+    """,
+}
+
+
+def _fuse_fact_results(
+    by_query: List[List[Dict]],
+    vector_pool: List[Dict],
+    query_embeddings: List[Optional[List[float]]],
+    limit: int
+) -> List[List[Dict]]:
+    """Reciprocal-rank fusion of each query's full-text hits and cosine similarity.
+
+    Candidates per query are its text hits plus the shared vector pool; each
+    list contributes 1 / (FACTS_RRF_K + position) for the facts it ranks.
+    Similarities for all queries come from one numpy matrix product over the
+    distinct candidate embeddings (CPU-bound; callers run this in a thread).
+    Queries without an embedding are ranked by text rank alone.
+    """
+    dim = next(len(e) for e in query_embeddings if e)
+    vectors: Dict = {}
+    for item in vector_pool + [item for hits in by_query for item in hits]:
+        embedding = item.pop("embedding", None)
+        # Facts embedded with another model (other dimension) get no similarity
+        if embedding and len(embedding) == dim:
+            vectors.setdefault(item["id"], embedding)
+    ids = list(vectors)
+    matrix = np.array([vectors[i] for i in ids], dtype=np.float32).reshape(len(ids), dim)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    embedded = [i for i, e in enumerate(query_embeddings) if e and len(e) == dim]
+    queries = np.array([query_embeddings[i] for i in embedded], dtype=np.float32)
+    queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    similarities = dict(zip(embedded, (matrix @ queries.T).T.tolist()))
+
+    results = []
+    for i, hits in enumerate(by_query):
+        if i not in similarities:
+            for item in hits:
+                item["score"] = item["rank"]
+            results.append(hits[:limit])
+            continue
+        similarity = dict(zip(ids, similarities[i]))
+        candidates: Dict = {}
+        for item in hits + vector_pool:
+            candidates.setdefault(item["id"], dict(item))
+        for item in candidates.values():
+            item["similarity"] = similarity.get(item["id"])
+            item["score"] = 0.0
+        for position, item in enumerate(hits, 1):
+            candidates[item["id"]]["score"] += 1.0 / (FACTS_RRF_K + position)
+        by_similarity = sorted(
+            (item for item in candidates.values() if item["similarity"] is not None),
+            key=lambda item: item["similarity"],
+            reverse=True,
+        )
+        for position, item in enumerate(by_similarity, 1):
+            item["score"] += 1.0 / (FACTS_RRF_K + position)
+        ranked = sorted(candidates.values(), key=lambda item: item["score"], reverse=True)
+        results.append(ranked[:limit])
+    return results
+
 
 class PostgresDB:
     """PostgreSQL database client for agent"""
@@ -15,9 +170,9 @@ class PostgresDB:
         self.database_url = database_url or os.getenv("DATABASE_URL")
         self.pool = None
     
-    async def connect(self):
-        """Create connection pool"""
-        self.pool = await asyncpg.create_pool(self.database_url)
+    async def connect(self, **pool_kwargs):
+        """Create connection pool (pool_kwargs go to asyncpg.create_pool)"""
+        self.pool = _TimedPool(await asyncpg.create_pool(self.database_url, **pool_kwargs))
     
     async def close(self):
         """Close connection pool"""
@@ -58,13 +213,7 @@ class PostgresDB:
             profile_id = None
             
             # 1. Try session_id (most reliable)
-            row = await conn.fetchrow("""
-                SELECT p.* FROM profiles p
-                JOIN sessions s ON s.profile_id = p.id
-                WHERE s.session_id = $1 AND p.type = 'visitor'
-                ORDER BY s.last_seen DESC
-                LIMIT 1
-            """, session_id)
+            row = await conn.fetchrow(VISITOR_MATCH_QUERIES["session_id"], session_id)
             
             if row:
                 # Update last_seen
@@ -76,32 +225,13 @@ class PostgresDB:
             
             # 2. Try fingerprint (very reliable)
             if fingerprint:
-                row = await conn.fetchrow("""
-                    SELECT p.* FROM profiles p
-                    JOIN sessions s ON s.profile_id = p.id
-                    WHERE s.data->>'fingerprint' = $1 AND p.type = 'visitor'
-                    ORDER BY s.last_seen DESC
-                    LIMIT 1
-                """, fingerprint)
-                
-                if row:
-                    profile_id = row['id']
+                profile_id = await conn.fetchval(
+                    VISITOR_MATCH_QUERIES["fingerprint"], fingerprint
+                )
             
             # 3. Try IP (least reliable - only recent activity)
             if not profile_id and ip:
-                row = await conn.fetchrow("""
-                    SELECT p.* FROM profiles p
-                    JOIN sessions s ON s.profile_id = p.id
-                    WHERE s.data->>'ip' = $1 
-                      AND p.type = 'visitor'
-                      AND p.status = 'anonymous'
-                      AND s.last_seen > NOW() - INTERVAL '24 hours'
-                    ORDER BY s.last_seen DESC
-                    LIMIT 1
-                """, ip)
-                
-                if row:
-                    profile_id = row['id']
+                profile_id = await conn.fetchval(VISITOR_MATCH_QUERIES["ip"], ip)
             
             # 4. Create new anonymous visitor if no match
             if not profile_id:
@@ -133,24 +263,196 @@ class PostgresDB:
         self,
         profile_id: str,
         updates: Dict
-    ) -> None:
-        """Update profile data (deep merge with existing)"""
+    ) -> bool:
+        """Deep-merge updates into profile data, writing only changed paths.
+
+        Nested objects merge key by key, arrays gain only new items (deduped),
+        and scalars are replaced. The row is locked while diffing so concurrent
+        updates don't lose each other's changes. identity.name also updates
+        the name column.
+
+        Returns:
+            True if the profile was written, False if nothing changed (no write).
+        """
         async with self.pool.acquire() as conn:
-            await conn.execute("""
-                UPDATE profiles
-                SET data = data || $2::jsonb,
-                    updated_at = NOW()
-                WHERE id = $1
-            """, profile_id, json.dumps(updates))
-            
-            # Update name if identity.name was provided
-            if "identity" in updates and "name" in updates["identity"]:
-                await conn.execute("""
+            async with conn.transaction():
+                row = await conn.fetchrow(
+                    "SELECT data, name FROM profiles WHERE id = $1 FOR UPDATE",
+                    profile_id
+                )
+                if row is None:
+                    return False
+                current = row["data"]
+                if isinstance(current, str):
+                    current = json.loads(current)
+                changes = _diff_profile_data(current or {}, updates)
+                
+                identity = updates.get("identity")
+                name = identity.get("name") if isinstance(identity, dict) else None
+                if name == row["name"]:
+                    name = None
+                if not changes and name is None:
+                    PROFILE_DATA_WRITES.inc("unchanged")
+                    return False
+                
+                # Nest one jsonb_set per changed path; paths are disjoint, so
+                # appends can read the array from the original column value.
+                expr = "COALESCE(data, '{}'::jsonb)"
+                args: List = [profile_id]
+                for op, path, value in changes:
+                    args += [list(path), json.dumps(value)]
+                    p, v = len(args) - 1, len(args)
+                    if op == "append":
+                        value_sql = f"COALESCE(data #> ${p}::text[], '[]'::jsonb) || ${v}::jsonb"
+                    else:
+                        value_sql = f"${v}::jsonb"
+                    expr = f"jsonb_set({expr}, ${p}::text[], {value_sql}, true)"
+                args.append(name)
+                
+                await conn.execute(f"""
                     UPDATE profiles
-                    SET name = $2
+                    SET data = {expr},
+                        name = COALESCE(${len(args)}, name),
+                        updated_at = NOW()
                     WHERE id = $1
-                """, profile_id, updates["identity"]["name"])
+                """, *args)
+                PROFILE_DATA_WRITES.inc("written")
+                return True
     
+    async def add_profile_usage(self, usage_by_profile: Dict) -> None:
+        """Add LLM usage deltas to profiles.data.llm_usage in a single statement.
+
+        Args:
+            usage_by_profile: {profile_id: Usage} (see agent.usage). Counters are
+                incremented next to the existing emails_sent_this_month counter.
+        """
+        ids = list(usage_by_profile.keys())
+        usages = [usage_by_profile[pid] for pid in ids]
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE profiles p
+                SET data = jsonb_set(
+                    COALESCE(p.data, '{}'::jsonb),
+                    '{llm_usage}',
+                    jsonb_build_object(
+                        'prompt_tokens', COALESCE((p.data->'llm_usage'->>'prompt_tokens')::bigint, 0) + u.prompt_tokens,
+                        'completion_tokens', COALESCE((p.data->'llm_usage'->>'completion_tokens')::bigint, 0) + u.completion_tokens,
+                        'cached_tokens', COALESCE((p.data->'llm_usage'->>'cached_tokens')::bigint, 0) + u.cached_tokens,
+                        'llm_calls', COALESCE((p.data->'llm_usage'->>'llm_calls')::bigint, 0) + u.llm_calls,
+                        'cost_usd', COALESCE((p.data->'llm_usage'->>'cost_usd')::float8, 0) + u.cost_usd,
+                        'updated_at', NOW()
+                    )
+                )
+                FROM unnest($1::uuid[], $2::bigint[], $3::bigint[], $4::bigint[], $5::bigint[], $6::float8[])
+                    AS u(id, prompt_tokens, completion_tokens, cached_tokens, llm_calls, cost_usd)
+                WHERE p.id = u.id
+            """,
+                ids,
+                [u.prompt_tokens for u in usages],
+                [u.completion_tokens for u in usages],
+                [u.cached_tokens for u in usages],
+                [u.llm_calls for u in usages],
+                [u.cost_usd for u in usages],
+            )
+
+    # =========================================================================
+    # RATE LIMITS
+    # =========================================================================
+
+    async def sync_rate_limit_buckets(
+        self,
+        keys: List[str],
+        consumed: List[float],
+        capacities: List[float],
+        refill_per_sec: List[float],
+    ) -> Dict[str, float]:
+        """Apply consumed tokens to shared token buckets; return new levels.
+
+        One atomic upsert for the whole batch (see
+        apps/web/scripts/create-rate-limit-table.sql). New buckets start full;
+        existing ones refill by elapsed time before the delta is applied, and
+        debt is capped at one capacity.
+        """
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                INSERT INTO rate_limit_buckets AS b (key, tokens, capacity, refill_per_sec, updated_at)
+                SELECT u.key, u.capacity - u.consumed, u.capacity, u.refill_per_sec, NOW()
+                FROM unnest($1::text[], $2::float8[], $3::float8[], $4::float8[])
+                    AS u(key, consumed, capacity, refill_per_sec)
+                ON CONFLICT (key) DO UPDATE SET
+                    -- EXCLUDED.capacity - EXCLUDED.tokens is this batch's consumed delta
+                    tokens = GREATEST(
+                        -EXCLUDED.capacity,
+                        LEAST(
+                            EXCLUDED.capacity,
+                            b.tokens + EXTRACT(EPOCH FROM (NOW() - b.updated_at)) * EXCLUDED.refill_per_sec
+                        ) - (EXCLUDED.capacity - EXCLUDED.tokens)
+                    ),
+                    capacity = EXCLUDED.capacity,
+                    refill_per_sec = EXCLUDED.refill_per_sec,
+                    updated_at = NOW()
+                RETURNING key, tokens
+            """, keys, consumed, capacities, refill_per_sec)
+            return {row["key"]: row["tokens"] for row in rows}
+
+    async def prune_rate_limit_buckets(self) -> int:
+        """Delete buckets that have refilled to capacity (they carry no state)."""
+        async with self.pool.acquire() as conn:
+            result = await conn.execute("""
+                DELETE FROM rate_limit_buckets
+                WHERE tokens + EXTRACT(EPOCH FROM (NOW() - updated_at)) * refill_per_sec >= capacity
+            """)
+            return int(result.split()[-1])
+
+    # =========================================================================
+    # MAINTENANCE
+    # =========================================================================
+
+    async def prune_stale_anonymous_profiles(self, retention_days: float, limit: int) -> int:
+        """Delete up to limit anonymous visitors not seen for retention_days.
+
+        Only profiles we learned nothing about (no email, data empty apart from
+        llm_usage) are removed. Their sessions cascade; conversations keep
+        their messages with profile_id set to NULL.
+        """
+        async with self.pool.acquire() as conn:
+            result = await conn.execute("""
+                DELETE FROM profiles
+                WHERE id IN (
+                    SELECT id FROM profiles
+                    WHERE type = 'visitor'
+                      AND status = 'anonymous'
+                      AND email IS NULL
+                      AND last_seen < NOW() - make_interval(secs => $1 * 86400)
+                      AND (COALESCE(data, '{}'::jsonb) - 'llm_usage') = '{}'::jsonb
+                    ORDER BY last_seen
+                    LIMIT $2
+                )
+            """, float(retention_days), limit)
+            return int(result.split()[-1])
+
+    async def prune_old_sessions(self, retention_days: float, limit: int) -> int:
+        """Delete up to limit sessions not seen for retention_days."""
+        async with self.pool.acquire() as conn:
+            result = await conn.execute("""
+                DELETE FROM sessions
+                WHERE id IN (
+                    SELECT id FROM sessions
+                    WHERE last_seen < NOW() - make_interval(secs => $1 * 86400)
+                    ORDER BY last_seen
+                    LIMIT $2
+                )
+            """, float(retention_days), limit)
+            return int(result.split()[-1])
+
+    async def vacuum_analyze(self, tables: List[str], vacuum: bool = True) -> None:
+        """VACUUM (ANALYZE) or just ANALYZE the given tables, one at a time."""
+        command = "VACUUM (ANALYZE)" if vacuum else "ANALYZE"
+        async with self.pool.acquire() as conn:
+            for table in tables:
+                # Table names come from code, never from input; quote anyway
+                await conn.execute(f'{command} "{table}"')
+
     async def get_profile(self, profile_id: str) -> Optional[Dict]:
         """Get profile by ID"""
         async with self.pool.acquire() as conn:
@@ -168,45 +470,183 @@ class PostgresDB:
         self,
         profile_id: str,
         content: str,
-        data: Dict
+        data: Dict,
+        embedding: Optional[List[float]] = None
     ) -> str:
-        """Store a new fact"""
+        """Store a new fact (embedding enables hybrid search, see search_facts_many)"""
         async with self.pool.acquire() as conn:
             row = await conn.fetchrow("""
-                INSERT INTO facts (profile_id, content, data)
-                VALUES ($1, $2, $3)
+                INSERT INTO facts (profile_id, content, data, embedding)
+                VALUES ($1, $2, $3, $4)
                 RETURNING id
-            """, profile_id, content, json.dumps(data))
+            """, profile_id, content, json.dumps(data), embedding)
             
             return row["id"]
     
+    async def store_facts(
+        self,
+        profile_ids: List[str],
+        contents: List[str],
+        embeddings: Optional[List[Optional[List[float]]]] = None,
+        data: Optional[Dict] = None
+    ) -> int:
+        """
+        Store many facts in one statement, skipping ones the profile already has.
+        
+        Args:
+            profile_ids: Owner profile per fact
+            contents: Fact texts, aligned with profile_ids
+            embeddings: Optional vectors, aligned with profile_ids
+            data: Metadata stored on every fact
+        
+        Returns:
+            Number of facts inserted
+        """
+        if not contents:
+            return 0
+        embeddings = embeddings or [None] * len(contents)
+        async with self.pool.acquire() as conn:
+            result = await conn.execute("""
+                INSERT INTO facts (profile_id, content, data, embedding)
+                SELECT DISTINCT ON (u.profile_id, lower(u.content))
+                       u.profile_id, u.content, $4::jsonb,
+                       CASE WHEN u.embedding = '' THEN NULL ELSE u.embedding::real[] END
+                FROM unnest($1::uuid[], $2::text[], $3::text[]) AS u(profile_id, content, embedding)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM facts f
+                    WHERE f.profile_id = u.profile_id AND lower(f.content) = lower(u.content)
+                )
+            """,
+                profile_ids,
+                contents,
+                # real[][] can't be ragged or hold NULL rows; pass vectors as text literals
+                ["{" + ",".join(map(repr, e)) + "}" if e else "" for e in embeddings],
+                json.dumps(data or {}),
+            )
+            return int(result.split()[-1])
+    
     async def search_facts(
         self,
         query: str,
         profile_id: Optional[str] = None,
-        limit: int = 10
+        limit: int = 10,
+        query_embedding: Optional[List[float]] = None,
+        match_any: bool = False
     ) -> List[Dict]:
-        """Full-text search on facts"""
+        """Relevance-ranked search on facts (see search_facts_many)"""
+        results = await self.search_facts_many(
+            [query],
+            profile_id=profile_id,
+            limit=limit,
+            query_embeddings=[query_embedding] if query_embedding else None,
+            match_any=match_any,
+        )
+        return results[0]
+    
+    async def search_facts_many(
+        self,
+        queries: List[str],
+        profile_id: Optional[str] = None,
+        limit: int = 10,
+        query_embeddings: Optional[List[Optional[List[float]]]] = None,
+        match_any: bool = False
+    ) -> List[List[Dict]]:
+        """
+        Search facts for several queries (e.g. query variants) in one round-trip.
+        
+        Each query is parsed with websearch_to_tsquery (plain text, "quoted
+        phrases", -exclusions, OR; never a syntax error) and ranked with
+        ts_rank_cd over the GIN-indexed tsv column
+        (apps/web/scripts/create-facts-table.sql).
+        
+        With query_embeddings (one per query, None to skip), ranking is hybrid:
+        the same round-trip also returns the embeddings of the text hits and of
+        the profile's FACTS_VECTOR_CANDIDATES most recent embedded facts (an
+        index scan on profile_id, created_at; not a vector index). Those are
+        scored by cosine similarity in a worker thread (numpy, one matrix
+        product for all queries) and fused with the text rank by reciprocal
+        rank. Vector candidates need profile_id; without it only full-text
+        hits are re-ranked.
+        
+        Args:
+            queries: Search texts
+            profile_id: Restrict to one profile's facts
+            limit: Results per query
+            query_embeddings: Optional query vectors, aligned with queries
+            match_any: Match facts containing any query term (OR) instead of
+                all of them; ts_rank_cd still favours facts covering more terms.
+                The query is then plain words: each lexeme of to_tsvector(text)
+                is one alternative ("phrases" and -terms are not applied)
+        
+        Returns:
+            One result list per query, best first. Items carry rank (text),
+            similarity (when embedded) and score.
+        """
+        if not queries:
+            return []
+        hybrid = bool(query_embeddings) and any(query_embeddings)
+        fts_limit = limit * FACTS_HYBRID_OVERFETCH if hybrid else limit
+        vector_limit = FACTS_VECTOR_CANDIDATES if hybrid and profile_id else 0
+        
         async with self.pool.acquire() as conn:
-            if profile_id:
-                rows = await conn.fetch("""
-                    SELECT id, profile_id, content, data, created_at
-                    FROM facts
-                    WHERE tsv @@ to_tsquery('english', $1)
-                      AND profile_id = $2
-                    ORDER BY created_at DESC
-                    LIMIT $3
-                """, query, profile_id, limit)
+            rows = await conn.fetch("""
+                (
+                    SELECT q.idx, f.id, f.profile_id, f.content, f.data, f.created_at,
+                           f.rank, CASE WHEN $5 THEN f.embedding END AS embedding
+                    FROM unnest($1::text[]) WITH ORDINALITY AS q(text, idx)
+                    CROSS JOIN LATERAL (
+                        SELECT f.*, ts_rank_cd(f.tsv, tq, 32) AS rank
+                        FROM facts f, LATERAL (
+                            SELECT CASE WHEN $6
+                                -- Any lexeme of the text: 'a' | 'b' | ... (quoted, so never read as operators)
+                                THEN (
+                                    SELECT string_agg(
+                                        '''' || replace(replace(l, '\\', '\\\\'), '''', '''''') || '''', ' | '
+                                    )
+                                    FROM unnest(tsvector_to_array(to_tsvector('english', q.text))) AS l
+                                )::tsquery
+                                ELSE websearch_to_tsquery('english', q.text)
+                            END AS tq
+                        ) AS w
+                        WHERE f.tsv @@ tq
+                          AND ($2::uuid IS NULL OR f.profile_id = $2)
+                        ORDER BY rank DESC, f.created_at DESC
+                        LIMIT $3
+                    ) f
+                )
+                UNION ALL
+                (
+                    -- Vector candidates, shared by every query (idx 0)
+                    SELECT 0, f.id, f.profile_id, f.content, f.data, f.created_at,
+                           NULL, f.embedding
+                    FROM facts f
+                    WHERE f.profile_id = $2 AND f.embedding IS NOT NULL
+                    ORDER BY f.created_at DESC
+                    LIMIT $4
+                )
+            """, queries, profile_id, fts_limit, vector_limit, hybrid, match_any)
+        
+        by_query: List[List[Dict]] = [[] for _ in queries]
+        vector_pool: List[Dict] = []
+        for row in rows:
+            item = dict(row)
+            idx = item.pop("idx")
+            if isinstance(item["data"], str):
+                item["data"] = json.loads(item["data"])
+            if idx == 0:
+                vector_pool.append(item)
             else:
-                rows = await conn.fetch("""
-                    SELECT id, profile_id, content, data, created_at
-                    FROM facts
-                    WHERE tsv @@ to_tsquery('english', $1)
-                    ORDER BY created_at DESC
-                    LIMIT $2
-                """, query, limit)
-            
-            return [dict(row) for row in rows]
+                by_query[idx - 1].append(item)
+        
+        if hybrid:
+            embeddings = (list(query_embeddings) + [None] * len(queries))[:len(queries)]
+            # Off the event loop, so a DEADLINE_CONTEXT_SECONDS scope can still cut the search short
+            return await asyncio.to_thread(_fuse_fact_results, by_query, vector_pool, embeddings, limit)
+        for hits in by_query:
+            for item in hits:
+                item.pop("embedding", None)
+                item["score"] = item["rank"]
+        return [hits[:limit] for hits in by_query]
     
     async def get_profile_facts(
         self,
@@ -322,7 +762,7 @@ class PostgresDB:
                     s.last_seen as last_ip_use
                 FROM profiles p
                 JOIN sessions s ON s.profile_id = p.id
-                WHERE s.data->>'ip' = $1
+                WHERE s.ip = $1
                   AND s.last_seen > NOW() - make_interval(hours => $2)
                 ORDER BY s.last_seen DESC
             """, ip, time_window_hours)
@@ -337,15 +777,15 @@ class PostgresDB:
         """Get IP addresses used by this profile"""
         async with self.pool.acquire() as conn:
             rows = await conn.fetch("""
-                SELECT DISTINCT ON (s.data->>'ip')
-                    s.data->>'ip' as ip,
+                SELECT DISTINCT ON (s.ip)
+                    s.ip,
                     s.data->'location' as location,
                     s.created_at as first_seen,
                     s.last_seen
                 FROM sessions s
                 WHERE s.profile_id = $1
-                  AND s.data->>'ip' IS NOT NULL
-                ORDER BY s.data->>'ip', s.last_seen DESC
+                  AND s.ip IS NOT NULL
+                ORDER BY s.ip, s.last_seen DESC
                 LIMIT $2
             """, profile_id, limit)
             
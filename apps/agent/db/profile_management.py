@@ -6,6 +6,13 @@ Best practices for anonymous → identified → registered flow
 from typing import Dict, Optional, List
 import json
 
+# Duplicate scores: email match > same name + shared fingerprint > fingerprint only.
+# Candidates below DUPLICATE_MIN_SCORE (fingerprint only) are not merged.
+DUPLICATE_SCORE_EMAIL = 1.0
+DUPLICATE_SCORE_NAME_FINGERPRINT = 0.8
+DUPLICATE_SCORE_FINGERPRINT = 0.3
+DUPLICATE_MIN_SCORE = 0.5
+
 
 class ProfileManager:
     """Manages profile lifecycle and deduplication"""
@@ -66,52 +73,167 @@ class ProfileManager:
         profile_id: str,
         name: Optional[str] = None,
         email: Optional[str] = None,
-        fingerprints: Optional[List[str]] = None
+        fingerprints: Optional[List[str]] = None,
+        min_score: float = DUPLICATE_MIN_SCORE
     ) -> List[Dict]:
         """
-        Find potential duplicate profiles.
+        Find potential duplicate profiles in one set-based query.
+        
+        Signals (see DUPLICATE_SCORE_*):
+        - Same email (strongest)
+        - Same extracted name (not "Anonymous") + shared fingerprint
+        - Shared fingerprint only (weak; below the default min_score)
         
-        Checks:
-        - Same email
-        - Same name + same fingerprint
-        - Same name + overlapping IPs
+        Args:
+            profile_id: Profile to find duplicates of
+            name: Profile name to match
+            email: Profile email to match
+            fingerprints: Fingerprints to match; if None, taken from the
+                profile's own sessions inside the query
+            min_score: Drop candidates scoring below this
         
         Returns:
-            List of potential duplicates
+            Candidate profiles with duplicate_score, shared_fingerprints and
+            email_match, best first (then most recently active)
         """
         
-        duplicates = []
-        
         async with self.db.pool.acquire() as conn:
-            # 1. Check email (strongest signal)
-            if email:
-                rows = await conn.fetch("""
-                    SELECT * FROM profiles
-                    WHERE email = $1 AND id != $2
-                """, email, profile_id)
-                duplicates.extend([dict(row) for row in rows])
-            
-            # 2. Check name + fingerprint
-            if name and fingerprints:
-                for fp in fingerprints:
-                    rows = await conn.fetch("""
-                        SELECT DISTINCT p.* FROM profiles p
-                        JOIN sessions s ON s.profile_id = p.id
-                        WHERE p.name = $1
-                          AND p.id != $2
-                          AND s.data->>'fingerprint' = $3
-                    """, name, profile_id, fp)
-                    duplicates.extend([dict(row) for row in rows])
+            rows = await conn.fetch("""
+                WITH fingerprints AS (
+                    SELECT DISTINCT fp FROM (
+                        SELECT unnest($3::text[]) AS fp
+                        UNION ALL
+                        SELECT fingerprint FROM sessions
+                        WHERE $3::text[] IS NULL AND profile_id = $1
+                    ) f
+                    WHERE fp IS NOT NULL AND fp <> ''
+                ),
+                fingerprint_matches AS (
+                    SELECT s.profile_id AS id,
+                           COUNT(DISTINCT s.fingerprint) AS shared_fingerprints
+                    FROM sessions s
+                    WHERE s.fingerprint = ANY(ARRAY(SELECT fp FROM fingerprints))
+                      AND s.profile_id != $1
+                    GROUP BY s.profile_id
+                ),
+                candidates AS (
+                    SELECT id, shared_fingerprints FROM fingerprint_matches
+                    UNION
+                    SELECT id, 0 FROM profiles
+                    WHERE $4::text IS NOT NULL AND email = $4 AND id != $1
+                ),
+                scored AS (
+                    SELECT p.*,
+                           MAX(c.shared_fingerprints) AS shared_fingerprints,
+                           COALESCE(p.email = $4, false) AS email_match,
+                           CASE
+                               WHEN COALESCE(p.email = $4, false) THEN $5::float8
+                               WHEN p.name = $2 AND p.name <> 'Anonymous' AND MAX(c.shared_fingerprints) > 0
+                                   THEN $6::float8
+                               ELSE $7::float8
+                           END AS duplicate_score
+                    FROM candidates c
+                    JOIN profiles p ON p.id = c.id
+                    WHERE p.type = 'visitor'
+                    GROUP BY p.id
+                )
+                SELECT * FROM scored
+                WHERE duplicate_score >= $8
+                ORDER BY duplicate_score DESC, last_seen DESC
+            """,
+                profile_id,
+                name,
+                fingerprints,
+                email,
+                DUPLICATE_SCORE_EMAIL,
+                DUPLICATE_SCORE_NAME_FINGERPRINT,
+                DUPLICATE_SCORE_FINGERPRINT,
+                min_score,
+            )
             
-            # Remove duplicates from list
-            seen = set()
-            unique = []
-            for dup in duplicates:
-                if dup['id'] not in seen:
-                    seen.add(dup['id'])
-                    unique.append(dup)
+            return [dict(row) for row in rows]
+    
+    async def find_duplicate_pairs(
+        self,
+        active_within_hours: float = 24,
+        min_score: float = DUPLICATE_MIN_SCORE,
+        limit: int = 500
+    ) -> List[Dict]:
+        """
+        Batch mode: scan recently active visitors for duplicates in one pass.
+        
+        Pairs each recently active visitor with any visitor (active or not)
+        sharing its email or a fingerprint, scored like find_duplicate_profiles.
+        The older profile of each pair is kept.
+        
+        Returns:
+            [{keep_id, merge_id, duplicate_score, shared_fingerprints,
+              email_match}], best first
+        """
+        
+        async with self.db.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                WITH recent AS (
+                    SELECT id, email FROM profiles
+                    WHERE type = 'visitor'
+                      AND last_seen > NOW() - make_interval(secs => $1 * 3600)
+                ),
+                recent_fingerprints AS (
+                    SELECT DISTINCT s.profile_id, s.fingerprint
+                    FROM sessions s
+                    JOIN recent r ON r.id = s.profile_id
+                    WHERE s.fingerprint IS NOT NULL
+                ),
+                links AS (
+                    SELECT LEAST(rf.profile_id, s.profile_id) AS a,
+                           GREATEST(rf.profile_id, s.profile_id) AS b,
+                           rf.fingerprint,
+                           false AS email_match
+                    FROM recent_fingerprints rf
+                    JOIN sessions s ON s.fingerprint = rf.fingerprint
+                    WHERE s.profile_id != rf.profile_id
+                    UNION ALL
+                    SELECT LEAST(r.id, p.id), GREATEST(r.id, p.id), NULL, true
+                    FROM recent r
+                    JOIN profiles p ON p.email = r.email AND p.id != r.id
+                ),
+                pairs AS (
+                    SELECT a, b,
+                           COUNT(DISTINCT fingerprint) AS shared_fingerprints,
+                           bool_or(email_match) AS email_match
+                    FROM links
+                    GROUP BY a, b
+                ),
+                scored AS (
+                    SELECT CASE WHEN pa.created_at <= pb.created_at THEN pa.id ELSE pb.id END AS keep_id,
+                           CASE WHEN pa.created_at <= pb.created_at THEN pb.id ELSE pa.id END AS merge_id,
+                           pairs.shared_fingerprints,
+                           pairs.email_match,
+                           CASE
+                               WHEN pairs.email_match THEN $2::float8
+                               WHEN pa.name = pb.name AND pa.name IS NOT NULL AND pa.name <> 'Anonymous'
+                                    AND pairs.shared_fingerprints > 0 THEN $3::float8
+                               ELSE $4::float8
+                           END AS duplicate_score
+                    FROM pairs
+                    JOIN profiles pa ON pa.id = pairs.a
+                    JOIN profiles pb ON pb.id = pairs.b
+                    WHERE pa.type = 'visitor' AND pb.type = 'visitor'
+                )
+                SELECT * FROM scored
+                WHERE duplicate_score >= $5
+                ORDER BY duplicate_score DESC
+                LIMIT $6
+            """,
+                float(active_within_hours),
+                DUPLICATE_SCORE_EMAIL,
+                DUPLICATE_SCORE_NAME_FINGERPRINT,
+                DUPLICATE_SCORE_FINGERPRINT,
+                min_score,
+                limit,
+            )
             
-            return unique
+            return [dict(row) for row in rows]
     
     async def merge_profiles(
         self,
@@ -164,31 +286,15 @@ class ProfileManager:
         if not profile:
             return None
         
-        # Get current profile's fingerprints
-        async with self.db.pool.acquire() as conn:
-            rows = await conn.fetch("""
-                SELECT DISTINCT data->>'fingerprint' as fingerprint
-                FROM sessions
-                WHERE profile_id = $1
-                  AND data->>'fingerprint' IS NOT NULL
-            """, profile_id)
-            
-            fingerprints = [row['fingerprint'] for row in rows]
-        
-        # Find duplicates
+        # Fingerprints come from the profile's sessions inside the same query
         duplicates = await self.find_duplicate_profiles(
             profile_id,
             name=profile.get('name'),
-            email=profile.get('email'),
-            fingerprints=fingerprints
+            email=profile.get('email')
         )
         
-        if not duplicates:
-            return None
-        
-        # Return most recently active duplicate
-        duplicates.sort(key=lambda x: x['last_seen'], reverse=True)
-        return duplicates[0]
+        # Already sorted: highest score, then most recently active
+        return duplicates[0] if duplicates else None
 
 
 # Convenience functions for common operations
@@ -263,3 +369,36 @@ async def check_and_merge_duplicates(
     await manager.merge_profiles(keep_id, merge_id)
     
     return keep_id if keep_id != profile_id else None
+
+
+async def merge_duplicate_profiles(
+    db,
+    active_within_hours: float = 24,
+    limit: int = 500
+) -> int:
+    """
+    Find duplicates among recently active visitors and merge one batch of them.
+    
+    Used by the maintenance worker (db/maintenance.py).
+    
+    A profile merged away in this batch is skipped in later pairs (its
+    sessions now belong to the kept profile and the next run picks them up).
+    
+    Returns:
+        Number of profiles merged
+    """
+    
+    manager = ProfileManager(db)
+    pairs = await manager.find_duplicate_pairs(active_within_hours, limit=limit)
+    
+    touched = set()
+    merged = 0
+    for pair in pairs:
+        keep_id, merge_id = pair['keep_id'], pair['merge_id']
+        if keep_id in touched or merge_id in touched:
+            continue
+        await manager.merge_profiles(keep_id, merge_id)
+        touched.update((keep_id, merge_id))
+        merged += 1
+    
+    return merged
@@ -0,0 +1,273 @@
+"""Memory backend benchmark: Postgres-native facts vs Mem0 OSS.
+
+Seeds both backends with the same synthetic facts for one visitor, then runs the
+same recall queries through each and reports:
+
+- search latency (p50/p95/p99)
+- OpenAI calls and embedding inputs per search and per seeded fact, counted
+  at the fake OpenAI server (eval/fake_services.py)
+- estimated embedding cost per 1k searches (agent.usage prices, ~4 chars/token)
+
+Both backends embed through the fake server (set its latency with
+--embedding-latency-ms to model the real API round-trip). Facts are seeded
+verbatim: Postgres through the batched store path, Mem0 with infer=False, since
+the fake LLM doesn't return extraction JSON. On the add path with real models,
+Mem0 also makes two LLM calls per turn (extract + update), and the Postgres
+backend makes at most one (skipped when the pre-filter finds nothing).
+
+Mem0 is skipped when mem0ai isn't installed. Postgres needs a scratch database
+(facts table is created from apps/web/scripts/create-facts-table.sql).
+
+Usage:
+    python eval/bench_memory.py --postgres docker --facts 200 --queries 200
+    python eval/bench_memory.py --database-url postgresql://localhost/bench --embedding-latency-ms 60
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+EVAL_DIR = Path(__file__).resolve().parent
+AGENT_DIR = EVAL_DIR.parent
+sys.path.insert(0, str(AGENT_DIR))
+sys.path.insert(0, str(EVAL_DIR))
+
+from benchmark import (  # noqa: E402
+    REPO_ROOT,
+    RESULTS_DIR,
+    _free_port,
+    _git_sha,
+    _percentiles,
+    _start_docker_postgres,
+    _wait_ready,
+)
+
+FACTS_SQL = REPO_ROOT / "apps" / "web" / "scripts" / "create-facts-table.sql"
+
+CITIES = ["Melbourne", "Brisbane", "Berlin", "Austin", "Toronto", "Lisbon", "Seoul", "Nairobi"]
+COMPANIES = ["Stripe", "Canva", "Atlassian", "a robotics startup", "a hedge fund", "a hospital"]
+ROLES = ["backend engineer", "designer", "product manager", "researcher", "founder", "student"]
+TOPICS = ["humanoid robots", "reinforcement learning", "snowboarding", "climbing", "synths", "chess",
+          "restaurant automation", "open source", "bouldering", "film photography"]
+FACT_TEMPLATES = [
+    "Lives in {city}", "Works at {company} as a {role}", "Interested in {topic}",
+    "Is building a side project about {topic}", "Moved to {city} last year",
+    "Wants to chat about {topic}", "Studied {topic} at university",
+]
+QUERIES = [
+    "where do I live?", "what do I do for work?", "what am I into?", "remember my side project?",
+    "what did I say about {topic}?", "do you know where I work?", "what should we talk about",
+    "I'm back, what do you remember about me", "any thoughts on {topic}", "what's my job again",
+]
+
+
+def _facts(n: int, rng: random.Random) -> list[str]:
+    facts = set()
+    while len(facts) < n:
+        facts.add(rng.choice(FACT_TEMPLATES).format(
+            city=rng.choice(CITIES), company=rng.choice(COMPANIES),
+            role=rng.choice(ROLES), topic=rng.choice(TOPICS),
+        ) + f" ({len(facts)})")
+    return sorted(facts)
+
+
+def _queries(n: int, rng: random.Random) -> list[str]:
+    return [rng.choice(QUERIES).format(topic=rng.choice(TOPICS)) for _ in range(n)]
+
+
+async def _stats(client: httpx.AsyncClient, fake_url: str) -> dict[str, int]:
+    return (await client.get(f"{fake_url}/stats", params={"reset": "true"})).json()
+
+
+def _embedding_cost_per_1k(stats: dict[str, int], searches: int) -> float:
+    from agent.config import get_embedding_model
+    from agent.usage import estimate_cost
+
+    tokens = stats.get("embedding_chars", 0) / 4
+    return estimate_cost(get_embedding_model(), int(tokens), 0) / max(searches, 1) * 1000
+
+
+def _per_op(stats: dict[str, int], ops: int) -> dict[str, float]:
+    return {
+        "openai_calls": round(sum(v for k, v in stats.items() if k.startswith("POST /v1/")) / max(ops, 1), 3),
+        "embedding_inputs": round(stats.get("embedding_inputs", 0) / max(ops, 1), 3),
+    }
+
+
+async def _bench_postgres(args, fake_url: str, facts: list[str], queries: list[str]) -> dict[str, Any]:
+    from openai import AsyncOpenAI
+
+    from agent.memory_layer import MEMORY_EMBED_BATCH_SIZE, PostgresMemoryBackend
+    from db.postgres import PostgresDB
+
+    db = PostgresDB(args.database_url)
+    await db.connect(min_size=1, max_size=4)
+    client = AsyncOpenAI(base_url=f"{fake_url}/v1", api_key="fake")
+    async with db.pool.acquire() as conn:
+        await conn.execute(FACTS_SQL.read_text())
+        profile_id = await conn.fetchval(
+            "INSERT INTO profiles (type, status, name) VALUES ('visitor', 'anonymous', 'Memory Bench') RETURNING id"
+        )
+    backend = PostgresMemoryBackend(db, client)
+    try:
+        async with httpx.AsyncClient() as http:
+            await _stats(http, fake_url)
+            # Same path as backend.add after extraction: one embeddings call per batch
+            for i in range(0, len(facts), MEMORY_EMBED_BATCH_SIZE):
+                await backend._flush([(str(profile_id), fact) for fact in facts[i:i + MEMORY_EMBED_BATCH_SIZE]])
+            seed_stats = await _stats(http, fake_url)
+
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                await backend.search(query, str(profile_id), args.top_k)
+                latencies.append((time.perf_counter() - start) * 1000)
+            search_stats = await _stats(http, fake_url)
+    finally:
+        async with db.pool.acquire() as conn:
+            await conn.execute("DELETE FROM profiles WHERE id = $1", profile_id)
+        await db.close()
+    return {
+        "search_ms": _percentiles(latencies),
+        "per_search": _per_op(search_stats, len(queries)),
+        "per_seeded_fact": _per_op(seed_stats, len(facts)),
+        "embedding_usd_per_1k_searches": round(_embedding_cost_per_1k(search_stats, len(queries)), 6),
+    }
+
+
+async def _bench_mem0(args, fake_url: str, facts: list[str], queries: list[str]) -> dict[str, Any] | None:
+    try:
+        from mem0 import Memory
+    except ImportError:
+        print("mem0ai not installed; skipping Mem0 (pip install mem0ai)")
+        return None
+    from agent.config import get_embedding_model
+
+    memory = Memory.from_config({
+        "llm": {"provider": "openai", "config": {"model": "gpt-4o-mini", "openai_base_url": f"{fake_url}/v1"}},
+        "embedder": {"provider": "openai", "config": {
+            "model": get_embedding_model(), "openai_base_url": f"{fake_url}/v1",
+        }},
+        "vector_store": {"provider": "qdrant", "config": {
+            "collection_name": "bench", "path": tempfile.mkdtemp(prefix="mem0-bench-"),
+            "embedding_model_dims": 1536, "on_disk": True,
+        }},
+    })
+    scope = "memory-bench"
+    async with httpx.AsyncClient() as http:
+        await _stats(http, fake_url)
+        for fact in facts:
+            await asyncio.to_thread(memory.add, [{"role": "user", "content": fact}], user_id=scope, infer=False)
+        seed_stats = await _stats(http, fake_url)
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            await asyncio.to_thread(memory.search, query, user_id=scope, limit=args.top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        search_stats = await _stats(http, fake_url)
+    return {
+        "search_ms": _percentiles(latencies),
+        "per_search": _per_op(search_stats, len(queries)),
+        "per_seeded_fact": _per_op(seed_stats, len(facts)),
+        "embedding_usd_per_1k_searches": round(_embedding_cost_per_1k(search_stats, len(queries)), 6),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    rng = random.Random(args.seed)
+    facts = _facts(args.facts, rng)
+    queries = _queries(args.queries, rng)
+
+    fake_port = _free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    env = {**os.environ, "OPENAI_API_KEY": "fake", "OPENAI_BASE_URL": f"{fake_url}/v1"}
+    os.environ.update(OPENAI_API_KEY="fake", OPENAI_BASE_URL=f"{fake_url}/v1")
+    fake = subprocess.Popen(
+        [sys.executable, str(EVAL_DIR / "fake_services.py"), "--port", str(fake_port),
+         "--embedding-latency-ms", str(args.embedding_latency_ms)],
+        cwd=AGENT_DIR, env=env,
+    )
+    try:
+        await _wait_ready(f"{fake_url}/docs")
+        backends: dict[str, Any] = {}
+        if "postgres" in args.backends:
+            print(f"Postgres: {len(facts)} facts, {len(queries)} searches...")
+            backends["postgres"] = await _bench_postgres(args, fake_url, facts, queries)
+        if "mem0" in args.backends:
+            print(f"Mem0: {len(facts)} facts, {len(queries)} searches...")
+            result = await _bench_mem0(args, fake_url, facts, queries)
+            if result:
+                backends["mem0"] = result
+    finally:
+        fake.terminate()
+        fake.wait(timeout=10)
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_sha": _git_sha(),
+        "config": {
+            "facts": args.facts, "queries": args.queries, "top_k": args.top_k,
+            "embedding_latency_ms": args.embedding_latency_ms,
+        },
+        "backends": backends,
+    }
+
+
+def _print_summary(result: dict[str, Any]) -> None:
+    print(f"\n{'backend':<10} {'p50 ms':>8} {'p95 ms':>8} {'calls/search':>13} {'emb/fact':>9} {'$/1k searches':>14}")
+    for name, r in result["backends"].items():
+        ms = r["search_ms"]
+        print(f"{name:<10} {ms['p50'] or 0:8.2f} {ms['p95'] or 0:8.2f} "
+              f"{r['per_search']['openai_calls']:13.2f} {r['per_seeded_fact']['openai_calls']:9.3f} "
+              f"{r['embedding_usd_per_1k_searches']:14.6f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare Postgres-native memory search with Mem0.")
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"))
+    parser.add_argument("--postgres", choices=["docker"], help="Start a throwaway Postgres container instead")
+    parser.add_argument("--backends", default="postgres,mem0")
+    parser.add_argument("--facts", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0,
+                        help="Simulated embeddings API latency at the fake server")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Results path (default eval/bench_results/memory-<ts>-<sha>.json)")
+    args = parser.parse_args()
+
+    container = None
+    if args.postgres == "docker":
+        args.database_url, container = _start_docker_postgres()
+    if "postgres" in args.backends and not args.database_url:
+        raise SystemExit("Provide --database-url (or DATABASE_URL) or --postgres docker")
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        if container:
+            subprocess.run(["docker", "stop", container], stdout=subprocess.DEVNULL)
+
+    _print_summary(result)
+    RESULTS_DIR.mkdir(exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    out = Path(args.output) if args.output else RESULTS_DIR / f"memory-{stamp}-{result['git_sha'] or 'nogit'}.json"
+    out.write_text(json.dumps(result, indent=2))
+    print(f"\nSaved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Micro-benchmark of RateLimiter.is_allowed under thread contention.
+
+Runs N threads calling is_allowed() over a pool of client keys and reports
+throughput, per-call latency percentiles, and tracked bucket count (which must
+stay bounded once idle keys are swept).
+
+Usage:
+    python eval/bench_rate_limit.py --threads 8 --calls 200000 --keys 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent.rate_limit import RateLimiter  # noqa: E402
+
+
+def _worker(limiter: RateLimiter, calls: int, keys: int, seed: int, out: list[float], barrier: threading.Barrier) -> None:
+    rng = random.Random(seed)
+    clients = [f"10.0.{k // 256}.{k % 256}" for k in range(keys)]
+    samples: list[float] = []
+    barrier.wait()
+    for i in range(calls):
+        client = clients[rng.randrange(keys)]
+        start = time.perf_counter_ns()
+        limiter.is_allowed(client, "public", 1.0)
+        if i % 16 == 0:
+            samples.append((time.perf_counter_ns() - start) / 1000)
+    out.extend(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=200_000, help="Total is_allowed calls")
+    parser.add_argument("--keys", type=int, default=10_000, help="Distinct client ids")
+    parser.add_argument("--limit", type=int, default=20, help="Public requests per hour")
+    parser.add_argument("--sweep-interval", type=float, default=0.05, help="Seconds between idle sweeps")
+    parser.add_argument("--window", type=float, default=1.0, help="Refill window seconds (short so sweeps evict)")
+    args = parser.parse_args()
+
+    limiter = RateLimiter(
+        window_sec=args.window,
+        public_limit=args.limit,
+        private_limit=0,
+        sweep_interval=args.sweep_interval,
+    )
+    per_thread = args.calls // args.threads
+    latencies: list[float] = []
+    barrier = threading.Barrier(args.threads + 1)
+    threads = [
+        threading.Thread(target=_worker, args=(limiter, per_thread, args.keys, i, latencies, barrier))
+        for i in range(args.threads)
+    ]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+    total = per_thread * args.threads
+    print(f"threads={args.threads} calls={total} keys={args.keys}")
+    print(f"throughput: {total / elapsed:,.0f} calls/s ({elapsed:.2f}s)")
+    print(f"latency us: p50={pct(50):.2f} p95={pct(95):.2f} p99={pct(99):.2f} max={latencies[-1]:.2f}")
+    print(f"tracked buckets after run: {len(limiter)}")
+    time.sleep(args.window + args.sweep_interval)
+    limiter.is_allowed("sweep-trigger", "public")
+    print(f"tracked buckets after idle sweep: {len(limiter)}")
+
+
+if __name__ == "__main__":
+    main()
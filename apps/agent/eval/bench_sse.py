@@ -0,0 +1,309 @@
+"""SSE encoding benchmark: CPU per streamed token, frames and bytes on the wire.
+
+Feeds a synthetic token stream (runner-shaped {"type": "delta"} events) through:
+
+- legacy: json.dumps + f-string frame per delta, one write per token, reply
+  built with += (the /chat/stream loop before agent/sse.py)
+- writer: SSEWriter behind pump_frames, reply built as a list of parts, as
+  main.py streams now (pre-escaped deltas, coalescing, heartbeat timer)
+- source: the stream alone, as a floor for the per-token cost
+
+With --source runner the events come from agent.runner._run_agent_stream
+reading pre-built ChatCompletionChunk objects from a fake client, so the
+floor includes the runner's per-chunk work. That mode also times one streamed
+tool call whose arguments arrive in --tokens fragments (an unknown tool name,
+so nothing runs).
+
+CPU time is process time per token (median of --repeat runs). "burst" yields
+to the event loop between tokens without sleeping, like chunks arriving
+back-to-back; --token-interval-ms paces tokens like a live model (coalescing
+then depends on SSE_FLUSH_INTERVAL_MS). Each run checks that the deltas decode
+back to the same text. With --sink socket every frame is also written to a
+local socket (drained by a thread), adding the per-write syscall cost that one
+frame per token pays in production.
+
+Usage:
+    python eval/bench_sse.py
+    python eval/bench_sse.py --tokens 4000 --repeat 7
+    python eval/bench_sse.py --token-interval-ms 5 --tokens 1000
+    python eval/bench_sse.py --sink socket
+    python eval/bench_sse.py --source runner
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncGenerator, Callable
+
+EVAL_DIR = Path(__file__).resolve().parent
+AGENT_DIR = EVAL_DIR.parent
+sys.path.insert(0, str(AGENT_DIR))
+sys.path.insert(0, str(EVAL_DIR))
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk  # noqa: E402
+
+from agent.routing import get_router  # noqa: E402
+from agent.runner import _run_agent_stream  # noqa: E402
+from agent.sse import SSEWriter, pump_frames  # noqa: E402
+from agent.usage import Usage  # noqa: E402
+from benchmark import RESULTS_DIR, _git_sha  # noqa: E402
+
+WORDS = [
+    "Bill", "builds", "robots", "and", "restaurant", "automation", "in", "Melbourne", "—", "he's",
+    "\"curious\"", "about", "reinforcement", "learning,", "snowboarding", "&", "film", "photography.",
+    "Ask", "him", "about", "🤖", "projects", "or", "the", "blog", "post", "on", "design", "systems",
+]
+
+
+def _tokens(n: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    return [(" " if i else "") + rng.choice(WORDS) for i in range(n)] + ["\n"]
+
+
+async def _source(tokens: list[str], interval_s: float) -> AsyncGenerator[dict[str, Any], None]:
+    for token in tokens:
+        await asyncio.sleep(interval_s)
+        yield {"type": "delta", "delta": token}
+
+
+def _chunk(index: int, delta: dict[str, Any]) -> ChatCompletionChunk:
+    return ChatCompletionChunk(
+        id="bench", object="chat.completion.chunk", created=0, model="bench",
+        choices=[{"index": 0, "delta": delta, "finish_reason": None}],
+    )
+
+
+def _content_chunks(tokens: list[str]) -> list[ChatCompletionChunk]:
+    return [_chunk(i, {"content": token}) for i, token in enumerate(tokens)]
+
+
+def _tool_call_chunks(fragments: int) -> list[ChatCompletionChunk]:
+    first = {"index": 0, "id": "call_bench", "type": "function", "function": {"name": "bench_tool", "arguments": '{"q": "'}}
+    chunks = [_chunk(0, {"tool_calls": [first]})]
+    for i in range(fragments):
+        chunks.append(_chunk(i + 1, {"tool_calls": [{"index": 0, "function": {"arguments": "ab"}}]}))
+    chunks.append(_chunk(fragments + 1, {"tool_calls": [{"index": 0, "function": {"arguments": '"}'}}]}))
+    return chunks
+
+
+class _FakeCompletions:
+    """chat.completions stand-in: streams prepared chunks, then answers "done"."""
+
+    def __init__(self, chunks: list[ChatCompletionChunk], interval_s: float) -> None:
+        self._chunks = chunks
+        self._interval_s = interval_s
+
+    async def _stream(self) -> AsyncGenerator[ChatCompletionChunk, None]:
+        for chunk in self._chunks:
+            await asyncio.sleep(self._interval_s)
+            yield chunk
+
+    async def create(self, *, stream: bool = False, **kwargs: Any) -> Any:
+        if stream:
+            return self._stream()
+        return ChatCompletion(
+            id="bench", object="chat.completion", created=0, model="bench",
+            choices=[{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "done"}}],
+        )
+
+
+class _FakeClient:
+    def __init__(self, chunks: list[ChatCompletionChunk], interval_s: float) -> None:
+        self.chat = type("Chat", (), {"completions": _FakeCompletions(chunks, interval_s)})()
+
+
+def _runner_source(chunks: list[ChatCompletionChunk], interval_s: float) -> AsyncGenerator[dict[str, Any], None]:
+    return _run_agent_stream(
+        _FakeClient(chunks, interval_s), [{"role": "user", "content": "bench"}],
+        get_router().for_request(model="bench"), [], Usage(),
+    )
+
+
+def _decode(frames: list[str]) -> str:
+    text = []
+    for frame in frames:
+        if frame.startswith("event: message_delta"):
+            text.append(json.loads(frame.split("data: ", 1)[1])["delta"])
+    return "".join(text)
+
+
+class _Sink:
+    """Collects frames; with a socket, also sends each one like a response write."""
+
+    def __init__(self, sock: socket.socket | None) -> None:
+        self.frames: list[str] = []
+        self._sock = sock
+
+    def write(self, frame: str) -> None:
+        self.frames.append(frame)
+        if self._sock is not None:
+            self._sock.sendall(frame.encode())
+
+
+async def _run_source(events, sink: _Sink) -> None:
+    async for _ in events:
+        pass
+
+
+async def _run_legacy(events, sink: _Sink) -> None:
+    accumulated = ""
+    async for item in events:
+        if item.get("type") != "delta":
+            continue
+        delta = item.get("delta", "")
+        if delta:
+            accumulated += delta
+            sink.write(f"event: message_delta\ndata: {json.dumps({'delta': delta})}\n\n")
+
+
+async def _run_writer(events, sink: _Sink) -> None:
+    writer = SSEWriter()
+    reply: list[str] = []
+
+    def handle(item: dict[str, Any]) -> str:
+        if item.get("type") != "delta":
+            return ""
+        delta = item.get("delta", "")
+        if not delta:
+            return ""
+        reply.append(delta)
+        return writer.delta(delta)
+
+    async for frame in pump_frames(events, handle, writer):
+        sink.write(frame)
+    frame = writer.flush()
+    if frame:
+        sink.write(frame)
+    "".join(reply)
+
+
+VARIANTS = {"source": _run_source, "legacy": _run_legacy, "writer": _run_writer}
+
+
+def _drain(sock: socket.socket) -> None:
+    while sock.recv(1 << 16):
+        pass
+
+
+async def _measure(
+    variant: str, make_events: Callable[[], AsyncGenerator[dict[str, Any], None]], use_socket: bool
+) -> tuple[float, float, list[str]]:
+    sender = receiver = drainer = None
+    if use_socket:
+        sender, receiver = socket.socketpair()
+        drainer = threading.Thread(target=_drain, args=(receiver,), daemon=True)
+        drainer.start()
+    sink = _Sink(sender)
+    try:
+        start_cpu, start_wall = time.process_time(), time.perf_counter()
+        await VARIANTS[variant](make_events(), sink)
+        return time.process_time() - start_cpu, time.perf_counter() - start_wall, sink.frames
+    finally:
+        if sender is not None:
+            sender.close()
+            drainer.join()
+            receiver.close()
+
+
+async def _measure_tool_args(fragments: int, repeat: int) -> float:
+    """Median CPU seconds for the runner to consume one tool call streamed in fragments."""
+    chunks = _tool_call_chunks(fragments)
+    cpu = []
+    for _ in range(repeat):
+        start = time.process_time()
+        async for _ in _runner_source(chunks, 0):
+            pass
+        cpu.append(time.process_time() - start)
+    return statistics.median(cpu)
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    tokens = _tokens(args.tokens, args.seed)
+    expected = "".join(tokens)
+    interval_s = args.token_interval_ms / 1000
+    if args.source == "runner":
+        chunks = _content_chunks(tokens)
+        make_events = lambda: _runner_source(chunks, interval_s)  # noqa: E731
+    else:
+        make_events = lambda: _source(tokens, interval_s)  # noqa: E731
+    results: dict[str, Any] = {}
+    for variant in VARIANTS:
+        cpu, wall, frames = [], [], []
+        for _ in range(args.repeat):
+            c, w, frames = await _measure(variant, make_events, args.sink == "socket")
+            cpu.append(c)
+            wall.append(w)
+        if variant != "source" and _decode(frames) != expected:
+            raise SystemExit(f"{variant}: decoded deltas don't match the source text")
+        results[variant] = {
+            "cpu_us_per_token": round(statistics.median(cpu) / len(tokens) * 1e6, 3),
+            "wall_ms": round(statistics.median(wall) * 1000, 2),
+            "frames": len(frames),
+            "bytes": sum(len(f.encode()) for f in frames),
+        }
+    floor = results["source"]["cpu_us_per_token"]
+    for variant in ("legacy", "writer"):
+        results[variant]["encode_cpu_us_per_token"] = round(results[variant]["cpu_us_per_token"] - floor, 3)
+    tool_args = None
+    if args.source == "runner":
+        seconds = await _measure_tool_args(args.tokens, args.repeat)
+        tool_args = {"fragments": args.tokens, "cpu_ms": round(seconds * 1000, 3)}
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_sha": _git_sha(),
+        "config": {
+            "tokens": len(tokens), "repeat": args.repeat, "token_interval_ms": args.token_interval_ms,
+            "sink": args.sink, "source": args.source,
+            "sse_flush_interval_ms": SSEWriter()._interval * 1000,
+        },
+        "variants": results,
+        "tool_call_arguments": tool_args,
+    }
+
+
+def _print_summary(result: dict[str, Any]) -> None:
+    print(f"\n{'variant':<8} {'cpu us/token':>13} {'encode us/token':>16} {'frames':>7} {'bytes':>8} {'wall ms':>9}")
+    for name, r in result["variants"].items():
+        encode = r.get("encode_cpu_us_per_token")
+        print(f"{name:<8} {r['cpu_us_per_token']:13.3f} {'' if encode is None else f'{encode:.3f}':>16} "
+              f"{r['frames']:7d} {r['bytes']:8d} {r['wall_ms']:9.2f}")
+    tool_args = result.get("tool_call_arguments")
+    if tool_args:
+        print(f"\nrunner, one tool call in {tool_args['fragments']} argument fragments: {tool_args['cpu_ms']:.3f} ms CPU")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark SSE framing CPU per streamed token.")
+    parser.add_argument("--tokens", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--token-interval-ms", type=float, default=0.0,
+                        help="Delay between tokens (0 = burst, yield to the loop only)")
+    parser.add_argument("--sink", choices=["none", "socket"], default="none",
+                        help="Also write each frame to a local socket")
+    parser.add_argument("--source", choices=["synthetic", "runner"], default="synthetic",
+                        help="Feed deltas directly, or through the runner's stream loop")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Results path (default eval/bench_results/sse-<ts>-<sha>.json)")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    _print_summary(result)
+    RESULTS_DIR.mkdir(exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    out = Path(args.output) if args.output else RESULTS_DIR / f"sse-{stamp}-{result['git_sha'] or 'nogit'}.json"
+    out.write_text(json.dumps(result, indent=2))
+    print(f"\nSaved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Offline comparison of model-routing policies on recorded conversations.
+
+Replays each conversation (every turn up to its last user message) through
+agent.runner.run_agent in-process, once per policy, mode and context:
+
+- full: every step on the full model (OPENAI_MODEL, or --full-model)
+- fast: every step on the fast model (FAST_MODEL, or --fast-model)
+- routed: agent.routing.ModelRouter picks the model per step
+
+and reports per policy:
+
+- reply latency (p50/p95/p99)
+- tokens and estimated cost (agent.usage prices)
+- LLM steps per model and routing reason
+- with --judge, the mean vibe score from eval/vibe_evaluator.py's LLM judge,
+  so a cheaper policy can be checked for quality loss
+
+Conversations come from eval/test_conversations.json (test_cases[].conversation)
+or --conversations (same shape, or a JSON list of message lists). Runs call the
+real OpenAI API and the tools as configured in .env; send_email and
+schedule_meeting are withheld by default (--disable-tools). Each policy gets
+its own router, so the routed policy's latency SLO only sees its own calls.
+--dry-run prints the routed models for the first and the answer step of each
+mode and context without calling the API.
+
+Usage:
+    python eval/eval_routing.py --dry-run --full-model gpt-4o
+    python eval/eval_routing.py --full-model gpt-4o --limit 8
+    python eval/eval_routing.py --full-model gpt-4o --modes wise --contexts private --judge
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from dotenv import load_dotenv
+
+EVAL_DIR = Path(__file__).resolve().parent
+AGENT_DIR = EVAL_DIR.parent
+# Before agent imports: routing and deadline settings are read at import time
+load_dotenv(AGENT_DIR / ".env")
+sys.path.insert(0, str(AGENT_DIR))
+sys.path.insert(0, str(EVAL_DIR))
+
+from agent.config import get_fast_model, get_model  # noqa: E402
+from agent.deadline import REQUEST_DEADLINE_SECONDS, Deadline  # noqa: E402
+from agent.routing import STEP_ANSWER, STEP_SELECT, ModelRouter, RequestRouter  # noqa: E402
+from agent.runner import run_agent  # noqa: E402
+from benchmark import RESULTS_DIR, _git_sha, _percentiles  # noqa: E402
+
+POLICIES = ("full", "fast", "routed")
+
+
+class _RecordingRouter(ModelRouter):
+    """ModelRouter that keeps each request's RequestRouter (for its routes)."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.requests: list[RequestRouter] = []
+
+    def for_request(self, **kwargs: Any) -> RequestRouter:
+        routing = super().for_request(**kwargs)
+        self.requests.append(routing)
+        return routing
+
+
+def _load_cases(path: Path, limit: int | None) -> list[dict[str, Any]]:
+    data = json.loads(path.read_text())
+    items = data["test_cases"] if isinstance(data, dict) else data
+    cases = []
+    for i, item in enumerate(items):
+        case = item if isinstance(item, dict) else {"conversation": item}
+        conversation = case["conversation"]
+        while conversation and conversation[-1]["role"] != "user":
+            conversation = conversation[:-1]
+        if conversation:
+            cases.append({**case, "id": case.get("id", f"case_{i}"), "conversation": conversation})
+    return cases[:limit] if limit else cases
+
+
+async def _run_one(
+    case: dict[str, Any],
+    policy: str,
+    router: _RecordingRouter,
+    mode: str,
+    context: str,
+    args: argparse.Namespace,
+) -> dict[str, Any]:
+    model = {"full": router.full_model, "fast": router.fast_model}.get(policy)
+    start = time.perf_counter()
+    result = await run_agent(
+        case["conversation"],
+        model=model,
+        context=context,
+        mode=mode,
+        request_id=f"route-{policy}-{case['id']}",
+        disabled_tools=args.disable_tools,
+        deadline=Deadline(args.deadline),
+        router=router,
+    )
+    seconds = time.perf_counter() - start
+    routes = router.requests[-1].routes
+    return {
+        "case": case["id"],
+        "policy": policy,
+        "mode": mode,
+        "context": context,
+        "seconds": round(seconds, 4),
+        "message": result["message"],
+        "sources": result["sources"],
+        "usage": result["usage"],
+        "routes": [{"model": r.model, "reason": r.reason, "probe": r.probe} for r in routes],
+    }
+
+
+async def _judge(runs: list[dict[str, Any]], cases: dict[str, dict[str, Any]]) -> None:
+    from vibe_evaluator import VibeEvaluator
+
+    evaluator = VibeEvaluator()
+    try:
+        for run in runs:
+            case = cases[run["case"]]
+            verdict = await evaluator.judge_response(
+                case["conversation"],
+                run["message"],
+                case.get("vibes_to_avoid", []),
+                case.get("vibes_to_match", []),
+                case.get("bad_responses", []),
+                case.get("good_responses", []),
+            )
+            run["vibe_score"] = verdict.get("overall_score")
+    finally:
+        await evaluator.close()
+
+
+def _summarize(runs: list[dict[str, Any]]) -> dict[str, Any]:
+    summary: dict[str, Any] = {}
+    for policy in dict.fromkeys(r["policy"] for r in runs):
+        rows = [r for r in runs if r["policy"] == policy]
+        steps = Counter(route["model"] for r in rows for route in r["routes"])
+        reasons = Counter(route["reason"] for r in rows for route in r["routes"])
+        scores = [r["vibe_score"] for r in rows if isinstance(r.get("vibe_score"), (int, float))]
+        summary[policy] = {
+            "runs": len(rows),
+            "latency_s": _percentiles([r["seconds"] for r in rows]),
+            "total_tokens": sum(r["usage"]["total_tokens"] for r in rows),
+            "cost_usd": round(sum(r["usage"]["cost_usd"] for r in rows), 6),
+            "steps_by_model": dict(steps),
+            "steps_by_reason": dict(reasons),
+            "vibe_score_mean": round(sum(scores) / len(scores), 2) if scores else None,
+        }
+    return summary
+
+
+def _dry_run(args: argparse.Namespace) -> None:
+    router = ModelRouter(args.fast_model, args.full_model)
+    print(f"fast={router.fast_model} full={router.full_model}\n")
+    print(f"{'mode':<10} {'context':<8} {'select step':<34} {'answer step':<34}")
+    for mode in args.modes:
+        for context in args.contexts:
+            deadline = Deadline(args.deadline)
+            select = router.route(STEP_SELECT, mode=mode, context=context, deadline=deadline)
+            answer = router.route(STEP_ANSWER, mode=mode, context=context, deadline=deadline)
+            print(f"{mode:<10} {context:<8} {f'{select.model} ({select.reason})':<34} "
+                  f"{f'{answer.model} ({answer.reason})':<34}")
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    cases = _load_cases(Path(args.conversations), args.limit)
+    runs: list[dict[str, Any]] = []
+    for policy in args.policies:
+        router = _RecordingRouter(args.fast_model, args.full_model)
+        for case in cases:
+            for mode in args.modes:
+                for context in args.contexts:
+                    run_result = await _run_one(case, policy, router, mode, context, args)
+                    runs.append(run_result)
+                    print(f"{policy:<7} {case['id']:<32} {mode:<8} {context:<8} {run_result['seconds']:7.2f}s "
+                          f"{' '.join(r['model'] for r in run_result['routes'])}")
+    if args.judge:
+        await _judge(runs, {c["id"]: c for c in cases})
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_sha": _git_sha(),
+        "config": {
+            "conversations": str(args.conversations), "cases": len(cases),
+            "fast_model": args.fast_model, "full_model": args.full_model,
+            "policies": args.policies, "modes": args.modes, "contexts": args.contexts,
+            "deadline_s": args.deadline, "disabled_tools": sorted(args.disable_tools), "judge": args.judge,
+        },
+        "summary": _summarize(runs),
+        "runs": runs,
+    }
+
+
+def _print_summary(result: dict[str, Any]) -> None:
+    print(f"\n{'policy':<7} {'runs':>5} {'p50 s':>7} {'p95 s':>7} {'tokens':>9} {'cost $':>10} {'vibe':>6}  steps by model")
+    for policy, s in result["summary"].items():
+        latency = s["latency_s"]
+        vibe = "" if s["vibe_score_mean"] is None else f"{s['vibe_score_mean']:.1f}"
+        print(f"{policy:<7} {s['runs']:5d} {latency['p50'] or 0:7.2f} {latency['p95'] or 0:7.2f} "
+              f"{s['total_tokens']:9d} {s['cost_usd']:10.4f} {vibe:>6}  {s['steps_by_model']}")
+
+
+def _csv(value: str) -> list[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare model-routing policies on recorded conversations.")
+    parser.add_argument("--conversations", default=str(EVAL_DIR / "test_conversations.json"))
+    parser.add_argument("--limit", type=int, help="Only the first N conversations")
+    parser.add_argument("--policies", type=_csv, default=list(POLICIES), help="Comma-separated: full,fast,routed")
+    parser.add_argument("--modes", type=_csv, default=["default", "wise", "annoyed"])
+    parser.add_argument("--contexts", type=_csv, default=["public", "private"])
+    parser.add_argument("--full-model", default=get_model())
+    parser.add_argument("--fast-model", default=get_fast_model())
+    parser.add_argument("--deadline", type=float, default=REQUEST_DEADLINE_SECONDS,
+                        help="Request deadline per run in seconds (0 = none)")
+    parser.add_argument("--disable-tools", type=lambda v: frozenset(_csv(v)),
+                        default=frozenset({"send_email", "schedule_meeting"}),
+                        help="Tools withheld from the agent (comma-separated)")
+    parser.add_argument("--judge", action="store_true", help="Score each reply with the vibe judge")
+    parser.add_argument("--dry-run", action="store_true", help="Print routing decisions only (no API calls)")
+    parser.add_argument("--output", help="Results path (default eval/bench_results/routing-<ts>-<sha>.json)")
+    args = parser.parse_args()
+    unknown = set(args.policies) - set(POLICIES)
+    if unknown:
+        parser.error(f"unknown policies: {', '.join(sorted(unknown))}")
+
+    if args.dry_run:
+        _dry_run(args)
+        return
+    result = asyncio.run(run(args))
+    _print_summary(result)
+    RESULTS_DIR.mkdir(exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    out = Path(args.output) if args.output else RESULTS_DIR / f"routing-{stamp}-{result['git_sha'] or 'nogit'}.json"
+    out.write_text(json.dumps(result, indent=2))
+    print(f"\nSaved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""EXPLAIN ANALYZE regression check for the visitor matching path.
+
+Seeds a local database with synthetic profiles and sessions (1M sessions by
+default), then runs EXPLAIN (ANALYZE, BUFFERS) on each query in
+db.postgres.VISITOR_MATCH_QUERIES and fails if:
+- any scan on sessions or profiles is a Seq Scan,
+- the fingerprint/ip lookups don't read sessions with an Index Only Scan
+  (apps/web/scripts/add-session-match-indexes.sql), or need heap fetches,
+- a lookup takes longer than --max-ms.
+
+Only run against a scratch database: seeding refuses if sessions holds rows it
+didn't create. Seeded rows are kept between runs (use --reseed to rebuild).
+
+Usage:
+    python eval/explain_session_matching.py --postgres docker
+    python eval/explain_session_matching.py --database-url postgresql://localhost/bills_bio_explain
+    python eval/explain_session_matching.py --database-url ... --sessions 100000 --max-ms 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+import asyncpg
+
+EVAL_DIR = Path(__file__).resolve().parent
+AGENT_DIR = EVAL_DIR.parent
+sys.path.insert(0, str(AGENT_DIR))
+
+from db.postgres import VISITOR_MATCH_QUERIES  # noqa: E402
+
+SEED_PREFIX = "explain-"
+
+# Lookups whose sessions side must be index-only (session_id is a unique point lookup).
+INDEX_ONLY = {"fingerprint", "ip"}
+
+
+async def _seed(conn: asyncpg.Connection, sessions: int, profiles: int, reseed: bool) -> None:
+    foreign = await conn.fetchval(
+        "SELECT EXISTS (SELECT 1 FROM sessions WHERE session_id NOT LIKE $1)", SEED_PREFIX + "%"
+    )
+    if foreign:
+        raise SystemExit("sessions has rows this script didn't seed; use a scratch database")
+
+    seeded = await conn.fetchval("SELECT COUNT(*) FROM sessions")
+    if seeded == sessions and not reseed:
+        print(f"Reusing {seeded:,} seeded sessions")
+        return
+    if seeded:
+        await conn.execute("DELETE FROM profiles WHERE name = 'Explain Seed'")
+
+    start = time.monotonic()
+    print(f"Seeding {profiles:,} profiles and {sessions:,} sessions...")
+    await conn.execute("""
+        INSERT INTO profiles (id, type, status, name, data, last_seen)
+        SELECT md5($1 || i)::uuid, 'visitor',
+               CASE WHEN i % 10 = 0 THEN 'identified' ELSE 'anonymous' END,
+               'Explain Seed', '{}'::jsonb,
+               NOW() - random() * INTERVAL '90 days'
+        FROM generate_series(0, $2 - 1) AS i
+    """, SEED_PREFIX + "profile-", profiles)
+    # ~1/3 distinct fingerprints, 1 in 5 sessions without one; IPs spread over /8
+    await conn.execute("""
+        INSERT INTO sessions (session_id, profile_id, data, created_at, last_seen)
+        SELECT $1 || i,
+               md5($2 || (i % $4))::uuid,
+               jsonb_build_object(
+                   'ip', '10.' || (i / 62500) % 256 || '.' || (i / 250) % 250 || '.' || i % 250,
+                   'fingerprint', CASE WHEN i % 5 = 0 THEN '' ELSE md5('fp-' || i % ($3 / 3)) END,
+                   'user_agent', 'explain'
+               ),
+               ts, ts
+        FROM (
+            SELECT i, NOW() - random() * INTERVAL '90 days' AS ts
+            FROM generate_series(0, $3 - 1) AS i
+        ) AS g
+    """, SEED_PREFIX, SEED_PREFIX + "profile-", sessions, profiles)
+    await conn.execute("VACUUM (ANALYZE) profiles")
+    await conn.execute("VACUUM (ANALYZE) sessions")
+    print(f"Seeded in {time.monotonic() - start:.1f}s")
+
+
+async def _probe_params(conn: asyncpg.Connection) -> dict[str, list[Any]]:
+    """A recently seen and a missing key per lookup."""
+    fingerprint = await conn.fetchval(
+        "SELECT fingerprint FROM sessions WHERE fingerprint IS NOT NULL ORDER BY last_seen DESC LIMIT 1"
+    )
+    ip = await conn.fetchval("SELECT ip FROM sessions WHERE ip IS NOT NULL ORDER BY last_seen DESC LIMIT 1")
+    return {
+        "session_id": [SEED_PREFIX + "12345", SEED_PREFIX + "missing"],
+        "fingerprint": [fingerprint, "0" * 32],
+        "ip": [ip, "192.0.2.1"],
+    }
+
+
+def _nodes(plan: dict[str, Any]):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _nodes(child)
+
+
+def _check_plan(name: str, explain: dict[str, Any], max_ms: float) -> list[str]:
+    problems = []
+    scans = [n for n in _nodes(explain["Plan"]) if n.get("Relation Name") in ("sessions", "profiles")]
+    for node in scans:
+        if node["Node Type"] == "Seq Scan":
+            problems.append(f"Seq Scan on {node['Relation Name']}")
+    if name in INDEX_ONLY:
+        for node in scans:
+            if node.get("Relation Name") != "sessions":
+                continue
+            if node["Node Type"] != "Index Only Scan":
+                problems.append(f"sessions read by {node['Node Type']} ({node.get('Index Name')}), not Index Only Scan")
+            elif node.get("Heap Fetches", 0) > 0:
+                problems.append(f"{node['Heap Fetches']} heap fetches (visibility map stale? VACUUM sessions)")
+    if explain["Execution Time"] > max_ms:
+        problems.append(f"execution {explain['Execution Time']:.2f} ms > {max_ms} ms")
+    return problems
+
+
+def _plan_summary(plan: dict[str, Any]) -> str:
+    parts = []
+    for node in _nodes(plan):
+        label = node["Node Type"]
+        if node.get("Index Name"):
+            label += f" using {node['Index Name']}"
+        elif node.get("Relation Name"):
+            label += f" on {node['Relation Name']}"
+        parts.append(label)
+    return " > ".join(parts)
+
+
+async def run(args: argparse.Namespace) -> int:
+    conn = await asyncpg.connect(args.database_url)
+    try:
+        await _seed(conn, args.sessions, args.profiles, args.reseed)
+        params = await _probe_params(conn)
+        results = []
+        failed = False
+        for name, query in VISITOR_MATCH_QUERIES.items():
+            for value in params[name]:
+                # Warm once so timings reflect cached pages, like the live path
+                await conn.fetch(query, value)
+                raw = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", value)
+                explain = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+                problems = _check_plan(name, explain, args.max_ms)
+                failed = failed or bool(problems)
+                results.append({
+                    "lookup": name,
+                    "param": value,
+                    "execution_ms": round(explain["Execution Time"], 3),
+                    "plan": _plan_summary(explain["Plan"]),
+                    "problems": problems,
+                })
+                status = "FAIL" if problems else "ok"
+                print(f"[{status}] {name:<11} {explain['Execution Time']:7.3f} ms  {_plan_summary(explain['Plan'])}")
+                for problem in problems:
+                    print(f"         - {problem}")
+        if args.output:
+            Path(args.output).write_text(json.dumps(results, indent=2, default=str))
+        return 1 if failed else 0
+    finally:
+        await conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="EXPLAIN ANALYZE regression check for visitor matching.")
+    parser.add_argument("--database-url", default=os.environ.get("EXPLAIN_DATABASE_URL"),
+                        help="Scratch database with the schema applied (not DATABASE_URL, on purpose)")
+    parser.add_argument("--postgres", choices=["docker"], help="Start a throwaway Postgres container instead")
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--profiles", type=int, default=250_000)
+    parser.add_argument("--reseed", action="store_true", help="Delete and re-create seeded rows")
+    parser.add_argument("--max-ms", type=float, default=5.0, help="Per-lookup execution time budget")
+    parser.add_argument("--output", help="Write per-lookup results as JSON")
+    args = parser.parse_args()
+
+    container = None
+    if args.postgres == "docker":
+        sys.path.insert(0, str(EVAL_DIR))
+        from benchmark import _start_docker_postgres  # noqa: E402
+
+        args.database_url, container = _start_docker_postgres()
+    if not args.database_url:
+        raise SystemExit("Provide --database-url (or EXPLAIN_DATABASE_URL) or --postgres docker")
+    try:
+        code = asyncio.run(run(args))
+    finally:
+        if container:
+            subprocess.run(["docker", "stop", container], stdout=subprocess.DEVNULL)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Fake OpenAI-compatible and Serper servers for local benchmarks.
+
+Serves:
+  POST /v1/chat/completions  OpenAI chat completions (streaming and not), with
+                             configurable TTFT distribution, token rate, and tool calls.
+  POST /v1/embeddings        Deterministic fake embeddings.
+  POST /search               Serper-style web search results.
+  GET  /stats                Requests per endpoint and embedding inputs (?reset=1 clears).
+
+The agent is pointed here with OPENAI_BASE_URL=http://HOST:PORT/v1 and
+SERPER_API_URL=http://HOST:PORT/search (see eval/benchmark.py).
+
+Usage:
+    python eval/fake_services.py --port 9100 --token-rate 80 --tool-call-rate 0.5
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "yeah i'm building robots at instinct right now mostly manipulation and "
+    "some restaurant automation stuff it's been fun but hard brisbane is home "
+    "though i travel a lot for work and snowboarding"
+).split()
+
+
+@dataclass
+class FakeConfig:
+    """Behavior knobs for the fake LLM."""
+
+    token_rate: float = 80.0  # streamed tokens per second
+    ttft_median_ms: float = 300.0  # lognormal median time to first token / response
+    ttft_sigma: float = 0.5  # lognormal shape
+    reply_tokens: int = 40  # tokens in a final answer
+    tool_call_rate: float = 0.5  # probability the first step calls a tool
+    tools: tuple[str, ...] = ("query_profile", "web_search")
+    serper_latency_ms: float = 150.0
+    embedding_latency_ms: float = 0.0
+    seed: int | None = None
+
+
+def _estimate_tokens(messages: list[dict[str, Any]]) -> int:
+    """Cheap prompt token estimate (~4 chars per token) for usage reporting."""
+    chars = sum(len(str(m.get("content") or "")) for m in messages)
+    return max(1, chars // 4)
+
+
+def create_app(config: FakeConfig) -> FastAPI:
+    """Build the fake services app."""
+    app = FastAPI(title="Fake OpenAI + Serper")
+    rng = random.Random(config.seed)
+    stats: dict[str, int] = defaultdict(int)
+
+    @app.middleware("http")
+    async def count_requests(request: Request, call_next: Any) -> Any:
+        if request.url.path != "/stats":
+            stats[f"{request.method} {request.url.path}"] += 1
+        return await call_next(request)
+
+    @app.get("/stats")
+    async def get_stats(reset: bool = False) -> Any:
+        snapshot = dict(stats)
+        if reset:
+            stats.clear()
+        return JSONResponse(snapshot)
+
+    def ttft_seconds() -> float:
+        return rng.lognormvariate(0, config.ttft_sigma) * config.ttft_median_ms / 1000
+
+    def wants_tool(body: dict[str, Any]) -> str | None:
+        messages = body.get("messages", [])
+        if not body.get("tools") or (messages and messages[-1].get("role") == "tool"):
+            return None
+        available = {t["function"]["name"] for t in body["tools"]}
+        candidates = [t for t in config.tools if t in available]
+        if candidates and rng.random() < config.tool_call_rate:
+            return rng.choice(candidates)
+        return None
+
+    def reply_words() -> list[str]:
+        start = rng.randrange(len(WORDS))
+        return [WORDS[(start + i) % len(WORDS)] for i in range(config.reply_tokens)]
+
+    def usage(body: dict[str, Any], completion_tokens: int) -> dict[str, int]:
+        prompt = _estimate_tokens(body.get("messages", [])) + len(json.dumps(body.get("tools", []))) // 4
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt + completion_tokens,
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request) -> Any:
+        body = await request.json()
+        model = body.get("model", "gpt-4o-mini")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        tool = wants_tool(body)
+        tool_args = json.dumps({"query": "what is bill working on"})
+        await asyncio.sleep(ttft_seconds())
+
+        if not body.get("stream"):
+            if tool:
+                message: dict[str, Any] = {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [{
+                        "id": f"call_{uuid.uuid4().hex[:8]}",
+                        "type": "function",
+                        "function": {"name": tool, "arguments": tool_args},
+                    }],
+                }
+                finish, completion_tokens = "tool_calls", 12
+            else:
+                words = reply_words()
+                await asyncio.sleep(len(words) / config.token_rate)
+                message = {"role": "assistant", "content": " ".join(words)}
+                finish, completion_tokens = "stop", len(words)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+                "usage": usage(body, completion_tokens),
+            })
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        def chunk(delta: dict[str, Any], finish: str | None = None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events() -> AsyncIterator[str]:
+            interval = 1.0 / config.token_rate
+            if tool:
+                yield chunk({"role": "assistant", "tool_calls": [{
+                    "index": 0,
+                    "id": f"call_{uuid.uuid4().hex[:8]}",
+                    "type": "function",
+                    "function": {"name": tool, "arguments": ""},
+                }]})
+                for i in range(0, len(tool_args), 8):
+                    await asyncio.sleep(interval)
+                    yield chunk({"tool_calls": [{"index": 0, "function": {"arguments": tool_args[i:i + 8]}}]})
+                yield chunk({}, "tool_calls")
+                completion_tokens = 12
+            else:
+                words = reply_words()
+                for i, word in enumerate(words):
+                    if i:
+                        await asyncio.sleep(interval)
+                    yield chunk({"role": "assistant", "content": ("" if i == 0 else " ") + word})
+                yield chunk({}, "stop")
+                completion_tokens = len(words)
+            if include_usage:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": usage(body, completion_tokens),
+                }
+                yield f"data: {json.dumps(payload)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request) -> Any:
+        body = await request.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        stats["embedding_inputs"] += len(inputs)
+        stats["embedding_chars"] += sum(len(str(text)) for text in inputs)
+        if config.embedding_latency_ms:
+            await asyncio.sleep(config.embedding_latency_ms / 1000)
+        data = []
+        for i, text in enumerate(inputs):
+            digest = hashlib.sha256(str(text).encode()).digest()
+            vector = [(b - 128) / 128 for b in digest] * 48  # 1536 dims
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        return JSONResponse({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+        })
+
+    @app.post("/search")
+    async def serper_search(request: Request) -> Any:
+        body = await request.json()
+        await asyncio.sleep(config.serper_latency_ms / 1000)
+        query = body.get("q", "")
+        organic = [
+            {
+                "title": f"Result {i} for {query}",
+                "snippet": f"A short snippet about {query} ({i}).",
+                "link": f"https://example.com/{i}",
+            }
+            for i in range(1, int(body.get("num", 5)) + 1)
+        ]
+        return JSONResponse({"organic": organic})
+
+    return app
+
+
+def add_config_args(parser: argparse.ArgumentParser) -> None:
+    """Register FakeConfig options on an argument parser."""
+    parser.add_argument("--token-rate", type=float, default=80.0, help="Streamed tokens per second")
+    parser.add_argument("--ttft-median-ms", type=float, default=300.0, help="Median time to first token")
+    parser.add_argument("--ttft-sigma", type=float, default=0.5, help="Lognormal sigma of TTFT")
+    parser.add_argument("--reply-tokens", type=int, default=40, help="Tokens per final answer")
+    parser.add_argument("--tool-call-rate", type=float, default=0.5, help="Probability of a tool call on the first step")
+    parser.add_argument("--tools", default="query_profile,web_search", help="Comma-separated tools the fake may call")
+    parser.add_argument("--serper-latency-ms", type=float, default=150.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(
+        token_rate=args.token_rate,
+        ttft_median_ms=args.ttft_median_ms,
+        ttft_sigma=args.ttft_sigma,
+        reply_tokens=args.reply_tokens,
+        tool_call_rate=args.tool_call_rate,
+        tools=tuple(t.strip() for t in args.tools.split(",") if t.strip()),
+        serper_latency_ms=args.serper_latency_ms,
+        embedding_latency_ms=args.embedding_latency_ms,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_config_args(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
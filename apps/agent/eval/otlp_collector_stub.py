@@ -0,0 +1,122 @@
+"""Local OTLP/HTTP collector stub for checking the agent's span export.
+
+Accepts OTLP JSON on POST /v1/traces, prints one line per span, and optionally
+appends the decoded spans to a JSON-lines file.
+
+Usage:
+    python eval/otlp_collector_stub.py --port 4318 --out /tmp/otlp_spans.jsonl
+
+    # In another terminal
+    OTEL_EXPORTER_OTLP_ENDPOINT=http://127.0.0.1:4318 uvicorn main:app --port 8000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+
+def _attr_value(value: dict[str, Any]) -> Any:
+    for key in ("stringValue", "boolValue", "doubleValue"):
+        if key in value:
+            return value[key]
+    if "intValue" in value:
+        return int(value["intValue"])
+    return None
+
+
+def decode_spans(payload: dict[str, Any]) -> list[dict[str, Any]]:
+    """Flatten an OTLP ExportTraceServiceRequest (JSON) into simple span dicts."""
+    spans: list[dict[str, Any]] = []
+    for rs in payload.get("resourceSpans", []):
+        for ss in rs.get("scopeSpans", []):
+            for s in ss.get("spans", []):
+                start = int(s["startTimeUnixNano"])
+                end = int(s["endTimeUnixNano"])
+                spans.append({
+                    "name": s["name"],
+                    "trace_id": s["traceId"],
+                    "span_id": s["spanId"],
+                    "parent_id": s.get("parentSpanId"),
+                    "duration_ms": round((end - start) / 1e6, 3),
+                    "status": s.get("status", {}).get("code"),
+                    "attributes": {a["key"]: _attr_value(a["value"]) for a in s.get("attributes", [])},
+                })
+    return spans
+
+
+class CollectorStub:
+    """In-process collector; also usable from scripts (start(), spans, stop())."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 4318, out: str | None = None, quiet: bool = False) -> None:
+        self.spans: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:  # noqa: N802
+                if self.path != "/v1/traces":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+                try:
+                    spans = decode_spans(json.loads(body))
+                except (ValueError, KeyError) as e:
+                    self.send_response(400)
+                    self.end_headers()
+                    self.wfile.write(str(e).encode())
+                    return
+                stub._receive(spans, out, quiet)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread: threading.Thread | None = None
+
+    def _receive(self, spans: list[dict[str, Any]], out: str | None, quiet: bool) -> None:
+        with self._lock:
+            self.spans.extend(spans)
+            if out:
+                with open(out, "a", encoding="utf-8") as f:
+                    for s in spans:
+                        f.write(json.dumps(s) + "\n")
+        if not quiet:
+            for s in spans:
+                print(f"{s['trace_id'][:8]} {s['name']:<16} {s['duration_ms']:>9.1f}ms {s['attributes']}")
+
+    def start(self) -> CollectorStub:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--out", help="Append received spans to this JSON-lines file")
+    args = parser.parse_args()
+    stub = CollectorStub(args.host, args.port, args.out)
+    print(f"OTLP collector stub listening on http://{args.host}:{stub.port}/v1/traces")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
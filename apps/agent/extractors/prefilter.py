@@ -0,0 +1,134 @@
+"""
+Local pre-filter for profile extraction
+Decides whether a message is worth an LLM extraction call, and extracts
+trivially structured fields (email, GitHub, Twitter/X, LinkedIn) with regexes.
+
+Most chat messages ("lol", "ok", "what's your favourite robot") contain nothing
+about the visitor; those skip the LLM entirely. Messages with cues for names,
+locations, jobs, interests, education, or intent still go to the LLM.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+_EMAIL = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
+_GITHUB = re.compile(r"\bgithub\.com/([A-Za-z0-9](?:[A-Za-z0-9-]{0,38}))\b", re.I)
+_TWITTER_URL = re.compile(r"\b(?:twitter|x)\.com/([A-Za-z0-9_]{1,15})\b", re.I)
+_TWITTER_HANDLE = re.compile(
+    r"(?<![\w@])@([A-Za-z0-9_]{1,15})\b(?=[^.!?\n]{0,20}\b(?:on\s+)?(?:twitter|x\b))",
+    re.I,
+)
+_LINKEDIN = re.compile(r"\b(?:www\.)?linkedin\.com/in/([A-Za-z0-9_-]+)", re.I)
+
+# Words after "I'm" that aren't names ("I'm sure", "i'm good btw")
+_NOT_NAMES = (
+    r"sure|not|just|so|also|still|really|very|pretty|kinda|actually|only|always|never|"
+    r"good|fine|ok|okay|alright|well|great|cool|nice|done|back|here|new|in|on|out|up|down|it|"
+    r"glad|happy|sorry|excited|impressed|curious|confused|lost|stuck|bored|tired|busy|free|ready|late|"
+    r"interested|serious|kidding|joking|listening|looking|trying|going|doing|thinking|wondering|"
+    r"human|real|the|a|an|from|into|at|with|like|about|what|who"
+)
+
+# Cues that the message says something about the visitor that only the LLM
+# can structure. Matched case-insensitively unless noted.
+_CUES: Dict[str, re.Pattern] = {
+    # "I'm Sarah" / "I am Sarah Chen": capitalized word after I'm (case-sensitive);
+    # lowercase "i'm dave btw" and "sarah here, ..." where the word can be a name
+    "name": re.compile(
+        r"\b(?:[Mm]y name(?:'s| is)|[Cc]all me|[Tt]his is [A-Z]|[Nn]ame'?s [A-Z]|"
+        rf"I(?:'?m| am) (?!(?i:{_NOT_NAMES})\b)[A-Z][a-z]+|"
+        rf"(?i:i(?:'?m| am)) (?!(?i:{_NOT_NAMES})\b)[a-z]{{2,}}(?=\s*(?:$|[,.!;]|(?i:btw|here|from|and)\b)))|"
+        rf"^\s*(?!(?i:{_NOT_NAMES}|i|im|me|anyone|someone|nobody)\b)[A-Za-z]{{2,}},? here\b"
+    ),
+    # Place names must be capitalized (case-sensitive), verbs may not be
+    "location": re.compile(
+        r"\b(?:(?i:i'?m from|i am from|based (?:in|out of)|live in|living in|moved to|timezone|time zone)|"
+        r"from [A-Z]|(?i:i'?m in|i am in) [A-Z]|in [A-Z][a-z]+)",
+    ),
+    "professional": re.compile(
+        r"\b(?:i work|working (?:at|for|as)|work (?:at|for|as)|my (?:job|role|company|startup|team)|"
+        r"(?:i'?m|i am) an? (?!(?:bit|little|lot|tad)\b)[a-z]+|"
+        r"i (?:run|teach|own|manage|lead|research|freelance|coach|study)\b|"
+        r"i do (?!(?:not|n't|think|know|agree|like|love|want|hope|mean|feel|remember|understand|that|this|it|so|too)\b)[a-z]+|"
+        r"co-?founder|years? of experience|my (?:website|portfolio|blog))",
+        re.I,
+    ),
+    # Employer or school: "at Stanford" (capitalized, case-sensitive)
+    "organization": re.compile(r"\bat [A-Z][A-Za-z]+"),
+    "education": re.compile(
+        r"\b(?:i study|studying|graduated|my degree|phd|master'?s|bachelor'?s|university|college)\b", re.I
+    ),
+    "interests": re.compile(
+        r"\b(?:interested in|i'?m into|i love|i enjoy|passionate about|i'?m (?:building|working on)|"
+        r"my (?:project|side project|hobby|hobbies)|i (?:build|code|use|play))\b",
+        re.I,
+    ),
+    "context": re.compile(
+        r"\b(?:found (?:you|your|this)|looking for|i'?m hiring|we'?re hiring|want to (?:chat|talk|discuss|collaborate)|"
+        r"reach me|contact me|email me|dm me|i speak|my (?:email|number|phone|handle))\b",
+        re.I,
+    ),
+    "age": re.compile(r"\b(?:i'?m|i am) \d{1,2}\b|\b\d{1,2} years? old\b", re.I),
+}
+
+# URLs other than the social profiles we parse deterministically
+_OTHER_URL = re.compile(
+    r"\b(?:https?://|www\.)\S+|\b[a-z0-9-]+\.(?:com|io|dev|ai|co|org|net|me|app)\b(?!/in/)",
+    re.I,
+)
+_SOCIAL_DOMAINS = re.compile(r"(?:github|twitter|x|linkedin)\.com", re.I)
+
+
+@dataclass
+class PrefilterResult:
+    """Outcome of the local pre-filter for one message"""
+
+    needs_llm: bool
+    fields: Dict = field(default_factory=dict)  # deterministic extractions
+    cues: List[str] = field(default_factory=list)  # why the LLM is needed
+
+
+def extract_structured_fields(message: str) -> Dict:
+    """Extract email, GitHub, Twitter/X and LinkedIn deterministically"""
+
+    socials: Dict[str, str] = {}
+    email = _EMAIL.search(message)
+    if email:
+        socials["email"] = email.group(0).lower()
+    github = _GITHUB.search(message)
+    if github:
+        socials["github"] = github.group(1)
+    twitter = _TWITTER_URL.search(message) or _TWITTER_HANDLE.search(message)
+    if twitter and twitter.group(1).lower() not in ("home", "intent", "share", "i"):
+        socials["twitter"] = "@" + twitter.group(1)
+    linkedin = _LINKEDIN.search(message)
+    if linkedin:
+        socials["linkedin"] = "linkedin.com/in/" + linkedin.group(1)
+    return {"socials": socials} if socials else {}
+
+
+def prefilter_message(message: str) -> PrefilterResult:
+    """
+    Decide whether a message needs LLM extraction.
+
+    Args:
+        message: User's message text
+
+    Returns:
+        PrefilterResult with deterministic fields and whether to call the LLM
+    """
+
+    if not message or not message.strip():
+        return PrefilterResult(needs_llm=False)
+
+    fields = extract_structured_fields(message)
+    # Don't let emails/handles trip the name or URL cues
+    residual = _EMAIL.sub(" ", message)
+    residual = _LINKEDIN.sub(" ", _GITHUB.sub(" ", _TWITTER_URL.sub(" ", residual)))
+
+    cues = [name for name, pattern in _CUES.items() if pattern.search(residual)]
+    if any(not _SOCIAL_DOMAINS.search(m.group(0)) for m in _OTHER_URL.finditer(residual)):
+        cues.append("website")
+
+    return PrefilterResult(needs_llm=bool(cues), fields=fields, cues=cues)
@@ -7,8 +7,32 @@ Does NOT extract memories - mem0 handles that
 from typing import Dict
 import json
 import asyncio
+import os
+import time
 from openai import AsyncOpenAI
 
+from agent.metrics import (
+    EXTRACTION_MESSAGES,
+    EXTRACTION_PREFILTER,
+    EXTRACTION_QUEUE_SECONDS,
+    EXTRACTION_SECONDS,
+)
+from agent.usage import SOURCE_EXTRACTION, get_usage_tracker, usage_from_response
+from extractors.prefilter import prefilter_message
+
+EXTRACTION_MODEL = "gpt-4o-mini"  # Fast and cheap
+
+# Skip the LLM for messages with nothing to extract (see extractors/prefilter.py)
+EXTRACTION_PREFILTER_ENABLED = os.environ.get(
+    "EXTRACTION_PREFILTER", "true"
+).strip().lower() not in ("0", "false", "no")
+
+# Background extraction pipeline (AsyncProfileUpdater)
+EXTRACTION_WORKERS = int(os.environ.get("EXTRACTION_WORKERS", "4"))
+EXTRACTION_MAX_PENDING = int(os.environ.get("EXTRACTION_MAX_PENDING", "500"))
+EXTRACTION_DEBOUNCE_SECONDS = float(os.environ.get("EXTRACTION_DEBOUNCE_SECONDS", "2"))
+EXTRACTION_MAX_BATCH_CHARS = int(os.environ.get("EXTRACTION_MAX_BATCH_CHARS", "4000"))
+
 
 class SimpleProfileExtractor:
     """Extract ONLY structured profile fields from user messages"""
@@ -138,12 +162,16 @@ IMPORTANT:
     def __init__(self, openai_client: AsyncOpenAI):
         self.client = openai_client
     
-    async def extract_from_message(self, user_message: str) -> Dict:
+    async def extract_from_message(self, user_message: str, profile_id: str = None) -> Dict:
         """
         Extract structured profile fields from a single user message.
         
+        Email, GitHub, Twitter/X and LinkedIn are parsed locally; the LLM is
+        only called when the pre-filter finds cues for other fields.
+        
         Args:
             user_message: User's message text
+            profile_id: Optional profile UUID the LLM usage is charged to
             
         Returns:
             Dict with profile field updates (empty if nothing found)
@@ -152,9 +180,15 @@ IMPORTANT:
         if not user_message or not user_message.strip():
             return {}
         
+        gate = prefilter_message(user_message) if EXTRACTION_PREFILTER_ENABLED else None
+        if gate is not None and not gate.needs_llm:
+            EXTRACTION_PREFILTER.inc("skipped")
+            return gate.fields
+        EXTRACTION_PREFILTER.inc("llm")
+        
         try:
             response = await self.client.chat.completions.create(
-                model="gpt-4o-mini",  # Fast and cheap
+                model=EXTRACTION_MODEL,
                 messages=[{
                     "role": "user",
                     "content": self.PROFILE_EXTRACTION_PROMPT.format(
@@ -165,14 +199,28 @@ IMPORTANT:
                 response_format={"type": "json_object"}
             )
             
+            usage = usage_from_response(response.usage, EXTRACTION_MODEL)
+            if usage is not None:
+                get_usage_tracker().record(
+                    usage,
+                    model=EXTRACTION_MODEL,
+                    source=SOURCE_EXTRACTION,
+                    profile_id=profile_id,
+                )
+            
             extracted = json.loads(response.choices[0].message.content)
             
             # Clean up - remove null/empty values
-            return self._clean_data(extracted)
+            cleaned = self._clean_data(extracted)
+            
+            # Deterministic socials win over the LLM's reading of them
+            if gate is not None and gate.fields:
+                cleaned.setdefault("socials", {}).update(gate.fields["socials"])
+            return cleaned
         
         except Exception as e:
             print(f"Profile extraction error: {e}")
-            return {}
+            return gate.fields if gate is not None else {}
     
     def _clean_data(self, data: Dict) -> Dict:
         """Remove null, empty strings, empty arrays, empty objects"""
@@ -201,16 +249,57 @@ IMPORTANT:
         return cleaned
 
 
+class _PendingExtraction:
+    """Messages from one profile waiting for a single extraction call."""
+
+    __slots__ = ("profile_id", "messages", "chars", "first_at", "handle", "queued")
+
+    def __init__(self, profile_id: str, message: str):
+        self.profile_id = profile_id
+        self.messages = [message]
+        self.chars = len(message)
+        self.first_at = time.monotonic()
+        self.handle = None  # debounce timer
+        self.queued = False
+
+
 class AsyncProfileUpdater:
     """
-    Async wrapper for profile updates
-    Ensures profile updates don't block the response
+    Background profile updates through a bounded queue and fixed worker pool.
+
+    Messages from the same profile that arrive within the debounce window (or
+    while the profile is still waiting for a worker) are coalesced into one
+    extraction call, up to max_batch_chars of message text; messages that
+    would overflow the batch are dropped (and counted as dropped). When
+    max_pending profiles are already waiting, messages from new profiles are
+    dropped rather than piling up LLM calls. drain() flushes everything still
+    waiting on shutdown.
     """
     
-    def __init__(self, openai_client: AsyncOpenAI, db):
+    def __init__(
+        self,
+        openai_client: AsyncOpenAI,
+        db,
+        workers: int = EXTRACTION_WORKERS,
+        max_pending: int = EXTRACTION_MAX_PENDING,
+        debounce_seconds: float = EXTRACTION_DEBOUNCE_SECONDS,
+        max_batch_chars: int = EXTRACTION_MAX_BATCH_CHARS,
+    ):
         self.extractor = SimpleProfileExtractor(openai_client)
         self.db = db
-        self._tasks = set()  # Track tasks to prevent GC
+        self._num_workers = workers
+        self._max_pending = max_pending
+        self._debounce = debounce_seconds
+        self._max_batch_chars = max_batch_chars
+        self._pending: Dict[str, _PendingExtraction] = {}
+        self._queue = None  # asyncio.Queue of profile keys, created in the running loop
+        self._workers = []
+        self._closing = False
+    
+    @property
+    def depth(self) -> int:
+        """Profiles waiting for extraction (debouncing or queued)."""
+        return len(self._pending)
     
     def update_profile_in_background(
         self,
@@ -218,21 +307,97 @@ class AsyncProfileUpdater:
         user_message: str
     ) -> None:
         """
-        Fire-and-forget profile update.
-        Returns immediately, extraction happens in background.
+        Queue a message for profile extraction. Returns immediately.
         
         Args:
             profile_id: Profile UUID to update
             user_message: User's message to extract from
         """
         
-        task = asyncio.create_task(
-            self._extract_and_update(profile_id, user_message)
+        if not user_message or not user_message.strip():
+            return
+        if self._closing:
+            EXTRACTION_MESSAGES.inc("dropped")
+            return
+        self._ensure_workers()
+        
+        key = str(profile_id)
+        pending = self._pending.get(key)
+        if pending is not None:
+            if pending.chars + len(user_message) > self._max_batch_chars:
+                EXTRACTION_MESSAGES.inc("dropped")
+                print(f"✗ Profile extraction batch full for {key}; dropped a {len(user_message)}-char message")
+                return
+            pending.messages.append(user_message)
+            pending.chars += len(user_message)
+            EXTRACTION_MESSAGES.inc("coalesced")
+            return
+        
+        if len(self._pending) >= self._max_pending:
+            EXTRACTION_MESSAGES.inc("dropped")
+            return
+        
+        pending = _PendingExtraction(profile_id, user_message)
+        self._pending[key] = pending
+        pending.handle = asyncio.get_running_loop().call_later(
+            self._debounce, self._enqueue, key
         )
+        EXTRACTION_MESSAGES.inc("queued")
+    
+    def _ensure_workers(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(self._num_workers)
+        ]
+    
+    def _enqueue(self, key: str) -> None:
+        pending = self._pending.get(key)
+        if pending is not None and not pending.queued:
+            pending.queued = True
+            self._queue.put_nowait(key)
+    
+    async def _worker(self) -> None:
+        while True:
+            key = await self._queue.get()
+            try:
+                pending = self._pending.pop(key, None)
+                if pending is None:
+                    continue
+                start = time.monotonic()
+                EXTRACTION_QUEUE_SECONDS.observe(start - pending.first_at)
+                await self._extract_and_update(
+                    pending.profile_id, "\n".join(pending.messages)
+                )
+                EXTRACTION_SECONDS.observe(time.monotonic() - start)
+            finally:
+                self._queue.task_done()
+    
+    async def drain(self, timeout: float = 10.0) -> None:
+        """Stop accepting messages, run everything still waiting, stop workers."""
+        
+        self._closing = True
+        if not self._workers:
+            return
+        
+        for key, pending in list(self._pending.items()):
+            if pending.handle is not None:
+                pending.handle.cancel()
+            self._enqueue(key)
+        
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            dropped = sum(len(p.messages) for p in self._pending.values())
+            EXTRACTION_MESSAGES.inc("dropped", amount=dropped)
+            print(f"✗ Profile extraction drain timed out; dropped {dropped} messages")
         
-        # Keep reference to prevent GC
-        self._tasks.add(task)
-        task.add_done_callback(self._tasks.discard)
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
     
     async def _extract_and_update(
         self,
@@ -243,16 +408,19 @@ class AsyncProfileUpdater:
         
         try:
             # Extract structured fields
-            updates = await self.extractor.extract_from_message(user_message)
+            updates = await self.extractor.extract_from_message(user_message, profile_id)
             
             if not updates:
                 return  # Nothing to update
             
-            # Update profile (merge with existing data)
+            # Update profile (deep merge; skipped if nothing changed)
             # update_profile_data already handles name update
-            await self.db.update_profile_data(profile_id, updates)
+            written = await self.db.update_profile_data(profile_id, updates)
             
-            print(f"✓ Profile updated: {profile_id} - {list(updates.keys())}")
+            if written:
+                print(f"✓ Profile updated: {profile_id} - {list(updates.keys())}")
+            else:
+                print(f"= Profile unchanged: {profile_id}")
         
         except Exception as e:
             # Log but don't crash - profile updates shouldn't break chat
@@ -281,7 +449,7 @@ async def extract_and_update_profile(
     extractor = SimpleProfileExtractor(openai_client)
     
     try:
-        updates = await extractor.extract_from_message(user_message)
+        updates = await extractor.extract_from_message(user_message, profile_id)
         
         if updates:
             # update_profile_data already handles name update
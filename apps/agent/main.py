@@ -3,26 +3,58 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
-import time
 import uuid
+from contextlib import aclosing
 from pathlib import Path
 from typing import Any
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from openai import AsyncOpenAI
 
-from agent.config import load_env_from_ssm
-from agent.memory_layer import add_memory, search_memory
-from agent.rate_limit import get_limiter
+from agent.budget import BudgetDecision, get_budgets
+from agent.config import get_admin_api_token, load_env_from_ssm
+from agent.deadline import DEADLINE_CONTEXT_SECONDS, Deadline
+from agent.embeddings import get_embedding_cache, init_embedding_cache
+from agent.memory_layer import (
+    MEMORY_BACKEND,
+    add_memory,
+    close_memory,
+    init_memory,
+    memory_cache_stats,
+    memory_status,
+    search_memory,
+)
+from agent.metrics import (
+    BUDGET_TIER_REQUESTS,
+    BUDGET_TOKENS_CHARGED,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    RATE_LIMIT_REJECTIONS,
+    get_metrics,
+)
+from agent.rate_limit import ROUTE_COSTS, TOOL_CALL_COST, get_limiter
+from agent.rate_limit_backends import RATE_LIMIT_SYNC_SECONDS, RateLimitSync, create_backend
+from agent.response_cache import get_response_cache, replay
+from agent.routing import get_router
 from agent.runner import run_agent
+from agent.sse import SSEWriter, pump_frames, watch_disconnect
+from agent.tracing import get_tracer
+from agent.usage import USAGE_FLUSH_INTERVAL_SECONDS, Usage, flush_usage, get_usage_tracker
 from db.postgres import PostgresDB
+from db.maintenance import MAINTENANCE_INTERVAL_SECONDS, maintenance_loop, pool_busy
 from extractors.simple_profile_extractor import AsyncProfileUpdater
+from tools.profile_snapshot import (
+    PROFILE_SNAPSHOT_PATH,
+    PROFILE_SNAPSHOT_REBUILD_SECONDS,
+    build_snapshot,
+    profile_version,
+)
 
 # Load .env file
 _env = Path(__file__).resolve().parent / ".env"
@@ -31,7 +63,6 @@ if _env.exists():
 
 # Get loggers
 logger = logging.getLogger("agent.main")
-perf_logger = logging.getLogger("agent.performance")
 
 # Show INFO logs for visibility
 logging.basicConfig(
@@ -62,19 +93,94 @@ app.add_middleware(
 db = PostgresDB()
 openai_client = AsyncOpenAI()
 profile_updater = AsyncProfileUpdater(openai_client, db)
+get_metrics().gauge_fn(
+    "agent_extraction_queue_depth",
+    "Profiles waiting for background profile extraction.",
+    lambda: profile_updater.depth,
+)
+get_metrics().gauge_fn(
+    "agent_rate_limit_active_keys",
+    "Rate-limit buckets currently tracked.",
+    lambda: len(get_limiter()),
+)
+_usage_flush_task: asyncio.Task | None = None
+_rate_limit_syncs: list[RateLimitSync] = []
+_rate_limit_sync_task: asyncio.Task | None = None
+_maintenance_task: asyncio.Task | None = None
+_profile_snapshot_task: asyncio.Task | None = None
+
+
+async def _usage_flush_loop() -> None:
+    """Periodically write per-profile LLM usage deltas to Postgres."""
+    while True:
+        await asyncio.sleep(USAGE_FLUSH_INTERVAL_SECONDS)
+        await flush_usage(db)
+
+
+async def _rate_limit_sync_loop() -> None:
+    """Periodically share local rate-limit and budget consumption across workers."""
+    while True:
+        await asyncio.sleep(RATE_LIMIT_SYNC_SECONDS)
+        for sync in _rate_limit_syncs:
+            await sync.sync_once()
+
+
+async def _profile_snapshot_loop() -> None:
+    """Build the owner profile snapshot now, then rebuild it to pick up profile edits."""
+    while True:
+        try:
+            version = await asyncio.to_thread(build_snapshot)
+            if version is not None:
+                logger.info(f"Profile snapshot v{version} written to {PROFILE_SNAPSHOT_PATH}")
+        except Exception as e:
+            logger.warning(f"Profile snapshot build failed; keeping the current snapshot: {e}")
+        if PROFILE_SNAPSHOT_REBUILD_SECONDS <= 0:
+            return
+        await asyncio.sleep(PROFILE_SNAPSHOT_REBUILD_SECONDS)
 
 
 @app.on_event("startup")
 async def startup():
     """Initialize database connection pool"""
+    global _usage_flush_task, _rate_limit_sync_task, _maintenance_task, _profile_snapshot_task
     await db.connect()
     logger.info("Database connection pool initialized")
+    init_embedding_cache(openai_client)
+    init_memory(db, openai_client)
+    _usage_flush_task = asyncio.create_task(_usage_flush_loop())
+    backend = create_backend(db)
+    if backend:
+        for limiter in [get_limiter(), *get_budgets().limiters]:
+            _rate_limit_syncs.append(RateLimitSync(limiter, backend))
+        _rate_limit_sync_task = asyncio.create_task(_rate_limit_sync_loop())
+    if MAINTENANCE_INTERVAL_SECONDS > 0:
+        # Own one-connection pool; batches also wait while the chat pool is saturated
+        _maintenance_task = asyncio.create_task(maintenance_loop(busy=pool_busy(db)))
+    if PROFILE_SNAPSHOT_PATH:
+        _profile_snapshot_task = asyncio.create_task(_profile_snapshot_loop())
+    get_metrics().start_multiprocess_writer()
 
 
 @app.on_event("shutdown")
 async def shutdown():
-    """Close database connection pool"""
+    """Drain profile extraction, flush pending usage, and close the database pool"""
+    await profile_updater.drain()
+    await close_memory()
+    if _usage_flush_task:
+        _usage_flush_task.cancel()
+    await flush_usage(db)
+    if _rate_limit_sync_task:
+        _rate_limit_sync_task.cancel()
+    if _maintenance_task:
+        _maintenance_task.cancel()
+    if _profile_snapshot_task:
+        _profile_snapshot_task.cancel()
+    for sync in _rate_limit_syncs:
+        await sync.sync_once()
+    if _rate_limit_syncs:
+        await _rate_limit_syncs[0].backend.close()
     await db.close()
+    get_tracer().shutdown()
     logger.info("Database connection pool closed")
 
 
@@ -117,52 +223,89 @@ def _client_id(request: Request) -> str:
 @app.get("/health")
 async def health() -> dict[str, Any]:
     """Health check for load balancers and Docker."""
-    from agent.memory_layer import _get_memory, _is_enabled, _MEMORY_INIT_FAILED
-    
     response: dict[str, Any] = {
         "status": "ok",
         "services": {}
     }
     
-    # Check mem0 status
-    mem0_enabled = _is_enabled()
-    mem0_initialized = _get_memory() is not None
-    
-    if not mem0_enabled:
-        response["services"]["mem0"] = {
-            "status": "disabled",
-            "message": "Memory is disabled via MEMORY_ENABLED=false"
-        }
-    elif _MEMORY_INIT_FAILED:
-        response["services"]["mem0"] = {
-            "status": "failed",
-            "message": "Mem0 initialization failed (check logs for details)"
-        }
-    elif mem0_initialized:
-        response["services"]["mem0"] = {
-            "status": "operational",
-            "message": "Mem0 memory layer is initialized and ready"
-        }
-    else:
-        response["services"]["mem0"] = {
-            "status": "unknown",
-            "message": "Mem0 status could not be determined"
-        }
+    # Memory status (key kept as "mem0" for the dashboard; backend names the implementation)
+    response["services"]["mem0"] = {
+        **memory_status(),
+        "backend": MEMORY_BACKEND,
+        "cache": memory_cache_stats(),
+        "embeddings": get_embedding_cache().stats(),
+    }
+    response["services"]["response_cache"] = get_response_cache().stats()
+    response["services"]["routing"] = get_router().stats()
     
     return response
 
 
-def _ensure_rate_limit(request: Request, context: str) -> None:
-    """Raise 429 if over limit for (client_id, context)."""
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    """Prometheus metrics (this worker, or all workers with PROMETHEUS_MULTIPROC_DIR)."""
+    return PlainTextResponse(get_metrics().render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/admin/usage")
+async def admin_usage(http_request: Request, request_id: str | None = None) -> dict[str, Any]:
+    """LLM token usage and estimated cost aggregates (this worker, since start).
+
+    Requires ADMIN_API_TOKEN as a bearer token; returns 404 when no token is configured.
+    Pass request_id to get the totals for a single request.
+    """
+    token = get_admin_api_token()
+    if not token:
+        raise HTTPException(status_code=404, detail="Not found")
+    if http_request.headers.get("authorization", "") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    tracker = get_usage_tracker()
+    if request_id:
+        usage = tracker.get_request(request_id)
+        if usage is None:
+            raise HTTPException(status_code=404, detail="Unknown request_id")
+        return {"request_id": request_id, **usage.to_dict()}
+    return tracker.snapshot()
+
+
+def _ensure_rate_limit(request: Request, context: str, route: str) -> None:
+    """Raise 429 if (client_id, context) cannot afford the route's cost."""
     limiter = get_limiter()
     client_id = _client_id(request)
-    if not limiter.is_allowed(client_id, context):
+    cost = ROUTE_COSTS.get(route, 1.0)
+    if not limiter.is_allowed(client_id, context, cost):
+        RATE_LIMIT_REJECTIONS.inc(context)
+        retry_after = limiter.retry_after(client_id, context, cost)
         raise HTTPException(
             status_code=429,
             detail="Rate limit exceeded. Try again later.",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
         )
 
 
+def _charge_tool_calls(request: Request, context: str, tools: list[str]) -> None:
+    """Charge tools used by the agent against the caller's rate-limit bucket."""
+    if tools:
+        get_limiter().charge(_client_id(request), context, TOOL_CALL_COST * len(tools))
+
+
+def _check_budget(request: Request, profile_id: Any, context: str) -> BudgetDecision:
+    """Pick the service tier from the caller's remaining token budget."""
+    decision = get_budgets().check(_client_id(request), profile_id, context)
+    BUDGET_TIER_REQUESTS.inc(decision.tier)
+    span = get_tracer().current_span()
+    if span is not None:
+        span.set_attributes(budget_tier=decision.tier, budget_remaining=round(decision.remaining_fraction, 3))
+    return decision
+
+
+def _charge_budget(request: Request, profile_id: Any, context: str, usage: dict[str, Any]) -> None:
+    """Charge the request's tokens and tool calls to the caller's budgets."""
+    charged = get_budgets().charge(_client_id(request), profile_id, context, usage)
+    if charged:
+        BUDGET_TOKENS_CHARGED.inc(amount=charged)
+
+
 def _last_user_content(messages: list[dict[str, Any]]) -> str:
     """Extract last user message content as string for memory search."""
     for m in reversed(messages):
@@ -252,104 +395,178 @@ def _format_visitor_context(profile: dict[str, Any]) -> str:
     return "\n".join(parts) if parts else ""
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(http_request: Request, body: ChatRequest) -> ChatResponse:
-    """Non-streaming chat: run agent and return the final message."""
-    start_time = time.time()
-    request_id = str(uuid.uuid4())
-    perf_logger.info(f"[{request_id}] Request started")
-    
-    _ensure_rate_limit(http_request, body.context)
-    messages = [m.model_dump() for m in body.messages]
-    
+async def _prepare_chat(
+    body: ChatRequest,
+    messages: list[dict[str, Any]],
+    request_id: str,
+    deadline: Deadline,
+) -> tuple[Any, dict[str, Any] | None, str, str | None]:
+    """Profile lookup and memory search shared by /chat and /chat/stream.
+
+    Runs under the caller's request span. Each lookup gets at most
+    DEADLINE_CONTEXT_SECONDS of the request deadline; one that runs over is
+    dropped and the agent answers without it. Returns (profile_id, profile, memory, visitor_context).
+    """
+    tracer = get_tracer()
+
     # Get or create visitor profile (multi-signal matching)
     profile = None
     profile_id = None
     if body.session_id:
-        try:
-            profile = await db.get_or_create_visitor_profile(
-                session_id=body.session_id,
-                ip=body.ip,
-                fingerprint=body.fingerprint
-            )
-            profile_id = profile["id"]
-            logger.info(f"[{request_id}] Profile: {profile_id} (status={profile.get('status')})")
-        except Exception as e:
-            logger.warning(f"[{request_id}] Profile creation failed: {e}")
-    
-    # Memory search timing (use profile_id for scoping)
+        with tracer.span("profile.lookup", request_id=request_id) as span:
+            try:
+                async with deadline.scope(DEADLINE_CONTEXT_SECONDS):
+                    profile = await db.get_or_create_visitor_profile(
+                        session_id=body.session_id,
+                        ip=body.ip,
+                        fingerprint=body.fingerprint
+                    )
+                profile_id = profile["id"]
+                span.set_attributes(profile_id=str(profile_id), status=profile.get("status"))
+                logger.info(f"[{request_id}] Profile: {profile_id} (status={profile.get('status')})")
+            except TimeoutError:
+                deadline.degrade("profile_lookup")
+                span.set_attribute("timeout", True)
+                logger.warning(f"[{request_id}] Profile lookup timed out; continuing without a profile")
+            except Exception as e:
+                span.record_error(e)
+                logger.warning(f"[{request_id}] Profile creation failed: {e}")
+
+    get_usage_tracker().begin_request(
+        request_id,
+        session_id=body.session_id,
+        profile_id=profile_id,
+        mode=body.mode,
+        skill=body.skill,
+        context=body.context,
+    )
+
+    # Memory search (use profile_id for scoping)
     memory = ""
     if profile_id:
-        mem_start = time.time()
         query = _last_user_content(messages) or "recent context"
-        memory = search_memory(query, profile_id)
-        mem_time = time.time() - mem_start
-        perf_logger.info(f"[{request_id}] Memory search: {mem_time:.3f}s")
-    
+        try:
+            async with deadline.scope(DEADLINE_CONTEXT_SECONDS):
+                memory = await search_memory(query, profile_id)
+        except TimeoutError:
+            deadline.degrade("memory_search")
+            logger.warning(f"[{request_id}] Memory search timed out; continuing without memory")
+
     # Format visitor profile context
     visitor_context = _format_visitor_context(profile) if profile else None
-    
-    try:
-        # Agent execution timing
-        agent_start = time.time()
-        result = await run_agent(
-            messages,
-            context=body.context,
-            skill=body.skill,
-            memory=memory or None,
-            visitor_context=visitor_context,
-            stream=False,
-            request_id=request_id,
-            mode=body.mode,
-        )
-        agent_time = time.time() - agent_start
-        perf_logger.info(f"[{request_id}] Agent execution: {agent_time:.3f}s")
-        
-        # Memory storage and profile extraction (async, non-blocking)
-        if profile_id:
-            mem_save_start = time.time()
-            last_user = next((m for m in reversed(messages) if m.get("role") == "user"), None)
-            if last_user:
-                # Store in mem0
-                add_memory(
-                    [last_user, {"role": "assistant", "content": result.get("message", "")}],
-                    profile_id,
-                )
-                # Extract profile data in background (fire-and-forget)
-                user_message = last_user.get("content", "")
-                if isinstance(user_message, list):
-                    user_message = next((p.get("text", "") for p in user_message if isinstance(p, dict) and p.get("type") == "text"), "")
-                profile_updater.update_profile_in_background(profile_id, user_message)
-            mem_save_time = time.time() - mem_save_start
-            perf_logger.info(f"[{request_id}] Memory save: {mem_save_time:.3f}s")
-        
-        total_time = time.time() - start_time
-        perf_logger.info(f"[{request_id}] TOTAL: {total_time:.3f}s")
-        
-        return ChatResponse(
-            message=result.get("message", ""),
-            sources=result.get("sources", []),
-        )
-    except HTTPException:
-        raise
-    except Exception as e:
-        total_time = time.time() - start_time
-        perf_logger.error(f"[{request_id}] ERROR after {total_time:.3f}s: {e}")
-        raise HTTPException(status_code=500, detail=str(e)) from e
+    return profile_id, profile, memory, visitor_context
+
+
+async def _cached_response(
+    body: ChatRequest, messages: list[dict[str, Any]], memory: str, profile: dict[str, Any] | None
+) -> tuple[str | None, Any]:
+    """Response cache lookup for first public questions: (question or None, cached entry or None)."""
+    cache = get_response_cache()
+    question = cache.eligible(body.context, messages, memory, profile)
+    if question is None:
+        return None, None
+    cached = await cache.get(body.mode, body.skill, body.context, question)
+    span = get_tracer().current_span()
+    if span is not None:
+        span.set_attribute("response_cache", "hit" if cached else "miss")
+    return question, cached
+
+
+async def _store_response(
+    body: ChatRequest,
+    question: str | None,
+    budget: BudgetDecision,
+    message: str,
+    sources: list[str],
+    version: int | None,
+    deadline: Deadline,
+) -> None:
+    """Cache a first-question answer produced by a full-quality run."""
+    if question is None or budget.fast_mode or budget.disabled_tools or deadline.degraded:
+        return
+    await get_response_cache().put(body.mode, body.skill, body.context, question, message, sources, version)
+
+
+def _save_turn(profile_id: Any, messages: list[dict[str, Any]], reply: str) -> None:
+    """Store the turn in memory and start background profile extraction."""
+    last_user = next((m for m in reversed(messages) if m.get("role") == "user"), None)
+    if not last_user:
+        return
+    # Store in memory (background)
+    add_memory([last_user, {"role": "assistant", "content": reply}], profile_id)
+    # Extract profile data in background (fire-and-forget)
+    user_message = last_user.get("content", "")
+    if isinstance(user_message, list):
+        user_message = next((p.get("text", "") for p in user_message if isinstance(p, dict) and p.get("type") == "text"), "")
+    profile_updater.update_profile_in_background(profile_id, user_message)
 
 
-# SSE event names (see agent.stream_events for payload shapes).
+@app.post("/chat", response_model=ChatResponse)
+async def chat(http_request: Request, body: ChatRequest) -> ChatResponse:
+    """Non-streaming chat: run agent and return the final message."""
+    request_id = str(uuid.uuid4())
+    deadline = Deadline()
+    with get_tracer().span(
+        "chat.request",
+        request_id=request_id, context=body.context, mode=body.mode, skill=body.skill, stream=False,
+    ) as request_span:
+        _ensure_rate_limit(http_request, body.context, "chat")
+        messages = [m.model_dump() for m in body.messages]
+        profile_id, profile, memory, visitor_context = await _prepare_chat(body, messages, request_id, deadline)
+        budget = _check_budget(http_request, profile_id, body.context)
+        question, cached = await _cached_response(body, messages, memory, profile)
+        if cached is not None:
+            if profile_id:
+                _save_turn(profile_id, messages, cached.message)
+            return ChatResponse(message=cached.message, sources=cached.sources)
+        version = profile_version()
+
+        try:
+            result = await run_agent(
+                messages,
+                context=body.context,
+                skill=body.skill,
+                memory=memory or None,
+                visitor_context=visitor_context,
+                stream=False,
+                request_id=request_id,
+                mode=body.mode,
+                fast_mode=budget.fast_mode,
+                disabled_tools=budget.disabled_tools,
+                deadline=deadline,
+            )
+            if deadline.degraded:
+                request_span.set_attribute("degraded", ",".join(deadline.degraded))
+
+            _charge_tool_calls(http_request, body.context, result.get("sources", []))
+            _charge_budget(http_request, profile_id, body.context, result.get("usage", {}))
+            await _store_response(
+                body, question, budget, result.get("message", ""), result.get("sources", []), version, deadline
+            )
+
+            # Memory storage and profile extraction (async, non-blocking)
+            if profile_id:
+                _save_turn(profile_id, messages, result.get("message", ""))
+
+            return ChatResponse(
+                message=result.get("message", ""),
+                sources=result.get("sources", []),
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"[{request_id}] chat error: {e}")
+            raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+# SSE event names (see agent.stream_events for payload shapes; message_delta
+# frames come from agent.sse).
 EV_STATUS = "status"
-EV_DELTA = "message_delta"
+EV_SOURCES = "sources"
 EV_DONE = "done"
 EV_ERROR = "error"
 
 
-def _sse_event(event: str, data: str) -> str:
-    """Format a single SSE event (event + data lines + blank line)."""
-    return f"event: {event}\ndata: {data}\n\n"
-
-
 @app.post("/chat/stream")
 async def chat_stream(http_request: Request, body: ChatRequest) -> StreamingResponse:
     """Streaming chat: SSE stream of status, message_delta, and done.
@@ -362,115 +579,129 @@ async def chat_stream(http_request: Request, body: ChatRequest) -> StreamingResp
       - done: { done: true }. Stream complete.
       - error: { error }. Stream failed.
     """
-    start_time = time.time()
     request_id = str(uuid.uuid4())
-    perf_logger.info(f"[{request_id}] Stream request started")
-    
-    _ensure_rate_limit(http_request, body.context)
-    messages = [m.model_dump() for m in body.messages]
-    
-    # Get or create visitor profile (multi-signal matching)
-    profile = None
-    profile_id = None
-    if body.session_id:
-        try:
-            profile = await db.get_or_create_visitor_profile(
-                session_id=body.session_id,
-                ip=body.ip,
-                fingerprint=body.fingerprint
-            )
-            profile_id = profile["id"]
-            logger.info(f"[{request_id}] Profile: {profile_id} (status={profile.get('status')})")
-        except Exception as e:
-            logger.warning(f"[{request_id}] Profile creation failed: {e}")
-    
-    # Memory search timing (use profile_id for scoping)
-    memory = ""
-    if profile_id:
-        mem_start = time.time()
-        query = _last_user_content(messages) or "recent context"
-        memory = search_memory(query, profile_id)
-        mem_time = time.time() - mem_start
-        perf_logger.info(f"[{request_id}] Memory search: {mem_time:.3f}s")
-    
-    # Format visitor profile context
-    visitor_context = _format_visitor_context(profile) if profile else None
-    
+    deadline = Deadline()
+    tracer = get_tracer()
+    request_span = tracer.start_span(
+        "chat.stream",
+        request_id=request_id, context=body.context, mode=body.mode, skill=body.skill, stream=True,
+    )
+    try:
+        with tracer.activate(request_span):
+            _ensure_rate_limit(http_request, body.context, "chat_stream")
+            messages = [m.model_dump() for m in body.messages]
+            profile_id, profile, memory, visitor_context = await _prepare_chat(body, messages, request_id, deadline)
+            budget = _check_budget(http_request, profile_id, body.context)
+            question, cached = await _cached_response(body, messages, memory, profile)
+            version = profile_version()
+    except BaseException as e:
+        request_span.record_error(e)
+        request_span.end()
+        raise
+
     _log = logging.getLogger("agent.main")
     _log.info("chat/stream request_id=%s messages=%s", request_id, len(messages))
 
     async def generate() -> Any:
-        accumulated = ""
-        first_token_time = None
+        reply: list[str] = []
         tokens_received = 0
+        sources: list[str] = []
+        # Last phase the visitor saw (thinking / tool_start / answer), for disconnect metrics
+        phase = "thinking"
+        writer = SSEWriter()
+        disconnected = asyncio.Event()
+        # Owned here, not read from the final events, so a cancelled stream is still charged
+        usage = Usage()
+        tools_used: set[str] = set()
+
+        def handle(item: Any) -> str:
+            """Frame(s) for one agent event (runs once per token; keep it lean)."""
+            nonlocal tokens_received, sources, phase
+            if not item or not isinstance(item, dict):
+                return ""
+            kind = item.get("type")
+            if kind == "delta":
+                delta = item.get("delta", "")
+                if not delta:
+                    return ""
+                if not tokens_received:
+                    request_span.set_attribute("ttft_s", round(request_span.duration_s, 3))
+                    phase = "answer"
+                reply.append(delta)
+                tokens_received += 1
+                return writer.delta(delta)
+            if kind == "status":
+                if not tokens_received:
+                    phase = item.get("phase", phase)
+                payload = {
+                    k: item[k]
+                    for k in ("phase", "subtitle", "tool", "timestamp")
+                    if k in item
+                }
+                return writer.event(EV_STATUS, payload)
+            if kind == "sources":
+                sources = item.get("tools", [])
+                return writer.event(EV_SOURCES, {"tools": sources})
+            return ""
+
+        # Stop paying for tokens (and tools) nobody will read once the visitor leaves
+        watcher = asyncio.create_task(watch_disconnect(http_request, disconnected))
         try:
-            agent_start = time.time()
-            stream = await run_agent(
-                messages,
-                context=body.context,
-                skill=body.skill,
-                memory=memory or None,
-                visitor_context=visitor_context,
-                stream=True,
-                request_id=request_id,
-                mode=body.mode,
-            )
-            async for item in stream:
-                if first_token_time is None and item.get("type") == "delta":
-                    first_token_time = time.time() - agent_start
-                    perf_logger.info(f"[{request_id}] Time to first token: {first_token_time:.3f}s")
-                if not item or not isinstance(item, dict):
-                    continue
-                kind = item.get("type")
-                if kind == "status":
-                    payload = {
-                        k: item[k]
-                        for k in ("phase", "subtitle", "tool", "timestamp")
-                        if k in item
-                    }
-                    yield _sse_event(EV_STATUS, json.dumps(payload))
-                elif kind == "delta":
-                    delta = item.get("delta", "")
-                    if delta:
-                        accumulated += delta
-                        tokens_received += 1
-                        yield _sse_event(EV_DELTA, json.dumps({"delta": delta}))
-                elif kind == "sources":
-                    yield _sse_event(
-                        "sources",
-                        json.dumps({"tools": item.get("tools", [])}),
+            if cached is not None:
+                stream = replay(cached)
+            else:
+                with tracer.activate(request_span):
+                    stream = await run_agent(
+                        messages,
+                        context=body.context,
+                        skill=body.skill,
+                        memory=memory or None,
+                        visitor_context=visitor_context,
+                        stream=True,
+                        request_id=request_id,
+                        mode=body.mode,
+                        fast_mode=budget.fast_mode,
+                        disabled_tools=budget.disabled_tools,
+                        deadline=deadline,
+                        usage=usage,
+                        tools_used=tools_used,
                     )
-            agent_time = time.time() - agent_start
-            perf_logger.info(f"[{request_id}] Agent streaming: {agent_time:.3f}s ({tokens_received} tokens)")
-            
+            async with aclosing(pump_frames(stream, handle, writer, cancel=disconnected)) as frames:
+                async for frame in frames:
+                    yield frame
+            if disconnected.is_set():
+                # Partial answer: not remembered, not cached, no done event
+                request_span.set_attribute("disconnected", phase)
+                _log.info("chat/stream client disconnected request_id=%s phase=%s deltas=%s",
+                          request_id, phase, tokens_received)
+                return
+            accumulated = "".join(reply)
+
             # Memory storage and profile extraction (async, non-blocking)
             if profile_id:
-                mem_save_start = time.time()
-                last_user = next((m for m in reversed(messages) if m.get("role") == "user"), None)
-                if last_user:
-                    # Store in mem0
-                    add_memory(
-                        [last_user, {"role": "assistant", "content": accumulated}],
-                        profile_id,
-                    )
-                    # Extract profile data in background (fire-and-forget)
-                    user_message = last_user.get("content", "")
-                    if isinstance(user_message, list):
-                        user_message = next((p.get("text", "") for p in user_message if isinstance(p, dict) and p.get("type") == "text"), "")
-                    profile_updater.update_profile_in_background(profile_id, user_message)
-                mem_save_time = time.time() - mem_save_start
-                perf_logger.info(f"[{request_id}] Memory save: {mem_save_time:.3f}s")
-            
-            total_time = time.time() - start_time
-            perf_logger.info(f"[{request_id}] TOTAL: {total_time:.3f}s")
-            
+                with tracer.activate(request_span):
+                    _save_turn(profile_id, messages, accumulated)
+            if cached is None:
+                await _store_response(body, question, budget, accumulated, sources, version, deadline)
+
             _log.info("chat/stream done request_id=%s", request_id)
-            yield _sse_event(EV_DONE, json.dumps({"done": True}))
+            yield writer.event(EV_DONE, {"done": True})
         except Exception as e:
-            total_time = time.time() - start_time
-            perf_logger.error(f"[{request_id}] ERROR after {total_time:.3f}s: {e}")
+            request_span.record_error(e)
             _log.exception("chat/stream error request_id=%s", request_id)
-            yield _sse_event(EV_ERROR, json.dumps({"error": str(e)}))
+            yield writer.event(EV_ERROR, {"error": str(e)})
+        except (asyncio.CancelledError, GeneratorExit):
+            # The server dropped the response (client gone) before the watcher noticed
+            request_span.set_attribute("disconnected", phase)
+            raise
+        finally:
+            watcher.cancel()
+            # Every exit (done, error, disconnect): the stream has unwound, so usage is final
+            _charge_tool_calls(http_request, body.context, sorted(tools_used))
+            _charge_budget(http_request, profile_id, body.context, usage.to_dict())
+            if deadline.degraded:
+                request_span.set_attribute("degraded", ",".join(deadline.degraded))
+            request_span.end(deltas=tokens_received, sse_events=writer.events)
 
     return StreamingResponse(
         generate(),
@@ -3,6 +3,7 @@
 Test script for profile info extraction and saving.
 
 Tests:
+0. Local pre-filter skip rate and recall (no API calls)
 1. Profile extraction from user message
 2. Profile data saving to database
 3. Multi-signal profile matching (session_id, fingerprint, IP)
@@ -20,10 +21,84 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from openai import AsyncOpenAI
 from db.postgres import PostgresDB
+from extractors.prefilter import prefilter_message
 from extractors.simple_profile_extractor import SimpleProfileExtractor, AsyncProfileUpdater
 from db.profile_management import handle_user_identification
 
 
+# Messages and the top-level profile sections they should produce
+TEST_MESSAGES = [
+    {
+        "message": "Hi! I'm Sarah Chen from San Francisco. I work as a product manager at Google.",
+        "expected": ["identity", "location", "professional"]
+    },
+    {
+        "message": "My name is John, I'm 32 years old, and I'm interested in AI and machine learning.",
+        "expected": ["identity", "interests"]
+    },
+    {
+        "message": "You can reach me at @sarahchen on Twitter or linkedin.com/in/sarah-chen",
+        "expected": ["socials"]
+    },
+    {
+        "message": "my github is github.com/alexdev, email is alex@example.com",
+        "expected": ["socials"]
+    },
+    {
+        "message": "I'm a backend engineer based in Berlin, mostly building robotics infra",
+        "expected": ["location", "professional", "interests"]
+    },
+    {"message": "I am a nurse in Sydney", "expected": ["location", "professional"]},
+    {"message": "I teach math at a high school", "expected": ["professional"]},
+    {"message": "I do ML research at Stanford", "expected": ["professional", "education"]},
+    {"message": "sarah here, I run a bakery in Paris", "expected": ["identity", "location", "professional"]},
+    {"message": "i'm dave btw", "expected": ["identity"]},
+    {"message": "I'm Sure that works", "expected": []},
+    {
+        "message": "Just browsing your portfolio, looks great!",
+        "expected": []  # Nothing to extract
+    },
+    {"message": "lol", "expected": []},
+    {"message": "ok", "expected": []},
+    {"message": "what's your favourite robot", "expected": []},
+    {"message": "How did you get into robotics?", "expected": []},
+]
+
+
+def test_prefilter():
+    """Test 0: Local pre-filter skip rate and recall"""
+    print("\n" + "="*80)
+    print("TEST 0: Extraction Pre-filter")
+    print("="*80)
+    
+    skipped = 0
+    recalled = 0
+    with_facts = 0
+    for test in TEST_MESSAGES:
+        result = prefilter_message(test["message"])
+        if not result.needs_llm:
+            skipped += 1
+        if test["expected"]:
+            with_facts += 1
+            # Recalled if sent to the LLM or fully covered by local extraction
+            covered = all(section in result.fields for section in test["expected"])
+            if result.needs_llm or covered:
+                recalled += 1
+            else:
+                print(f"❌ Missed: {test['message']}")
+        elif result.needs_llm:
+            print(f"⚠️  Unneeded LLM call ({result.cues}): {test['message']}")
+        
+        decision = f"llm {result.cues}" if result.needs_llm else "skip"
+        print(f"{decision:<40} local={result.fields} | {test['message']}")
+    
+    skip_rate = skipped / len(TEST_MESSAGES)
+    recall = recalled / with_facts if with_facts else 1.0
+    print(f"\nSkip rate: {skip_rate:.0%} ({skipped}/{len(TEST_MESSAGES)} messages without an LLM call)")
+    print(f"Recall: {recall:.0%} ({recalled}/{with_facts} messages with facts kept)")
+    return recall == 1.0
+
+
 async def test_extraction():
     """Test 1: Profile extraction from messages"""
     print("\n" + "="*80)
@@ -33,27 +108,7 @@ async def test_extraction():
     openai_client = AsyncOpenAI()
     extractor = SimpleProfileExtractor(openai_client)
     
-    # Test cases
-    test_messages = [
-        {
-            "message": "Hi! I'm Sarah Chen from San Francisco. I work as a product manager at Google.",
-            "expected": ["identity", "location", "professional"]
-        },
-        {
-            "message": "My name is John, I'm 32 years old, and I'm interested in AI and machine learning.",
-            "expected": ["identity", "interests"]
-        },
-        {
-            "message": "You can reach me at @sarahchen on Twitter or linkedin.com/in/sarah-chen",
-            "expected": ["socials"]
-        },
-        {
-            "message": "Just browsing your portfolio, looks great!",
-            "expected": []  # Nothing to extract
-        }
-    ]
-    
-    for i, test in enumerate(test_messages, 1):
+    for i, test in enumerate(TEST_MESSAGES, 1):
         print(f"\n--- Test Case {i} ---")
         print(f"Message: {test['message']}")
         
@@ -112,12 +167,12 @@ async def test_database_save():
         print(f"\n--- Extracting from message ---")
         print(f"Message: {test_message}")
         
-        # Use the background updater (fire-and-forget)
+        # Use the background updater (queued, debounced)
         updater.update_profile_in_background(profile_id, test_message)
         
-        # Wait a bit for async extraction to complete
+        # Flush the queue and wait for extraction to complete
         print("\n⏳ Waiting for background extraction...")
-        await asyncio.sleep(3)
+        await updater.drain()
         
         # Check if profile was updated
         updated_profile = await db.get_profile(profile_id)
@@ -306,6 +361,9 @@ async def main():
     print("PROFILE EXTRACTION & SAVING TEST SUITE")
     print("="*80)
     
+    # Pre-filter runs locally, no API key needed
+    prefilter_ok = test_prefilter()
+    
     # Check for required env vars
     if not os.getenv("OPENAI_API_KEY"):
         print("\n❌ ERROR: OPENAI_API_KEY not set")
@@ -320,7 +378,7 @@ async def main():
         print(f"⚠️  DATABASE_URL not set - will skip database tests")
     
     # Run tests
-    results = {}
+    results = {'prefilter': prefilter_ok}
     
     try:
         results['extraction'] = await test_extraction()
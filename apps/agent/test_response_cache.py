@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Test script for the response cache (agent/response_cache.py).
+
+Runs offline: the agent, profile lookup and memory search are replaced with
+in-process fakes, so no database or OpenAI key is needed.
+
+Tests:
+1. Eligibility (first public question, memory, visitor profile)
+2. Fresh anonymous visitor with a session_id hits on a repeated first question
+3. Invalidation when the owner profile snapshot changes
+4. Replay of a cached answer as stream events
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Add agent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+SNAPSHOT_PATH = os.path.join(tempfile.mkdtemp(), "profile.snap")
+# Before importing main: cache settings are read at import time
+os.environ.update(
+    PROFILE_SNAPSHOT_PATH=SNAPSHOT_PATH,
+    PROFILE_SNAPSHOT_CHECK_SECONDS="0",
+    RESPONSE_CACHE_ENABLED="true",
+    RESPONSE_CACHE_SIMILARITY="0",
+    RESPONSE_CACHE_REPLAY_DELAY_MS="0",
+)
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from tools.profile_snapshot import write_snapshot
+
+write_snapshot({"bio": "robotics founder in Melbourne"}, SNAPSHOT_PATH)
+
+from fastapi.testclient import TestClient
+
+import main
+from agent.response_cache import CachedResponse, ResponseCache, blank_profile, replay
+
+ANSWER = ["hey, ", "i'm ", "bill"]
+_ids = itertools.count(1)
+agent_runs = []
+
+
+async def fake_run_agent(messages, *, stream=False, **kwargs):
+    agent_runs.append(messages)
+    usage = {"type": "usage", "prompt_tokens": 5, "completion_tokens": 5, "total_tokens": 10, "cost_usd": 0}
+    if not stream:
+        return {"message": "".join(ANSWER), "sources": ["query_profile"], "usage": usage}
+
+    async def events():
+        yield {"type": "status", "phase": "thinking", "subtitle": "Thinking..."}
+        for delta in ANSWER:
+            yield {"type": "delta", "delta": delta}
+        yield {"type": "sources", "tools": ["query_profile"]}
+        yield usage
+
+    return events()
+
+
+async def fake_get_or_create_visitor_profile(session_id, ip=None, fingerprint=None):
+    # A brand-new visitor, as the real lookup creates for an unseen session_id
+    return {"id": f"profile-{next(_ids)}", "type": "visitor", "status": "anonymous", "name": "Anonymous", "data": "{}"}
+
+
+async def fake_search_memory(query, profile_id, top_k=5):
+    return ""
+
+
+main.run_agent = fake_run_agent
+main.db.get_or_create_visitor_profile = fake_get_or_create_visitor_profile
+main.search_memory = fake_search_memory
+main._save_turn = lambda profile_id, messages, reply: None
+
+
+def _stream_text(response) -> str:
+    lines = [line for line in response.text.splitlines() if line.startswith("data: ")]
+    return "".join(json.loads(line[6:]).get("delta", "") for line in lines)
+
+
+def test_eligibility():
+    """Test 1: Eligibility"""
+    print("\n" + "="*80)
+    print("TEST 1: Eligibility")
+    print("="*80)
+
+    cache = ResponseCache(enabled=True)
+    first = [{"role": "user", "content": "who are you"}]
+    new_visitor = {"status": "anonymous", "name": "Anonymous", "data": "{}"}
+    checks = [
+        ("first question, no profile", cache.eligible("public", first, "", None) == "who are you"),
+        ("first question, new anonymous visitor", cache.eligible("public", first, "", new_visitor) == "who are you"),
+        ("private context", cache.eligible("private", first, "", None) is None),
+        ("second turn", cache.eligible("public", first + [
+            {"role": "assistant", "content": "bill"}, {"role": "user", "content": "cool"},
+        ], "", None) is None),
+        ("remembered memory", cache.eligible("public", first, "likes robots", None) is None),
+        ("named visitor", cache.eligible("public", first, "", {**new_visitor, "name": "Sarah"}) is None),
+        ("identified visitor", cache.eligible("public", first, "", {**new_visitor, "status": "identified"}) is None),
+        ("extracted data", not blank_profile({**new_visitor, "data": {"location": {"city": "Berlin"}}})),
+        ("empty sections", blank_profile({**new_visitor, "data": {"location": {}}})),
+    ]
+    for name, ok in checks:
+        print(f"{'✅' if ok else '❌'} {name}")
+    return all(ok for _, ok in checks)
+
+
+def test_session_visitor_hit():
+    """Test 2: Fresh anonymous visitors with a session_id share cached answers"""
+    print("\n" + "="*80)
+    print("TEST 2: Hit for a new visitor with a session_id")
+    print("="*80)
+
+    client = TestClient(main.app)
+    agent_runs.clear()
+    question = {"messages": [{"role": "user", "content": "what do you do"}], "context": "public"}
+    texts = []
+    for session in ("session-a", "session-b"):
+        response = client.post("/chat/stream", json={**question, "session_id": session})
+        texts.append(_stream_text(response))
+        print(f"{session}: {response.status_code} {texts[-1]!r}")
+    runs_stream = len(agent_runs)
+    response = client.post("/chat", json={**question, "session_id": "session-c"})
+    print(f"session-c (/chat): {response.status_code} {response.json().get('message')!r}")
+
+    ok = runs_stream == 1 and len(agent_runs) == 1 and texts == ["".join(ANSWER)] * 2
+    print(f"{'✅' if ok else '❌'} agent ran {len(agent_runs)} time(s) for 3 identical first questions")
+    return ok
+
+
+def test_profile_version_invalidation():
+    """Test 3: A profile snapshot change invalidates cached answers"""
+    print("\n" + "="*80)
+    print("TEST 3: Invalidation on profile change")
+    print("="*80)
+
+    client = TestClient(main.app)
+    agent_runs.clear()
+    question = {"messages": [{"role": "user", "content": "where are you based"}], "context": "public"}
+    client.post("/chat", json={**question, "session_id": "session-d"})
+    client.post("/chat", json={**question, "session_id": "session-e"})
+    before = len(agent_runs)
+    write_snapshot({"bio": "robotics founder in Sydney"}, SNAPSHOT_PATH)
+    client.post("/chat", json={**question, "session_id": "session-f"})
+    after = len(agent_runs)
+
+    ok = before == 1 and after == 2
+    print(f"{'✅' if ok else '❌'} agent runs: {before} before the profile change, {after} after")
+    return ok
+
+
+async def test_replay():
+    """Test 4: Replay"""
+    print("\n" + "="*80)
+    print("TEST 4: Replay")
+    print("="*80)
+
+    entry = CachedResponse(message="i build robots in melbourne, you?", sources=["query_profile"], profile_version=1, expires_at=0)
+    events = [e async for e in replay(entry, words_per_chunk=2, delay_ms=0)]
+    text = "".join(e["delta"] for e in events if e["type"] == "delta")
+    ok = (
+        events[0]["type"] == "status"
+        and events[-1] == {"type": "sources", "tools": ["query_profile"]}
+        and text == entry.message
+        and sum(e["type"] == "delta" for e in events) == 3
+    )
+    print(f"{'✅' if ok else '❌'} {len(events)} events, text {text!r}")
+    return ok
+
+
+async def main_tests():
+    results = {
+        "eligibility": test_eligibility(),
+        "session visitor hit": test_session_visitor_hit(),
+        "profile version invalidation": test_profile_version_invalidation(),
+        "replay": await test_replay(),
+    }
+    print("\n" + "="*80)
+    for name, ok in results.items():
+        print(f"{'✅ PASS' if ok else '❌ FAIL'}  {name}")
+    return all(results.values())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main_tests()) else 1)
@@ -5,17 +5,18 @@ from __future__ import annotations
 import hashlib
 import json
 import logging
-import time
 from typing import Any, Callable
 
 from agent.cache import get_profile_cache, get_search_cache
+from agent.skills import SKILLS, get_allowed_tools
+from agent.tracing import get_tracer
 from tools import profile as profile_tool
 from tools import web_search as web_search_tool
 from tools import schedule_meeting as schedule_meeting_tool
 from tools import send_email as send_email_tool
+from tools.profile_snapshot import get_profile_snapshot
 
 logger = logging.getLogger(__name__)
-perf_logger = logging.getLogger("agent.performance")
 
 # OpenAI-compatible tool definitions for the API (name, description, parameters).
 TOOLS_DEFINITIONS: list[dict[str, Any]] = [
@@ -144,6 +145,14 @@ TOOLS_DEFINITIONS: list[dict[str, Any]] = [
     },
 ]
 
+# Tools that act outside the conversation; never skipped, cut short, or written by a routing probe
+SIDE_EFFECT_TOOLS = frozenset({"schedule_meeting", "send_email"})
+
+# Tools that accept a timeout (seconds), so they can be held to the request deadline
+_TIMEOUT_LIMITS: dict[str, float] = {
+    "web_search": web_search_tool.WEB_SEARCH_TIMEOUT_SECONDS,
+}
+
 _TOOL_EXECUTORS: dict[str, Callable[..., str]] = {
     "query_profile": profile_tool.query_profile,
     "web_search": web_search_tool.web_search,
@@ -152,9 +161,33 @@ _TOOL_EXECUTORS: dict[str, Callable[..., str]] = {
 }
 
 
+def _filter_definitions(names: frozenset[str]) -> list[dict[str, Any]]:
+    """Return TOOLS_DEFINITIONS entries whose name is in names (all if empty)."""
+    if not names:
+        return list(TOOLS_DEFINITIONS)
+    return [
+        t for t in TOOLS_DEFINITIONS
+        if t.get("function", {}).get("name") in names
+    ]
+
+
+def _build_definitions_table() -> dict[frozenset[str], list[dict[str, Any]]]:
+    """Precompute the definitions for every skill's tool set and for all tools."""
+    return {
+        names: _filter_definitions(names)
+        for names in [frozenset()] + [frozenset(get_allowed_tools(s)) for s in SKILLS]
+    }
+
+
+# Keyed by allowed tool names (empty = all). Built at import; other subsets are added on first use.
+_DEFINITIONS_TABLE = _build_definitions_table()
+
+
 def get_tool_definitions(allowed_names: list[str] | None = None) -> list[dict[str, Any]]:
     """Return OpenAI tool definitions, optionally filtered by allowed names.
 
+    The returned list is shared between requests; callers must not mutate it.
+
     Args:
         allowed_names: If non-empty, only include tools whose name is in this list.
             If None or empty, return all tools.
@@ -162,13 +195,11 @@ def get_tool_definitions(allowed_names: list[str] | None = None) -> list[dict[st
     Returns:
         List of tool definition dicts for the API.
     """
-    if not allowed_names:
-        return list(TOOLS_DEFINITIONS)
-    names_set = set(allowed_names)
-    return [
-        t for t in TOOLS_DEFINITIONS
-        if t.get("function", {}).get("name") in names_set
-    ]
+    key = frozenset(allowed_names) if allowed_names else frozenset()
+    definitions = _DEFINITIONS_TABLE.get(key)
+    if definitions is None:
+        definitions = _DEFINITIONS_TABLE[key] = _filter_definitions(key)
+    return definitions
 
 
 def _cache_key(name: str, arguments: dict[str, Any]) -> str:
@@ -177,12 +208,14 @@ def _cache_key(name: str, arguments: dict[str, Any]) -> str:
     return hashlib.md5(f"{name}:{args_json}".encode()).hexdigest()
 
 
-def execute_tool(name: str, arguments: dict[str, Any]) -> str:
+def execute_tool(name: str, arguments: dict[str, Any], timeout: float | None = None) -> str:
     """Execute a tool by name with the given arguments (with caching).
 
     Args:
         name: Tool name (e.g. 'query_profile', 'web_search').
         arguments: JSON object of arguments (e.g. {'query': '...', 'scope': 'all'}).
+        timeout: Seconds left in the request; network tools wait at most this
+            long (not part of the cache key).
 
     Returns:
         Tool result as a string. On error, returns an error message string.
@@ -198,40 +231,46 @@ def execute_tool(name: str, arguments: dict[str, Any]) -> str:
     if name == "schedule_meeting" and "duration_minutes" not in arguments:
         arguments = {**arguments, "duration_minutes": 30}
     
-    # Check cache
-    cache_key = _cache_key(name, arguments)
-    if name == "query_profile":
-        cache = get_profile_cache()
-        ttl = 300  # 5 minutes for profile data
-        cached = cache.get(cache_key, ttl)
-        if cached is not None:
-            perf_logger.info(f"Tool {name} cache HIT")
-            return cached
-    elif name == "web_search":
-        cache = get_search_cache()
-        ttl = 60  # 1 minute for search results
-        cached = cache.get(cache_key, ttl)
-        if cached is not None:
-            perf_logger.info(f"Tool {name} cache HIT")
-            return cached
-    
-    # Execute tool
-    fn = _TOOL_EXECUTORS[name]
-    try:
-        tool_start = time.time()
-        result = fn(**arguments)
-        tool_time = time.time() - tool_start
-        perf_logger.info(f"Tool {name} executed in {tool_time:.3f}s")
-        
-        # Store in cache
-        if name == "query_profile":
-            get_profile_cache().set(cache_key, result, 300)
+    with get_tracer().span("tool.execute", tool=name) as span:
+        # Check cache
+        cache_key = _cache_key(name, arguments)
+        # A mapped profile snapshot is already pre-rendered, and caching it would delay version swaps
+        cache_profile = name == "query_profile" and get_profile_snapshot() is None
+        if cache_profile:
+            cache = get_profile_cache()
+            ttl = 300  # 5 minutes for profile data
+            cached = cache.get(cache_key, ttl)
+            if cached is not None:
+                span.set_attribute("cache_hit", True)
+                return cached
         elif name == "web_search":
-            get_search_cache().set(cache_key, result, 60)
-        
-        return result
-    except TypeError as e:
-        return f"Tool argument error: {e!s}"
-    except Exception as e:
-        logger.exception(f"Tool {name} execution error")
-        return f"Tool execution error: {e!s}"
+            cache = get_search_cache()
+            ttl = 60  # 1 minute for search results
+            cached = cache.get(cache_key, ttl)
+            if cached is not None:
+                span.set_attribute("cache_hit", True)
+                return cached
+        span.set_attribute("cache_hit", False)
+
+        # Execute tool
+        fn = _TOOL_EXECUTORS[name]
+        limit = _TIMEOUT_LIMITS.get(name)
+        if limit is not None and timeout is not None:
+            arguments = {**arguments, "timeout": min(limit, timeout)}
+        try:
+            result = fn(**arguments)
+
+            # Store in cache
+            if cache_profile:
+                get_profile_cache().set(cache_key, result, 300)
+            elif name == "web_search":
+                get_search_cache().set(cache_key, result, 60)
+
+            return result
+        except TypeError as e:
+            span.record_error(e)
+            return f"Tool argument error: {e!s}"
+        except Exception as e:
+            span.record_error(e)
+            logger.exception(f"Tool {name} execution error")
+            return f"Tool execution error: {e!s}"
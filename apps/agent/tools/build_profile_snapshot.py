@@ -0,0 +1,53 @@
+"""Build or inspect the owner profile snapshot (tools/profile_snapshot.py).
+
+The service builds it itself at startup and every PROFILE_SNAPSHOT_REBUILD_SECONDS;
+use this to build one by hand or check what workers will map. Loads .env from
+apps/agent.
+
+Usage:
+  python -m tools.build_profile_snapshot build
+  python -m tools.build_profile_snapshot build --output /run/bills-bio/profile.snap
+  python -m tools.build_profile_snapshot show
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from tools.profile_snapshot import ProfileSnapshot, build_snapshot
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or inspect the owner profile snapshot.")
+    parser.add_argument("command", choices=["build", "show"])
+    parser.add_argument("--output", default=None, help="Snapshot path (default PROFILE_SNAPSHOT_PATH)")
+    args = parser.parse_args()
+
+    env = Path(__file__).resolve().parent.parent / ".env"
+    if env.exists():
+        load_dotenv(env)
+    logging.basicConfig(level=logging.INFO)
+    output = args.output or os.environ.get("PROFILE_SNAPSHOT_PATH", "").strip()
+    if not output:
+        raise SystemExit("Set PROFILE_SNAPSHOT_PATH or pass --output")
+
+    if args.command == "build":
+        version = build_snapshot(output)
+        print(f"{output}: profile unchanged" if version is None else f"{output}: wrote v{version}")
+        return
+
+    snapshot = ProfileSnapshot(output)
+    built = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot.built_at))
+    print(f"{output}: v{snapshot.version}, built {built}, sha256 {snapshot.digest.hex()[:12]}")
+    for key in snapshot.keys():
+        print(f"  {key:<18} {len(snapshot.get(key) or '')} chars")
+
+
+if __name__ == "__main__":
+    main()
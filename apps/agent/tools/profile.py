@@ -7,6 +7,8 @@ import logging
 import os
 from pathlib import Path
 
+from tools.profile_snapshot import get_profile_snapshot
+
 logger = logging.getLogger(__name__)
 
 
@@ -15,8 +17,8 @@ def _data_dir() -> Path:
     return Path(__file__).resolve().parent.parent / "data"
 
 
-def _load_from_postgres() -> dict:
-    """Load profile from PostgreSQL database."""
+def _load_from_postgres(strict: bool = False) -> dict:
+    """Load profile from PostgreSQL database (strict: raise instead of falling back to JSON)."""
     try:
         import psycopg2
         database_url = os.environ.get("DATABASE_URL", "").strip()
@@ -80,28 +82,48 @@ def _load_from_postgres() -> dict:
         finally:
             conn.close()
     except ImportError:
+        if strict:
+            raise
         logger.warning("psycopg2 not installed; install with: pip install psycopg2-binary")
         return _load_from_json()
     except Exception as e:
+        if strict:
+            raise
         logger.warning(f"Failed to load from PostgreSQL: {e}, falling back to JSON")
         return _load_from_json()
 
 
-def _load_from_json() -> dict:
-    """Load profile from JSON file (fallback)."""
+def _load_from_json(strict: bool = False) -> dict:
+    """Load profile from JSON file (fallback; empty if missing unless strict)."""
     json_path = _data_dir() / "profile.json"
-    if not json_path.exists():
+    if not json_path.exists() and not strict:
         return {"profile": {}, "projects": [], "blogPosts": []}
     with open(json_path, encoding="utf-8") as f:
         return json.load(f)
 
 
-def _load_profile_data() -> dict:
-    """Load profile from PostgreSQL if DATABASE_URL is set, else from JSON."""
+def _load_profile_data(strict: bool = False) -> dict:
+    """Load profile from PostgreSQL if DATABASE_URL is set, else from JSON.
+
+    strict: raise instead of falling back (snapshot builds keep the current
+    snapshot rather than publish a fallback profile).
+    """
     database_url = os.environ.get("DATABASE_URL", "").strip()
     if database_url:
-        return _load_from_postgres()
-    return _load_from_json()
+        return _load_from_postgres(strict)
+    return _load_from_json(strict)
+
+
+SCOPES = ("bio", "interests", "projects", "blog", "all")
+
+# Queries mentioning any of these also get the owner's social handles (interests/all scopes)
+SOCIAL_KEYWORDS = ("social", "twitter", "linkedin", "github", "instagram", "follow", "connect", "reach")
+
+
+def wants_socials(query: str) -> bool:
+    """Whether query asks how to follow or reach Bill."""
+    query_lower = query.lower()
+    return any(keyword in query_lower for keyword in SOCIAL_KEYWORDS)
 
 
 def query_profile(query: str, scope: str = "all") -> str:
@@ -116,6 +138,13 @@ def query_profile(query: str, scope: str = "all") -> str:
     Returns:
         A text summary of the matching profile data for the LLM to cite.
     """
+    include_socials = wants_socials(query)
+    snapshot = get_profile_snapshot()
+    if snapshot is not None:
+        rendered = snapshot.get(scope, include_socials)
+        if rendered is not None:
+            return rendered
+
     ttl = int(os.environ.get("PROFILE_CACHE_TTL_SECONDS", "0") or "0")
     cache = None
     key = f"profile:{query}:{scope}"
@@ -125,14 +154,19 @@ def query_profile(query: str, scope: str = "all") -> str:
         cached = cache.get(key, float(ttl))
         if cached is not None:
             return cached
-    data = _load_profile_data()
-    query_lower = query.lower()
-    parts: list[str] = []
+    result = render_profile(_load_profile_data(), scope, include_socials)
+    if ttl > 0 and cache is not None:
+        cache.set(key, result, float(ttl))
+    return result
 
-    def _store_and_return(result: str) -> str:
-        if ttl > 0 and cache is not None:
-            cache.set(key, result, float(ttl))
-        return result
+
+def render_profile(data: dict, scope: str = "all", include_socials: bool = False) -> str:
+    """Render profile data for one scope as the text query_profile returns.
+
+    Depends on the query only through include_socials, so every answer can be
+    pre-rendered (tools/profile_snapshot.py).
+    """
+    parts: list[str] = []
 
     if scope in ("all", "bio"):
         profile = data.get("profile", {})
@@ -142,7 +176,7 @@ def query_profile(query: str, scope: str = "all") -> str:
                 f"Bio: {profile.get('bio', '')}"
             )
         if scope == "bio":
-            return _store_and_return("\n".join(parts) if parts else "No profile bio found.")
+            return "\n".join(parts) if parts else "No profile bio found."
 
     if scope in ("all", "interests"):
         profile = data.get("profile", {})
@@ -162,8 +196,7 @@ def query_profile(query: str, scope: str = "all") -> str:
                         parts.append(f"- {name}: {favorite}")
         
         # Add socials when asked about connecting/social media/follow
-        query_keywords_social = ["social", "twitter", "linkedin", "github", "instagram", "follow", "connect", "reach"]
-        if any(keyword in query_lower for keyword in query_keywords_social):
+        if include_socials:
             socials = profile.get("socials", {})
             if socials:
                 social_list = []
@@ -179,7 +212,7 @@ def query_profile(query: str, scope: str = "all") -> str:
                     parts.append("\nSocial Media:\n" + "\n".join(f"- {s}" for s in social_list))
         
         if scope == "interests":
-            return _store_and_return("\n".join(parts) if parts else "No interests listed.")
+            return "\n".join(parts) if parts else "No interests listed."
 
     if scope in ("all", "projects"):
         projects = data.get("projects", [])
@@ -192,7 +225,7 @@ def query_profile(query: str, scope: str = "all") -> str:
                 )
             parts.append("Projects / Ventures:\n" + "\n".join(proj_lines))
         if scope == "projects":
-            return _store_and_return("\n".join(parts) if parts else "No projects listed.")
+            return "\n".join(parts) if parts else "No projects listed."
 
     if scope in ("all", "blog"):
         posts = data.get("blogPosts", [])
@@ -205,6 +238,6 @@ def query_profile(query: str, scope: str = "all") -> str:
                 )
             parts.append("Blog posts:\n" + "\n".join(post_lines))
         if scope == "blog":
-            return _store_and_return("\n".join(parts) if parts else "No blog posts found.")
+            return "\n".join(parts) if parts else "No blog posts found."
 
-    return _store_and_return("\n\n".join(parts) if parts else "No matching profile data found.")
+    return "\n\n".join(parts) if parts else "No matching profile data found."
@@ -0,0 +1,244 @@
+"""Versioned binary snapshot of the owner profile, shared by workers through mmap.
+
+Without a snapshot every worker loads the owner profile itself (tools/profile.py,
+one database round-trip per uncached query_profile call) and renders it again.
+With PROFILE_SNAPSHOT_PATH set, a build step renders every query_profile answer
+once (each scope, with and without socials) into one file; workers map it
+read-only, so the pages are shared across processes and a cold worker answers
+without touching the database.
+
+Layout (little-endian):
+- header: magic, format version, snapshot version (u64), sha256 of the entries,
+  build time (unix seconds), entry count
+- entry table: 32-byte key, offset, length (u32 each)
+- UTF-8 payloads
+
+Builds write a temporary file and os.replace it over the old one, so readers see
+either the old or the new snapshot. Every worker rebuilds, so a build holds an
+flock on a sidecar lock file from loading the profile through the replace: two
+builders never write the same version with different content, and the last
+one to write also read the latest profile. A build whose profile load fails
+(e.g. a database error) raises and leaves the current snapshot in place. Workers stat the path at most every
+PROFILE_SNAPSHOT_CHECK_SECONDS and swap to a new mapping when it changed; the
+old mapping is released when no reader holds it. The version only increases when
+the rendered content changes, so it also identifies the owner profile revision.
+
+The service builds the snapshot itself: main.py calls build_snapshot at
+startup and every PROFILE_SNAPSHOT_REBUILD_SECONDS, so owner profile edits (saved
+by the web app) reach the snapshot and the response cache within that interval.
+A rebuild with unchanged content writes nothing. Build or inspect it by hand
+with python -m tools.build_profile_snapshot build|show.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SNAPSHOT_PATH = os.environ.get("PROFILE_SNAPSHOT_PATH", "").strip()
+PROFILE_SNAPSHOT_CHECK_SECONDS = float(os.environ.get("PROFILE_SNAPSHOT_CHECK_SECONDS", "1"))
+# Reload the owner profile and rebuild the snapshot this often (0 = at startup only)
+PROFILE_SNAPSHOT_REBUILD_SECONDS = float(os.environ.get("PROFILE_SNAPSHOT_REBUILD_SECONDS", "300"))
+
+_MAGIC = b"BBPS"
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sIQ32sdI")
+_ENTRY = struct.Struct("<32sII")
+_SOCIALS_SUFFIX = "+socials"
+# Rendered answer for scopes query_profile doesn't know
+_OTHER_KEY = "_"
+
+
+def _key(scope: str, include_socials: bool) -> str:
+    return scope + _SOCIALS_SUFFIX if include_socials else scope
+
+
+def render_entries(data: dict) -> dict[str, str]:
+    """Every query_profile answer for profile data, keyed by scope (+socials)."""
+    from tools.profile import SCOPES, render_profile
+
+    entries = {_OTHER_KEY: render_profile(data, _OTHER_KEY)}
+    for scope in SCOPES:
+        for include_socials in (False, True):
+            entries[_key(scope, include_socials)] = render_profile(data, scope, include_socials)
+    return entries
+
+
+def _digest(entries: dict[str, str]) -> bytes:
+    h = hashlib.sha256()
+    for key in sorted(entries):
+        h.update(key.encode() + b"\0" + entries[key].encode() + b"\0")
+    return h.digest()
+
+
+class ProfileSnapshot:
+    """One mapped snapshot file (read-only)."""
+
+    def __init__(self, path: str | Path) -> None:
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, self.version, self.digest, self.built_at, count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC or fmt != _FORMAT_VERSION:
+            raise ValueError(f"{path} is not a profile snapshot (format {_FORMAT_VERSION})")
+        self._entries: dict[str, tuple[int, int]] = {}
+        for i in range(count):
+            key, offset, length = _ENTRY.unpack_from(self._mmap, _HEADER.size + i * _ENTRY.size)
+            if offset + length > len(self._mmap):
+                raise ValueError(f"{path} is truncated")
+            self._entries[key.rstrip(b"\0").decode()] = (offset, length)
+
+    def get(self, scope: str, include_socials: bool = False) -> str | None:
+        """Pre-rendered query_profile answer (None if the snapshot has no entries)."""
+        entry = self._entries.get(_key(scope, include_socials)) or self._entries.get(_OTHER_KEY)
+        if entry is None:
+            return None
+        offset, length = entry
+        return self._mmap[offset:offset + length].decode()
+
+    def keys(self) -> list[str]:
+        return list(self._entries)
+
+
+@contextmanager
+def _build_lock(path: Path) -> Iterator[None]:
+    """Exclusive lock for building the snapshot at path, across processes.
+
+    A sidecar file carries the lock, since the snapshot itself is replaced.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(f".{path.name}.lock"), "a") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+def write_snapshot(entries: dict[str, str], path: str | Path) -> int | None:
+    """Atomically write entries as a new snapshot version; None if content is unchanged."""
+    path = Path(path)
+    with _build_lock(path):
+        return _write_locked(entries, path)
+
+
+def _write_locked(entries: dict[str, str], path: Path) -> int | None:
+    digest = _digest(entries)
+    version = 1
+    try:
+        current = ProfileSnapshot(path)
+        if current.digest == digest:
+            return None
+        version = current.version + 1
+    except FileNotFoundError:
+        pass
+    except (ValueError, struct.error) as e:
+        logger.warning("Replacing unreadable profile snapshot: %s", e)
+
+    payloads = [(key.encode(), text.encode()) for key, text in sorted(entries.items())]
+    offset = _HEADER.size + len(payloads) * _ENTRY.size
+    table, blobs = [], []
+    for key, blob in payloads:
+        if len(key) > 32:
+            raise ValueError(f"Snapshot key too long: {key!r}")
+        table.append(_ENTRY.pack(key, offset, len(blob)))
+        blobs.append(blob)
+        offset += len(blob)
+    header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, version, digest, time.time(), len(payloads))
+
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(header + b"".join(table) + b"".join(blobs))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return version
+
+
+class SnapshotReader:
+    """Current snapshot at a path, swapped when the file is replaced. Thread-safe."""
+
+    def __init__(self, path: str | Path, check_seconds: float = PROFILE_SNAPSHOT_CHECK_SECONDS) -> None:
+        self.path = Path(path)
+        self._check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._snapshot: ProfileSnapshot | None = None
+        self._checked_at = 0.0
+
+    def current(self) -> ProfileSnapshot | None:
+        now = time.monotonic()
+        if now - self._checked_at < self._check_seconds:
+            return self._snapshot
+        with self._lock:
+            if now - self._checked_at >= self._check_seconds:
+                self._checked_at = now
+                self._reload()
+        return self._snapshot
+
+    def _reload(self) -> None:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            if self._snapshot is not None:
+                logger.warning("Profile snapshot %s removed; loading the profile directly", self.path)
+            self._snapshot = None
+            return
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if self._snapshot is not None and self._snapshot.identity == identity:
+            return
+        try:
+            snapshot = ProfileSnapshot(self.path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning("Profile snapshot %s unreadable; keeping the current one: %s", self.path, e)
+            return
+        # Readers holding the old snapshot keep it mapped until they're done
+        self._snapshot = snapshot
+        logger.info("Profile snapshot v%d mapped from %s", snapshot.version, self.path)
+
+
+_reader: SnapshotReader | None = None
+
+
+def get_profile_snapshot() -> ProfileSnapshot | None:
+    """Current owner profile snapshot, or None when PROFILE_SNAPSHOT_PATH is unset or missing."""
+    global _reader
+    if not PROFILE_SNAPSHOT_PATH:
+        return None
+    if _reader is None:
+        _reader = SnapshotReader(PROFILE_SNAPSHOT_PATH)
+    return _reader.current()
+
+
+def profile_version() -> int | None:
+    """Version of the mapped owner profile snapshot (None without one)."""
+    snapshot = get_profile_snapshot()
+    return snapshot.version if snapshot is not None else None
+
+
+def build_snapshot(path: str | Path | None = None) -> int | None:
+    """Load the owner profile (as query_profile does) and write it to path; None if unchanged.
+
+    Raises if the profile can't be loaded (no fallback profile); the current
+    snapshot is kept.
+    """
+    from tools.profile import _load_profile_data
+
+    path = path or PROFILE_SNAPSHOT_PATH
+    if not path:
+        raise ValueError("No snapshot path: set PROFILE_SNAPSHOT_PATH")
+    path = Path(path)
+    with _build_lock(path):
+        return _write_locked(render_entries(_load_profile_data(strict=True)), path)
+
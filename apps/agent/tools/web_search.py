@@ -7,13 +7,16 @@ from typing import Any
 
 import httpx
 
+WEB_SEARCH_TIMEOUT_SECONDS = 15.0
 
-def web_search(query: str, num_results: int = 5) -> str:
+
+def web_search(query: str, num_results: int = 5, timeout: float = WEB_SEARCH_TIMEOUT_SECONDS) -> str:
     """Search the web and return titles, snippets, and URLs.
 
     Args:
         query: Search query string.
         num_results: Maximum number of results to return (default 5).
+        timeout: HTTP timeout in seconds (lowered to fit the request deadline).
 
     Returns:
         A text block of search results (title, snippet, url per result)
@@ -34,12 +37,12 @@ def web_search(query: str, num_results: int = 5) -> str:
     if not api_key:
         return "Error: SERPER_API_KEY is not set. Web search is unavailable."
 
-    url = "https://google.serper.dev/search"
+    url = os.environ.get("SERPER_API_URL", "https://google.serper.dev/search")
     payload: dict[str, Any] = {"q": query, "num": min(num_results, 10)}
     headers = {"X-API-KEY": api_key, "Content-Type": "application/json"}
 
     try:
-        with httpx.Client(timeout=15.0) as client:
+        with httpx.Client(timeout=timeout) as client:
             response = client.post(url, json=payload, headers=headers)
             response.raise_for_status()
             data = response.json()
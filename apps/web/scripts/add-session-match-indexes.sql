@@ -0,0 +1,40 @@
+-- Visitor matching indexes for sessions (agent: get_or_create_visitor_profile,
+-- duplicate detection, IP lookups).
+--
+-- The matching path filters sessions by fingerprint or IP and takes the most
+-- recent row. Expression indexes on data->>'fingerprint' can't serve that as an
+-- index-only scan (the planner needs the whole data column), so ip and
+-- fingerprint are promoted to generated columns; data stays the source of truth
+-- and the web app keeps writing it unchanged. Empty strings become NULL so the
+-- default '' values stay out of the (partial) indexes.
+--
+-- Adding STORED generated columns rewrites sessions under an exclusive lock:
+-- run off-peak. CONCURRENTLY/VACUUM can't run in a transaction, so use psql:
+--   psql "$DATABASE_URL" -f scripts/add-session-match-indexes.sql
+-- Verify plans: python apps/agent/eval/explain_session_matching.py --help
+
+ALTER TABLE sessions
+  ADD COLUMN IF NOT EXISTS ip TEXT
+    GENERATED ALWAYS AS (NULLIF(data->>'ip', '')) STORED,
+  ADD COLUMN IF NOT EXISTS fingerprint TEXT
+    GENERATED ALWAYS AS (NULLIF(data->>'fingerprint', '')) STORED;
+
+-- Latest session per fingerprint / IP, covering profile_id (index-only)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sessions_fingerprint_last_seen
+  ON sessions (fingerprint, last_seen DESC) INCLUDE (profile_id)
+  WHERE fingerprint IS NOT NULL;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sessions_ip_last_seen
+  ON sessions (ip, last_seen DESC) INCLUDE (profile_id)
+  WHERE ip IS NOT NULL;
+
+-- A profile's fingerprints (duplicate detection), index-only
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sessions_profile_fingerprint
+  ON sessions (profile_id, fingerprint)
+  WHERE fingerprint IS NOT NULL;
+
+-- Superseded by the composite indexes above
+DROP INDEX CONCURRENTLY IF EXISTS idx_sessions_fingerprint;
+DROP INDEX CONCURRENTLY IF EXISTS idx_sessions_ip;
+
+-- Set the visibility map so index-only scans skip the heap
+VACUUM (ANALYZE) sessions;
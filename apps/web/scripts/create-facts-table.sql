@@ -0,0 +1,21 @@
+-- Facts about profiles, searched by the agent (PostgresDB.search_facts_many).
+-- tsv is generated from content and GIN-indexed for websearch_to_tsquery +
+-- ts_rank_cd; embedding (optional, any fixed dimension) enables hybrid ranking,
+-- done in the agent over a bounded candidate set, so pgvector isn't required.
+-- Idempotent: also upgrades an existing facts table.
+--   psql "$DATABASE_URL" -f scripts/create-facts-table.sql
+
+CREATE TABLE IF NOT EXISTS facts (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  profile_id UUID REFERENCES profiles(id) ON DELETE CASCADE,
+  content TEXT NOT NULL,
+  data JSONB NOT NULL DEFAULT '{}'::jsonb,
+  tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', content)) STORED,
+  embedding REAL[],
+  created_at TIMESTAMP DEFAULT NOW()
+);
+
+ALTER TABLE facts ADD COLUMN IF NOT EXISTS embedding REAL[];
+
+CREATE INDEX IF NOT EXISTS idx_facts_tsv ON facts USING GIN (tsv);
+CREATE INDEX IF NOT EXISTS idx_facts_profile_created ON facts (profile_id, created_at DESC);
@@ -0,0 +1,9 @@
+-- Shared token buckets for the agent's rate limiter (RATE_LIMIT_BACKEND=postgres).
+-- UNLOGGED: limiter state is disposable, so skip WAL on this hot, update-heavy table.
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+  key TEXT PRIMARY KEY,                 -- "<context>:<client_id>"
+  tokens DOUBLE PRECISION NOT NULL,     -- level at updated_at (negative = debt)
+  capacity DOUBLE PRECISION NOT NULL,   -- requests per window
+  refill_per_sec DOUBLE PRECISION NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
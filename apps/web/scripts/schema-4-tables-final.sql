@@ -57,6 +57,10 @@ CREATE TABLE sessions (
     "interactions": []
   }'::jsonb,
   
+  -- Matching keys promoted from data for index-only lookups ('' -> NULL)
+  ip TEXT GENERATED ALWAYS AS (NULLIF(data->>'ip', '')) STORED,
+  fingerprint TEXT GENERATED ALWAYS AS (NULLIF(data->>'fingerprint', '')) STORED,
+  
   created_at TIMESTAMP DEFAULT NOW(),
   last_seen TIMESTAMP DEFAULT NOW()
 );
@@ -64,8 +68,12 @@ CREATE TABLE sessions (
 -- Indexes
 CREATE INDEX idx_sessions_session_id ON sessions(session_id);
 CREATE INDEX idx_sessions_profile_id ON sessions(profile_id);
-CREATE INDEX idx_sessions_ip ON sessions ((data->>'ip'));
-CREATE INDEX idx_sessions_fingerprint ON sessions ((data->>'fingerprint'));
+CREATE INDEX idx_sessions_fingerprint_last_seen ON sessions (fingerprint, last_seen DESC)
+  INCLUDE (profile_id) WHERE fingerprint IS NOT NULL;
+CREATE INDEX idx_sessions_ip_last_seen ON sessions (ip, last_seen DESC)
+  INCLUDE (profile_id) WHERE ip IS NOT NULL;
+CREATE INDEX idx_sessions_profile_fingerprint ON sessions (profile_id, fingerprint)
+  WHERE fingerprint IS NOT NULL;
 CREATE INDEX idx_sessions_last_seen ON sessions(last_seen DESC);
 
 -- ============================================================================